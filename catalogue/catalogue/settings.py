@@ -44,6 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'playlist.metrics.PerformanceMiddleware',
+    'playlist.compression.CompressionMiddleware',
+    'playlist.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,9 +88,67 @@ DATABASES = {
         'PASSWORD': 'Dev@123',
         'HOST': 'localhost',
         'PORT': 5432,
+        # Connections are kept open between requests and checked before reuse,
+        # instead of opening a new one for every request.
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+DATABASE_ROUTERS = ['playlist.routers.ReplicaRouter']
+
+# Aliases in DATABASES that serve reads for GET requests. Each is a copy of
+# 'default' pointing at a replica. To try the routing locally, SQLite aliases
+# sharing one file can stand in for the primary and its replicas:
+#
+#   DATABASES = {
+#       'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.sqlite3'},
+#       'replica1': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.sqlite3',
+#                    'TEST': {'MIRROR': 'default'}},
+#   }
+#   PLAYLIST_READ_REPLICAS = ['replica1']
+PLAYLIST_READ_REPLICAS = []
+
+# After a write, the client reads from the primary for this many seconds so it
+# sees its own changes while the replicas catch up.
+PLAYLIST_REPLICA_STICKY_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Cache alias and timeout (seconds) for serialized playlist payloads.
+PLAYLIST_CACHE_ALIAS = 'default'
+PLAYLIST_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Fraction of requests timed by playlist.metrics.PerformanceMiddleware, between
+# 0 and 1. Remove the middleware from MIDDLEWARE to turn instrumentation off.
+PLAYLIST_METRICS_SAMPLE_RATE = 0.1
+
+# Client addresses (REMOTE_ADDR) allowed to read /metrics; every other client
+# gets a 403. Behind a proxy, list the scraper's address as the proxy sees it.
+PLAYLIST_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Responses smaller than this many bytes are not compressed by
+# playlist.compression.CompressionMiddleware.
+PLAYLIST_COMPRESS_MIN_SIZE = 1024
+
+# /api/changes/ only serves change log entries at least this many seconds old,
+# so entries of transactions still in flight cannot be skipped. Must exceed the
+# longest write transaction.
+PLAYLIST_CHANGES_SETTLE_SECONDS = 5
+
+# A background job worker holds its claim on a job for this many seconds and
+# renews it after every step; a job whose claim lapses is taken over by another
+# worker. Must exceed the longest step of a job.
+PLAYLIST_JOB_LEASE_SECONDS = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -129,3 +190,18 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'playlist.pagination.PrimaryKeyCursorPagination',
+    'PAGE_SIZE': 100,
+    'DEFAULT_RENDERER_CLASSES': [
+        'playlist.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'playlist.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'playlist.renderers.PlaylistContentNegotiation',
+}
@@ -1,38 +1,289 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.forms.models import BaseInlineFormSet
+from django.utils import timezone
+from django.utils.functional import cached_property
 
-from .models import Artist, Album, Track, Playlist, PlaylistTrack
+from .jobs import enqueue
+from .models import (
+    Artist,
+    Album,
+    Job,
+    Track,
+    Playlist,
+    PlaylistRevision,
+    PlaylistTrack,
+)
+from .search import SEARCH_MAX_LIMIT, search
+
+# Below this many rows an exact COUNT(*) is cheap enough to run.
+ESTIMATED_COUNT_MIN_ROWS = 100_000
+
+
+# Counts unfiltered PostgreSQL tables from the planner's row estimate instead of
+# a COUNT(*), which reads the whole table. The estimate is refreshed by
+# autovacuum, so the page count may be slightly off; filtered and small tables,
+# and other databases, are counted exactly.
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                estimate = cursor.fetchone()[0]
+            if estimate >= ESTIMATED_COUNT_MIN_ROWS:
+                return estimate
+        return super().count
+
+
+# Settings shared by the admins of the large tables: estimated page counts, no
+# second COUNT(*) for the unfiltered total, and no filter sidebars listing every
+# related object.
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Pages are read newest first along the primary key. A model ordering such as
+    # PlaylistTrack's "order" would sort the whole table.
+    ordering = ("-pk",)
+
+    # Actions whose work is too large for a request queue background jobs, see
+    # playlist/jobs.py, and link to their progress.
+    def queue_jobs(self, request, kind, arguments):
+        for kwargs in arguments:
+            enqueue(kind, **kwargs)
+        self.message_user(
+            request,
+            f"Queued {len(arguments)} {kind.replace('_', ' ')} jobs; see Jobs for "
+            "their progress.",
+            messages.SUCCESS,
+        )
+
+    # The collector behind the default delete action loads every related row in
+    # the request; admins of large trees delete in the background instead.
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if any(name.startswith("delete_in_background") for name in self.actions or ()):
+            actions.pop("delete_selected", None)
+        return actions
+
+
+# Searches with the catalogue search indexes instead of an icontains scan over
+# search_fields. Used by the changelist search box and by the autocomplete
+# widgets of other admins; returns the SEARCH_MAX_LIMIT best matches.
+class CatalogueSearchAdmin(LargeTableAdmin):
+    search_kind = None
+    actions = ["delete_in_background"]
+
+    @admin.action(description="Delete selected in the background")
+    def delete_in_background(self, request, queryset):
+        self.queue_jobs(
+            request,
+            "delete_catalogue_object",
+            [
+                {"model": self.search_kind, "pk": pk}
+                for pk in queryset.values_list("pk", flat=True)
+            ],
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        ids = [
+            obj.pk
+            for obj in search(
+                self.search_kind,
+                search_term,
+                SEARCH_MAX_LIMIT,
+                queryset.select_related(None).only("pk"),
+            )
+        ]
+        return queryset.filter(pk__in=ids), False
 
 
 @admin.register(Artist)
-class ArtistAdmin(admin.ModelAdmin):
+class ArtistAdmin(CatalogueSearchAdmin):
     list_display = ("name",)
+    search_fields = ("name",)
+    search_kind = "artist"
 
 
+# The albums of one artist are still reachable with ?artist__id__exact=<id>.
 @admin.register(Album)
-class AlbumAdmin(admin.ModelAdmin):
+class AlbumAdmin(CatalogueSearchAdmin):
     list_display = ("title", "artist")
-    list_filter = ("artist",)
+    list_select_related = ("artist",)
+    autocomplete_fields = ("artist",)
+    search_fields = ("title",)
+    search_kind = "album"
 
 
 @admin.register(Track)
-class TrackAdmin(admin.ModelAdmin):
+class TrackAdmin(CatalogueSearchAdmin):
     list_display = ("title", "album")
-    list_filter = ("album",)
+    list_select_related = ("album",)
+    autocomplete_fields = ("album",)
+    search_fields = ("title",)
+    search_kind = "track"
+
+
+# Shows one page of the playlist's tracks; the page is taken from the change
+# page's query string, which the change form posts back to.
+class PagedInlineFormSet(BaseInlineFormSet):
+    page_param = "tracks_page"
+    per_page = 50
+    page_number = 1
+
+    def get_queryset(self):
+        if not hasattr(self, "_queryset"):
+            queryset = super().get_queryset()
+            paginator = Paginator(queryset.values_list("pk", flat=True), self.per_page)
+            self.page = paginator.get_page(self.page_number)
+            self._queryset = queryset.filter(pk__in=list(self.page))
+        return self._queryset
 
 
 # admin.TabularInline specifies that the forms should be displayed in a tabular (table) format.
 class PlaylistTrackInline(admin.TabularInline):
     model = PlaylistTrack
     extra = 1
+    autocomplete_fields = ("track",)
+    formset = PagedInlineFormSet
+    template = "admin/playlist/paged_tabular.html"
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.page_number = request.GET.get(formset.page_param, 1)
+        return formset
 
 
 # Specifies the number of empty forms to display by default. Setting extra = 1 means that one empty form will be shown
 @admin.register(PlaylistTrack)
-class PlaylistTrackAdmin(admin.ModelAdmin):
+class PlaylistTrackAdmin(LargeTableAdmin):
     list_display = ("playlist", "track", "order")
+    list_select_related = ("playlist", "track")
+    autocomplete_fields = ("playlist", "track")
 
 
 @admin.register(Playlist)
-class PlaylistAdmin(admin.ModelAdmin):
-    list_display = ("name", "uuid")
+class PlaylistAdmin(LargeTableAdmin):
+    list_display = ("name", "uuid", "track_count", "artist_count", "last_modified")
+    search_fields = ("name",)
     inlines = [PlaylistTrackInline]
+    actions = [
+        "delete_in_background",
+        "clone_playlists",
+        "merge_playlists",
+        "dedupe_playlists",
+    ]
+
+    @admin.action(description="Delete selected in the background")
+    def delete_in_background(self, request, queryset):
+        self.queue_jobs(
+            request,
+            "delete_playlist",
+            [{"uuid": str(pk)} for pk in queryset.values_list("pk", flat=True)],
+        )
+
+    # See playlist/setops.py.
+    @admin.action(description="Clone selected playlists")
+    def clone_playlists(self, request, queryset):
+        self.queue_jobs(
+            request,
+            "clone_playlist",
+            [{"uuid": str(pk)} for pk in queryset.values_list("pk", flat=True)],
+        )
+
+    # Into a new playlist, in name order, each track once.
+    @admin.action(description="Merge selected playlists into a new playlist")
+    def merge_playlists(self, request, queryset):
+        pks = [
+            str(pk)
+            for pk in queryset.order_by("name", "pk").values_list("pk", flat=True)
+        ]
+        self.queue_jobs(
+            request,
+            "combine_playlists",
+            [{"operation": "union", "uuid": pks[0], "others": pks[1:]}],
+        )
+
+    @admin.action(description="Remove repeated tracks from selected playlists")
+    def dedupe_playlists(self, request, queryset):
+        self.queue_jobs(
+            request,
+            "dedupe_playlist",
+            [{"uuid": str(pk)} for pk in queryset.values_list("pk", flat=True)],
+        )
+
+
+# Revision history, read-only. The revisions of one playlist are listed with
+# ?playlist__uuid__exact=<uuid>; the action writes a selected version back.
+@admin.register(PlaylistRevision)
+class PlaylistRevisionAdmin(LargeTableAdmin):
+    list_display = ("playlist", "number", "is_checkpoint", "track_count", "created")
+    list_select_related = ("playlist",)
+    exclude = ("data",)
+    readonly_fields = ("playlist", "number", "base", "track_count", "created")
+    actions = ["restore_revisions"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(boolean=True, description="Checkpoint")
+    def is_checkpoint(self, obj):
+        return obj.is_checkpoint
+
+    # One restore per playlist: the newest selected revision of each.
+    @admin.action(description="Restore selected revisions")
+    def restore_revisions(self, request, queryset):
+        latest = {}
+        for playlist_id, number in queryset.order_by("number").values_list(
+            "playlist_id", "number"
+        ):
+            latest[playlist_id] = number
+        self.queue_jobs(
+            request,
+            "restore_revision",
+            [
+                {"uuid": str(playlist_id), "number": number}
+                for playlist_id, number in latest.items()
+            ],
+        )
+
+
+# Queue of background jobs, read-only; failed jobs can be queued again.
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = (
+        "id",
+        "kind",
+        "status",
+        "progress",
+        "total",
+        "attempts",
+        "created",
+        "finished",
+    )
+    list_filter = ("status", "kind")
+    actions = ["retry_jobs"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Retry selected failed jobs")
+    def retry_jobs(self, request, queryset):
+        retried = queryset.filter(status=Job.FAILED).update(
+            status=Job.QUEUED, attempts=0, run_after=timezone.now(), finished=None
+        )
+        self.message_user(request, f"Queued {retried} jobs again.", messages.SUCCESS)
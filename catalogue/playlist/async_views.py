@@ -0,0 +1,111 @@
+from functools import partial
+
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor
+from rest_framework.request import Request
+
+from .cache import LIST_SCOPE, acached_response
+from .pagination import PrimaryKeyCursorPagination
+from .views import AlbumViewSet, ArtistViewSet, PlaylistViewSet, TrackViewSet
+
+# Async versions of the read endpoints, for deployments served through
+# catalogue/asgi.py. A sync view holds a worker thread for the whole request,
+# slow clients included; these wait on the database through the async ORM
+# instead, so one ASGI worker can keep many requests in flight. They reuse the
+# viewsets' query plans and serializers and return the same payloads.
+#
+# Django runs async ORM calls on the request's database thread one after the
+# other, so each view makes a single call: the playlist queries are fetched
+# together through prefetch_related rather than gathered separately.
+
+
+def not_found(detail):
+    return JsonResponse({"detail": detail}, status=404)
+
+
+# Returns the viewset's queryset for this request and a serializer context.
+def read_plan(viewset_class, request):
+    request = Request(request)
+    viewset = viewset_class(request=request, format_kwarg=None)
+    return viewset.get_queryset(), {"request": request}
+
+
+async def retrieve(viewset_class, request, pk):
+    queryset, context = read_plan(viewset_class, request)
+    obj = await queryset.filter(pk=pk).afirst()
+    if obj is None:
+        return not_found(
+            f"No {queryset.model._meta.object_name} matches the given query."
+        )
+    return JsonResponse(viewset_class.serializer_class(obj, context=context).data)
+
+
+@require_GET
+async def artist_detail(request, pk):
+    return await retrieve(ArtistViewSet, request, pk)
+
+
+@require_GET
+async def album_detail(request, pk):
+    return await retrieve(AlbumViewSet, request, pk)
+
+
+@require_GET
+async def track_detail(request, pk):
+    return await retrieve(TrackViewSet, request, pk)
+
+
+@require_GET
+async def playlist_detail(request, pk):
+    view = partial(retrieve, PlaylistViewSet, request, pk)
+    return await acached_response(request, str(pk), view)
+
+
+@require_GET
+async def playlist_list(request):
+    return await acached_response(request, LIST_SCOPE, partial(playlist_page, request))
+
+
+# One page of PrimaryKeyCursorPagination, with the same cursors and links as
+# /api/playlists/: a cursor holds the pk the page starts after, or before when
+# it points backwards.
+async def playlist_page(request):
+    queryset, context = read_plan(PlaylistViewSet, request)
+    paginator = PrimaryKeyCursorPagination()
+    paginator.base_url = request.build_absolute_uri()
+    page_size = paginator.get_page_size(context["request"])
+    try:
+        cursor = paginator.decode_cursor(context["request"])
+    except NotFound as e:
+        return not_found(str(e.detail))
+
+    if cursor is None:
+        queryset = queryset.order_by("pk")
+    elif cursor.reverse:
+        queryset = queryset.filter(pk__lt=cursor.position).order_by("-pk")
+    else:
+        queryset = queryset.filter(pk__gt=cursor.position).order_by("pk")
+    page = [playlist async for playlist in queryset[: page_size + 1]]
+    has_more = len(page) > page_size
+    page = page[:page_size]
+    if cursor is not None and cursor.reverse:
+        page.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, cursor is not None
+
+    def link(reverse, playlist):
+        return paginator.encode_cursor(
+            Cursor(offset=0, reverse=reverse, position=str(playlist.pk))
+        )
+
+    serializer = PlaylistViewSet.serializer_class(page, many=True, context=context)
+    return JsonResponse(
+        {
+            "next": link(False, page[-1]) if has_next and page else None,
+            "previous": link(True, page[0]) if has_previous and page else None,
+            "results": serializer.data,
+        }
+    )
@@ -0,0 +1,23 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Number of rows sent to the database per bulk INSERT/UPDATE statement.
+BULK_BATCH_SIZE = 1000
+
+_muted = ContextVar("playlist_track_signals_muted", default=False)
+
+
+# Bulk write paths delete PlaylistTrack rows through the ORM, which sends one
+# post_delete per row. Inside this block the PlaylistTrack receivers skip those
+# rows, and the caller updates caches and summaries once for the whole batch.
+@contextmanager
+def muted_signals():
+    token = _muted.set(True)
+    try:
+        yield
+    finally:
+        _muted.reset(token)
+
+
+def signals_muted():
+    return _muted.get()
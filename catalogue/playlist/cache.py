@@ -0,0 +1,133 @@
+import hashlib
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.http import HttpResponse
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .routers import primary_reads
+
+# Serialized playlist payloads are cached under a version that changes on every
+# write to the playlist, so stale entries are never read again and simply expire.
+# The version is the time of the last write in nanoseconds, which also gives the
+# Last-Modified header.
+
+LIST_SCOPE = "list"
+
+# Bumped on any artist, album or track change; versions cached search results.
+CATALOGUE_SCOPE = "catalogue"
+
+
+def get_cache():
+    return caches[settings.PLAYLIST_CACHE_ALIAS]
+
+
+def version_key(scope):
+    return f"playlist:{scope}:version"
+
+
+def get_version(scope):
+    cache = get_cache()
+    version = cache.get(version_key(scope))
+    if version is None:
+        cache.add(version_key(scope), time.time_ns(), settings.PLAYLIST_CACHE_TIMEOUT)
+        version = cache.get(version_key(scope))
+    return version
+
+
+async def aget_version(scope):
+    cache = get_cache()
+    version = await cache.aget(version_key(scope))
+    if version is None:
+        await cache.aadd(
+            version_key(scope), time.time_ns(), settings.PLAYLIST_CACHE_TIMEOUT
+        )
+        version = await cache.aget(version_key(scope))
+    return version
+
+
+def bump_version(scope):
+    get_cache().set(version_key(scope), time.time_ns(), settings.PLAYLIST_CACHE_TIMEOUT)
+
+
+# The version is bumped right away and again once the transaction commits, so a
+# read that runs before the commit cannot keep the old rows cached under the
+# new version.
+def invalidate(scope):
+    bump_version(scope)
+    transaction.on_commit(partial(bump_version, scope))
+
+
+def invalidate_playlist(uuid):
+    invalidate(str(uuid))
+    invalidate(LIST_SCOPE)
+
+
+def invalidate_catalogue():
+    invalidate(CATALOGUE_SCOPE)
+
+
+# Serves a DRF view from the cache, answering conditional requests with 304 and
+# adding ETag/Last-Modified headers. Only 200 responses are cached, and they are
+# rendered from the primary database, never from a replica. Responses
+# that also show data from other scopes pass them as `depends`: versions are
+# write times, so the latest of them changes whenever any of the scopes does.
+def cached_response(request, scope, view, depends=()):
+    version = max(get_version(s) for s in (scope, *depends))
+    etag = f'"{scope}-{version}"'
+    last_modified = version // 10**9
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        return not_modified
+
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    key = f"playlist:{scope}:{version}:{path}"
+    cache = get_cache()
+    data = cache.get(key)
+    if data is None:
+        with primary_reads():
+            response = view()
+        if response.status_code != 200:
+            return response
+        cache.set(key, response.data, settings.PLAYLIST_CACHE_TIMEOUT)
+    else:
+        response = Response(data)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+# cached_response for the async views: `view` is a coroutine function returning
+# a JSON HttpResponse, whose encoded body is what gets cached.
+async def acached_response(request, scope, view):
+    version = await aget_version(scope)
+    etag = f'"{scope}-{version}"'
+    last_modified = version // 10**9
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        return not_modified
+
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    key = f"playlist:{scope}:{version}:{path}"
+    cache = get_cache()
+    content = await cache.aget(key)
+    if content is None:
+        with primary_reads():
+            response = await view()
+        if response.status_code != 200:
+            return response
+        await cache.aset(key, response.content, settings.PLAYLIST_CACHE_TIMEOUT)
+    else:
+        response = HttpResponse(content, content_type="application/json")
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
@@ -0,0 +1,147 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import CharField, DateTimeField, Exists, OuterRef, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .bulk import BULK_BATCH_SIZE
+from .models import Change, Playlist, PlaylistTrack
+
+# The change log behind /api/changes/. Every write path records its changes in
+# the same transaction as the write: the signals for single objects, and the
+# bulk paths (playlist serializer, ordering, import, seed) for whole batches.
+# A change to a playlist's tracks is also recorded as an update of the playlist,
+# whose representation nests them.
+#
+# Entry ids are the feed's cursors. Ids are handed out at insert time but become
+# visible at commit, so an entry can appear behind a cursor a consumer already
+# passed. The feed therefore stops before entries younger than
+# settings.PLAYLIST_CHANGES_SETTLE_SECONDS, which must exceed the longest write
+# transaction.
+
+CREATE, UPDATE, DELETE = "create", "update", "delete"
+
+CHANGES_DEFAULT_LIMIT = 1000
+CHANGES_MAX_LIMIT = 10000
+
+KINDS = ("artist", "album", "track", "playlist", "playlisttrack")
+
+
+def record_changes(model, action, pks):
+    Change.objects.bulk_create(
+        [
+            Change(kind=model._meta.model_name, object_id=str(pk), action=action)
+            for pk in pks
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+
+def record_playlist_tracks(action, pks, playlist_ids):
+    record_changes(PlaylistTrack, action, pks)
+    record_changes(Playlist, UPDATE, set(playlist_ids))
+
+
+# Records `action` for every row of `queryset` with one INSERT ... SELECT, for
+# rows written without the ORM, such as the COPY of the import or the playlist
+# set operations. The model must have an integer primary key.
+def record_rows(queryset, action):
+    rows = (
+        queryset.order_by()
+        .annotate(
+            change_kind=Value(queryset.model._meta.model_name),
+            change_object=Cast("pk", CharField(max_length=36)),
+            change_action=Value(action),
+            change_created=Value(timezone.now(), DateTimeField()),
+        )
+        .values_list("change_kind", "change_object", "change_action", "change_created")
+    )
+    sql, params = rows.query.sql_with_params()
+    quote = connection.ops.quote_name
+    columns = ", ".join(
+        quote(Change._meta.get_field(name).column)
+        for name in ("kind", "object_id", "action", "created")
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(Change._meta.db_table)} ({columns}) {sql}", params
+        )
+
+
+# Records a create for every row of `model` with a primary key above `last_pk`.
+def record_created_after(model, last_pk):
+    record_rows(model.objects.filter(pk__gt=last_pk), CREATE)
+
+
+# The entries after cursor `since` that are old enough to be served: those
+# before the first entry younger than the settle time.
+def settled_changes(since=0):
+    settled = Change.objects.filter(pk__gt=since)
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.PLAYLIST_CHANGES_SETTLE_SECONDS
+    )
+    unsettled = (
+        settled.filter(created__gt=cutoff)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+        .first()
+    )
+    if unsettled is not None:
+        settled = settled.filter(pk__lt=unsettled)
+    return settled
+
+
+# Returns the settled entries after cursor `since`, oldest first, at most
+# `limit` of them, and whether more settled entries follow. An object changed
+# several times within the batch appears once, with its latest entry.
+def read_changes(since, limit=CHANGES_DEFAULT_LIMIT, kinds=None):
+    settled = settled_changes(since)
+    entries = settled if kinds is None else settled.filter(kind__in=kinds)
+    rows = list(
+        entries.order_by("pk").values_list("pk", "kind", "object_id", "action")[
+            : limit + 1
+        ]
+    )
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for pk, kind, object_id, action in rows:
+        latest.pop((kind, object_id), None)
+        latest[(kind, object_id)] = (pk, action)
+    changes = [
+        {
+            "cursor": pk,
+            "kind": kind,
+            "id": object_id if kind == "playlist" else int(object_id),
+            "action": action,
+        }
+        for (kind, object_id), (pk, action) in latest.items()
+    ]
+    if more or kinds is None:
+        next_cursor = rows[-1][0] if rows else since
+    else:
+        # Skips past the settled entries of other kinds as well.
+        next_cursor = settled.order_by("-pk").values_list("pk", flat=True).first()
+        next_cursor = since if next_cursor is None else next_cursor
+    return changes, next_cursor, more
+
+
+# Deletes the entries older than `age` that a newer entry of the same object
+# supersedes. Consumers only act on the latest change of an object, so this keeps
+# every cursor valid while bounding the log by the number of objects changed.
+def compact_changes(age):
+    superseded = Change.objects.filter(
+        created__lt=timezone.now() - age,
+    ).filter(
+        Exists(
+            Change.objects.filter(
+                kind=OuterRef("kind"),
+                object_id=OuterRef("object_id"),
+                pk__gt=OuterRef("pk"),
+            )
+        )
+    )
+    return superseded.delete()[0]
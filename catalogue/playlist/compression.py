@@ -0,0 +1,85 @@
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Quality 5 keeps brotli's CPU cost close to gzip's while still compressing
+# JSON noticeably better; the top levels are meant for static assets.
+BROTLI_QUALITY = 5
+
+# Only API payloads are compressed. HTML pages carry CSRF tokens next to text an
+# attacker may control, which compression would expose to BREACH.
+COMPRESSED_TYPES = {"application/json", "application/msgpack"}
+
+# Random padding added to gzip output against BREACH, as GZipMiddleware does.
+GZIP_MAX_RANDOM_BYTES = 100
+
+_coding = re.compile(r"^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$")
+
+
+# Returns the content codings an Accept-Encoding header allows, ignoring the
+# ones given q=0.
+def accepted_encodings(header):
+    accepted = set()
+    for part in header.lower().split(","):
+        match = _coding.match(part)
+        if match is None:
+            continue
+        coding, quality = match.groups()
+        try:
+            if quality is not None and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding)
+    return accepted
+
+
+# Compresses JSON and MessagePack responses of at least
+# settings.PLAYLIST_COMPRESS_MIN_SIZE bytes with brotli when the client accepts
+# it and the brotli package is installed, or with gzip otherwise. Smaller bodies
+# are sent as they are: compressing them costs more time than it saves on the
+# wire. Streaming responses and responses
+# that already have a Content-Encoding, such as the catalogue export, are left
+# alone.
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        content_type = response.get("Content-Type", "").split(";")[0].strip()
+        if content_type.lower() not in COMPRESSED_TYPES:
+            return response
+        if len(response.content) < settings.PLAYLIST_COMPRESS_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+            content = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        elif "gzip" in accepted or "*" in accepted:
+            encoding = "gzip"
+            content = compress_string(
+                response.content, max_random_bytes=GZIP_MAX_RANDOM_BYTES
+            )
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response["Content-Length"] = str(len(content))
+        response["Content-Encoding"] = encoding
+        # The body differs from the uncompressed one, so a strong ETag must be
+        # weakened, as django.middleware.gzip.GZipMiddleware does.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
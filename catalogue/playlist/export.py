@@ -0,0 +1,82 @@
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from .models import Artist, Album, Track, Playlist, PlaylistTrack
+
+# Rows fetched per round trip from the server-side cursor.
+EXPORT_CHUNK_SIZE = 2000
+
+
+def artist_records(chunk_size=EXPORT_CHUNK_SIZE):
+    tracks = Track.objects.only("id", "title", "album_id").order_by("id")
+    albums = (
+        Album.objects.only("id", "title", "artist_id")
+        .order_by("id")
+        .prefetch_related(Prefetch("tracks", queryset=tracks))
+    )
+    artists = (
+        Artist.objects.only("id", "name")
+        .order_by("id")
+        .prefetch_related(Prefetch("albums", queryset=albums))
+    )
+    # With a chunk_size, the prefetches run once per chunk of artists, so only
+    # one chunk of the catalogue is held in memory at a time.
+    for artist in artists.iterator(chunk_size=chunk_size):
+        yield {
+            "type": "artist",
+            "id": artist.id,
+            "name": artist.name,
+            "albums": [
+                {
+                    "id": album.id,
+                    "title": album.title,
+                    "tracks": [
+                        {"id": track.id, "title": track.title}
+                        for track in album.tracks.all()
+                    ],
+                }
+                for album in artist.albums.all()
+            ],
+        }
+
+
+# Playlists and their rows are read by two cursors in the same (playlist, order)
+# order and merged, so only the rows of the playlist being written are held in
+# memory, however long the playlists are.
+def playlist_records(chunk_size=EXPORT_CHUNK_SIZE):
+    playlists = Playlist.objects.order_by("uuid").values_list("uuid", "name")
+    rows = (
+        PlaylistTrack.objects.order_by("playlist_id", "order")
+        .values_list("playlist_id", "track_id", "order")
+        .iterator(chunk_size=chunk_size)
+    )
+    row = next(rows, None)
+    for uuid, name in playlists.iterator(chunk_size=chunk_size):
+        # Skips rows of playlists deleted between the two queries.
+        while row is not None and row[0] < uuid:
+            row = next(rows, None)
+        tracks = []
+        while row is not None and row[0] == uuid:
+            tracks.append({"track": row[1], "order": row[2]})
+            row = next(rows, None)
+        yield {"type": "playlist", "uuid": uuid, "name": name, "tracks": tracks}
+
+
+# Yields the whole catalogue as NDJSON, one artist (with its albums and tracks)
+# or playlist (with its ordered tracks) per line.
+def iter_catalogue_ndjson(chunk_size=EXPORT_CHUNK_SIZE):
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    for records in (artist_records(chunk_size), playlist_records(chunk_size)):
+        for record in records:
+            yield (encoder.encode(record) + "\n").encode()
+
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,416 @@
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .bulk import BULK_BATCH_SIZE, muted_signals
+from .cache import invalidate_playlist
+from .changes import DELETE, UPDATE, record_changes, record_playlist_tracks
+from .importer import (
+    IMPORT_BATCH_SIZE,
+    CatalogueImporter,
+    CatalogueImportError,
+    read_rows,
+)
+from .models import Artist, Album, Job, Playlist, PlaylistTrack, Track
+from .ordering import OrderError
+from .revisions import RevisionError, record_revision
+from .setops import (
+    clone_playlist,
+    combine_playlists,
+    dedupe_playlist,
+    restore_revision,
+)
+from .similarity import queue_stale_tracks
+from .summary import (
+    count_artists,
+    rebuild_summaries,
+    summary_mismatches,
+    update_summary,
+)
+
+# Operations too slow for a request (deleting a large artist, importing a file,
+# rebuilding every playlist) are queued as Job rows and run by
+# `manage.py run_workers`.
+#
+# A handler is a generator function called with the job and its arguments. Each
+# step, up to the next `yield (progress, total)`, runs in its own transaction
+# that also saves the progress, so a step's writes and the progress recorded for
+# them commit together, and no transaction holds more than one chunk of rows.
+# The generator's return value is stored as the job's result.
+#
+# A failed job is retried after JOB_RETRY_DELAY seconds, doubled for each
+# attempt, up to JOB_MAX_ATTEMPTS attempts; its committed steps stay committed,
+# so handlers continue where the last attempt stopped. A worker claims a job for
+# settings.PLAYLIST_JOB_LEASE_SECONDS and renews the claim at every step; a job
+# whose claim lapses, because its worker died, is picked up by another worker.
+
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30
+
+# Seconds an idle worker waits before looking for jobs again.
+JOB_POLL_SECONDS = 1
+
+# Rows deleted per step.
+JOB_CHUNK_SIZE = BULK_BATCH_SIZE
+
+HANDLERS = {}
+
+
+# Raised by handlers for errors a retry cannot fix; the job fails at once.
+class JobFailed(Exception):
+    pass
+
+
+# The worker no longer holds the job's claim: another worker took it over.
+class JobLost(Exception):
+    pass
+
+
+def job_handler(kind):
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+
+    return register
+
+
+# Queues a job; arguments must be JSON serializable. Workers see it once the
+# caller's transaction commits.
+def enqueue(kind, **arguments):
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}.")
+    return Job.objects.create(kind=kind, arguments=arguments)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def lease_expiry():
+    return timezone.now() + timedelta(seconds=settings.PLAYLIST_JOB_LEASE_SECONDS)
+
+
+# Claims the oldest job that is ready to run, or whose worker stopped renewing
+# its claim. SKIP LOCKED lets workers claim different jobs concurrently where
+# the database supports it; the conditional UPDATE makes the claim safe where it
+# does not.
+def claim_job(worker):
+    now = timezone.now()
+    ready = Q(status=Job.QUEUED, run_after__lte=now) | Q(
+        status=Job.RUNNING, lease_expires__lt=now
+    )
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(ready)
+            .order_by("run_after", "pk")
+            .first()
+        )
+        if job is None:
+            return None
+        claimed = Job.objects.filter(
+            pk=job.pk, status=job.status, attempts=job.attempts
+        ).update(
+            status=Job.RUNNING,
+            worker=worker,
+            lease_expires=lease_expiry(),
+            attempts=F("attempts") + 1,
+            started=now,
+        )
+    if not claimed:
+        return None
+    job.refresh_from_db()
+    return job
+
+
+def owned(job):
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker)
+
+
+# Runs the claimed `job` step by step. With `stop` set between two steps, the
+# job is put back in the queue for the next worker.
+def run_job(job, stop=None):
+    if job.attempts > JOB_MAX_ATTEMPTS:
+        owned(job).update(
+            status=Job.FAILED,
+            error=job.error or "The worker running the job stopped responding.",
+            finished=timezone.now(),
+            lease_expires=None,
+        )
+        return
+    try:
+        steps = HANDLERS[job.kind](job, **job.arguments)
+        while True:
+            with transaction.atomic():
+                try:
+                    progress, total = next(steps)
+                except StopIteration as done:
+                    if not owned(job).update(
+                        status=Job.DONE,
+                        result=done.value,
+                        error="",
+                        finished=timezone.now(),
+                        lease_expires=None,
+                    ):
+                        raise JobLost
+                    return
+                if not owned(job).update(
+                    progress=progress, total=total, lease_expires=lease_expiry()
+                ):
+                    raise JobLost
+            if stop is not None and stop.is_set():
+                steps.close()
+                owned(job).update(
+                    status=Job.QUEUED,
+                    worker="",
+                    lease_expires=None,
+                    attempts=F("attempts") - 1,
+                )
+                return
+    except JobLost:
+        return
+    except Exception as e:
+        error = traceback.format_exc()
+        if isinstance(e, JobFailed) or job.attempts >= JOB_MAX_ATTEMPTS:
+            owned(job).update(
+                status=Job.FAILED,
+                error=error,
+                finished=timezone.now(),
+                lease_expires=None,
+            )
+        else:
+            delay = JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            owned(job).update(
+                status=Job.QUEUED,
+                error=error,
+                worker="",
+                lease_expires=None,
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+
+
+# Runs the jobs that are ready in the calling thread until none is left.
+# Returns the number of jobs run.
+def run_pending(stop=None):
+    worker = worker_name()
+    count = 0
+    while stop is None or not stop.is_set():
+        job = claim_job(worker)
+        if job is None:
+            break
+        run_job(job, stop)
+        count += 1
+    return count
+
+
+# Loop of a worker thread: runs jobs until `stop` is set, or with `burst`, until
+# the queue is empty. A database error outside a step (a lost connection, or
+# SQLite's "database is locked" with several workers) does not end the thread:
+# it reconnects after `poll` seconds, and a job it was running is picked up
+# again once its claim lapses.
+def work(stop, burst=False, poll=JOB_POLL_SECONDS):
+    worker = worker_name()
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                job = claim_job(worker)
+                if job is not None:
+                    run_job(job, stop)
+            except DatabaseError:
+                connection.close()
+                stop.wait(poll)
+                continue
+            if job is None:
+                if burst:
+                    break
+                stop.wait(poll)
+    finally:
+        connection.close()
+
+
+# Primary keys of `queryset` a chunk at a time, for handlers deleting them.
+def chunks(queryset):
+    while pks := list(queryset.values_list("pk", flat=True)[:JOB_CHUNK_SIZE]):
+        yield pks
+
+
+# Locks the playlists in primary key order, so that jobs deleting rows of the
+# same playlists wait for each other instead of deadlocking.
+def lock_playlists(playlist_ids):
+    list(
+        Playlist.objects.select_for_update()
+        .filter(pk__in=playlist_ids)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+
+# Deletes playlist rows with the bookkeeping the signals would do per row done
+# once for the chunk.
+def delete_playlist_tracks(pks):
+    rows = PlaylistTrack.objects.filter(pk__in=pks)
+    lock_playlists(rows.values_list("playlist_id", flat=True).distinct())
+    rows = list(rows.values_list("pk", "playlist_id", "track_id"))
+    pks = [pk for pk, _, _ in rows]
+    playlist_ids = sorted({playlist_id for _, playlist_id, _ in rows})
+    with muted_signals():
+        PlaylistTrack.objects.filter(pk__in=pks).delete()
+    record_playlist_tracks(DELETE, pks, playlist_ids)
+    queue_stale_tracks({track_id for _, _, track_id in rows})
+    for playlist_id in playlist_ids:
+        record_revision(playlist_id)
+        invalidate_playlist(playlist_id)
+    update_summary(playlist_ids, recount=True)
+
+
+CATALOGUE_MODELS = {"artist": Artist, "album": Album, "track": Track}
+
+
+# Deletes the "artist", "album" or "track" `model` with primary key `pk` and
+# everything below it, bottom up: the playlist rows of its tracks, its tracks,
+# its albums, then the object. Each chunk is deleted by the ORM's collector with
+# nothing left to cascade to but the similarity rows, instead of one collector
+# pass over the whole tree.
+@job_handler("delete_catalogue_object")
+def delete_catalogue_object(job, model, pk):
+    tracks = {
+        "artist": Track.objects.filter(album__artist_id=pk),
+        "album": Track.objects.filter(album_id=pk),
+        "track": Track.objects.filter(pk=pk),
+    }[model]
+    stages = [PlaylistTrack.objects.filter(track__in=tracks), tracks]
+    if model == "artist":
+        stages.append(Album.objects.filter(artist_id=pk))
+    stages.append(CATALOGUE_MODELS[model].objects.filter(pk=pk))
+
+    done = job.progress
+    total = done + sum(queryset.count() for queryset in stages)
+    yield done, total
+    for queryset in stages:
+        for pks in chunks(queryset):
+            if queryset.model is PlaylistTrack:
+                delete_playlist_tracks(pks)
+            else:
+                queryset.model.objects.filter(pk__in=pks).delete()
+            done += len(pks)
+            yield done, max(done, total)
+    return {"deleted": done}
+
+
+# Deletes a playlist's rows in chunks, then the playlist. Each chunk is removed
+# from the front like an edit of the playlist, with its revision, change log
+# entry and summary, so a job that stops half way leaves a shorter playlist that
+# is consistent with its rows, and a retry carries on from there.
+@job_handler("delete_playlist")
+def delete_playlist(job, uuid):
+    done = job.progress
+    rows = PlaylistTrack.objects.filter(playlist_id=uuid).order_by("order")
+    total = done + rows.count() + 1
+    yield done, total
+    while True:
+        # Rows read after the lock, so none is also being deleted by another job.
+        lock_playlists([uuid])
+        chunk = list(rows.values_list("pk", "track_id", "order")[:JOB_CHUNK_SIZE])
+        if not chunk:
+            break
+        pks = [pk for pk, _, _ in chunk]
+        track_ids = [track_id for _, track_id, _ in chunk]
+        with muted_signals():
+            PlaylistTrack.objects.filter(pk__in=pks).delete()
+        record_playlist_tracks(DELETE, pks, [uuid])
+        queue_stale_tracks(track_ids)
+        record_revision(uuid, [("remove", [order for _, _, order in chunk])])
+        count_artists(uuid, removed=track_ids)
+        update_summary([uuid], track_delta=-len(pks), artists=False)
+        invalidate_playlist(uuid)
+        done += len(pks)
+        yield done, max(done, total)
+    Playlist.objects.filter(pk=uuid).delete()
+    return {"deleted": done + 1}
+
+
+# Imports a catalogue file one IMPORT_BATCH_SIZE batch per step. A retry skips
+# the rows already committed, as recorded in the job's progress. The file must
+# be readable by the workers.
+@job_handler("import_catalogue")
+def import_catalogue(job, path, file_format=None, use_copy=None):
+    importer = CatalogueImporter(use_copy=use_copy)
+    done = job.progress
+    rows = islice(read_rows(path, file_format), done, None)
+    try:
+        while batch := list(islice(rows, IMPORT_BATCH_SIZE)):
+            importer.write_batch(batch)
+            done += len(batch)
+            yield done, None
+    except CatalogueImportError as e:
+        raise JobFailed(f"{e} {done} rows committed.")
+    return {"rows": done}
+
+
+# Recomputes the summary columns of the playlists whose counts are wrong, a
+# chunk of playlists per step.
+@job_handler("rebuild_playlist_summaries")
+def rebuild_playlist_summaries(job):
+    total = Playlist.objects.count()
+    done = rebuilt = 0
+    playlists = Playlist.objects.order_by("pk")
+    yield done, total
+    while uuids := list(playlists.values_list("pk", flat=True)[:JOB_CHUNK_SIZE]):
+        chunk = Playlist.objects.filter(pk__in=uuids)
+        mismatched = [uuid for uuid, _, _ in summary_mismatches(chunk)]
+        if mismatched:
+            rebuild_summaries(Playlist.objects.filter(pk__in=mismatched))
+            record_changes(Playlist, UPDATE, mismatched)
+            for uuid in mismatched:
+                invalidate_playlist(uuid)
+        done += len(uuids)
+        rebuilt += len(mismatched)
+        playlists = Playlist.objects.order_by("pk").filter(pk__gt=uuids[-1])
+        yield done, max(done, total)
+    return {"rebuilt": rebuilt}
+
+
+# Playlist operations of playlist/setops.py, one step each. Errors from a
+# missing playlist or revision are final.
+def playlist_operation(function, *args):
+    try:
+        return function(*args)
+    except (OrderError, RevisionError, Playlist.DoesNotExist) as e:
+        raise JobFailed(str(e) or "Playlist does not exist.")
+
+
+@job_handler("clone_playlist")
+def clone_playlist_job(job, uuid, name=None):
+    playlist = playlist_operation(clone_playlist, uuid, name)
+    yield 1, 1
+    return {"playlist": str(playlist.pk)}
+
+
+@job_handler("combine_playlists")
+def combine_playlists_job(job, operation, uuid, others, name=None):
+    playlist = playlist_operation(combine_playlists, operation, uuid, others, name)
+    yield 1, 1
+    return {"playlist": str(playlist.pk)}
+
+
+@job_handler("dedupe_playlist")
+def dedupe_playlist_job(job, uuid):
+    deleted = playlist_operation(dedupe_playlist, uuid)
+    yield 1, 1
+    return {"deleted": deleted}
+
+
+@job_handler("restore_revision")
+def restore_revision_job(job, uuid, number):
+    playlist_operation(restore_revision, uuid, number)
+    yield 1, 1
+    return {"playlist": str(uuid)}
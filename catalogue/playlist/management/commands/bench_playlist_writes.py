@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from playlist.models import Artist, Album, Track
+from playlist.serializers import PlaylistSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+# Times PlaylistSerializer.create/update on a large playlist and reports the
+# number of queries each one runs. All rows are created inside a transaction
+# that is rolled back, so the command is safe to run against a real database.
+class Command(BaseCommand):
+    help = "Benchmark PlaylistSerializer writes on a large playlist."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tracks", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        size = options["tracks"]
+        try:
+            with transaction.atomic():
+                self.run(size)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, size):
+        artist = Artist.objects.create(name="Benchmark Artist")
+        album = Album.objects.create(title="Benchmark Album", artist=artist)
+        Track.objects.bulk_create(
+            [Track(title=f"Track {i}", album=album) for i in range(size)],
+            batch_size=1000,
+        )
+        track_ids = list(
+            Track.objects.filter(album=album)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+        tracks = [{"track": pk, "order": i} for i, pk in enumerate(track_ids, 1)]
+        serializer = PlaylistSerializer(data={"name": "Benchmark", "tracks": tracks})
+        playlist = self.measure("create", serializer)
+
+        # Move the last track to the top and swap in a new track at the end,
+        # which is the typical shape of an edit to a large playlist.
+        extra = Track.objects.create(title="Extra", album=album)
+        track_ids = [track_ids[-1]] + track_ids[:-2] + [extra.pk]
+        tracks = [{"track": pk, "order": i} for i, pk in enumerate(track_ids, 1)]
+        serializer = PlaylistSerializer(
+            playlist, data={"name": "Benchmark", "tracks": tracks}
+        )
+        self.measure("update", serializer)
+
+    def measure(self, label, serializer):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            serializer.is_valid(raise_exception=True)
+            instance = serializer.save()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{label}: {len(serializer.validated_data['playlisttrack_set'])} tracks, "
+            f"{len(queries)} queries, {elapsed * 1000:.1f} ms"
+        )
+        return instance
@@ -0,0 +1,115 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from playlist.models import Artist, Album, Track, Playlist, PlaylistRevision
+from playlist.ordering import append_tracks, insert_track, move_track, remove_track
+from playlist.revisions import (
+    apply_delta,
+    playlist_sequence,
+    revision_tracks,
+)
+
+# Versions rebuilt when measuring reconstruction latency, spread over the history.
+SAMPLE_VERSIONS = 100
+
+
+class Rollback(Exception):
+    pass
+
+
+# Applies a long history of random edits (single inserts, moves and removals, and
+# appended runs) to a large playlist, then reports the storage taken by its
+# revisions against full copies of every version, and the time to rebuild a
+# version. All rows are created inside a transaction that is rolled back, so the
+# command is safe to run against a real database.
+class Command(BaseCommand):
+    help = "Benchmark playlist revision storage and reconstruction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tracks", type=int, default=10000)
+        parser.add_argument("--edits", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options["tracks"], options["edits"], options["seed"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, size, edits, seed):
+        rng = random.Random(seed)
+        artist = Artist.objects.create(name="Benchmark Artist")
+        album = Album.objects.create(title="Benchmark Album", artist=artist)
+        Track.objects.bulk_create(
+            [Track(title=f"Track {i}", album=album) for i in range(size * 2)],
+            batch_size=1000,
+        )
+        track_ids = list(
+            Track.objects.filter(album=album)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        playlist = Playlist.objects.create(name="Benchmark")
+        append_tracks(playlist.uuid, track_ids[:size])
+
+        start = time.perf_counter()
+        for _ in range(edits):
+            self.edit(rng, playlist, track_ids)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"edits: {edits} on {size} tracks, "
+            f"{elapsed * 1000 / max(edits, 1):.1f} ms per edit"
+        )
+
+        rows = list(
+            PlaylistRevision.objects.filter(playlist=playlist)
+            .order_by("number")
+            .values_list("number", "base", "data")
+        )
+        stored = full = 0
+        tracks = []
+        for number, base, data in rows:
+            tracks = list(data) if base == number else apply_delta(tracks, data)
+            stored += len(json.dumps(data))
+            full += len(json.dumps(tracks))
+        checkpoints = sum(1 for number, base, _ in rows if base == number)
+        self.stdout.write(
+            f"storage: {len(rows)} revisions, {checkpoints} checkpoints, "
+            f"{stored / 1024:.0f} KiB stored vs {full / 1024:.0f} KiB as full "
+            f"copies ({stored / max(full, 1):.1%})"
+        )
+        if tracks != playlist_sequence(playlist.pk):
+            self.stderr.write("latest revision does not match the playlist")
+
+        step = max(1, len(rows) // SAMPLE_VERSIONS)
+        timings = []
+        for number, _, _ in rows[::step]:
+            start = time.perf_counter()
+            revision_tracks(playlist.pk, number)
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f"rebuild: {len(timings)} versions, median "
+            f"{statistics.median(timings):.2f} ms, max {max(timings):.2f} ms"
+        )
+
+    def edit(self, rng, playlist, track_ids):
+        orders = list(
+            playlist.playlisttrack_set.order_by("order").values_list("order", flat=True)
+        )
+        kind = rng.choice(["insert", "move", "remove", "append"])
+        if kind == "append" or not orders:
+            start = rng.randrange(len(track_ids) - 10)
+            append_tracks(playlist.uuid, track_ids[start : start + rng.randint(1, 10)])
+        elif kind == "insert":
+            insert_track(playlist.uuid, rng.choice(track_ids), rng.choice(orders))
+        elif kind == "move":
+            move_track(playlist.uuid, rng.choice(orders), rng.choice(orders))
+        else:
+            remove_track(playlist.uuid, rng.choice(orders))
@@ -0,0 +1,282 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from functools import partial
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from playlist.cache import get_cache
+from playlist.models import Artist, Album, Track, Playlist
+from playlist.rows import row_serializer
+from playlist.seed import seed_catalogue
+from playlist.serializers import PlaylistSerializer
+from playlist.views import AlbumViewSet, PlaylistViewSet, TrackViewSet
+
+# A result regresses when its median latency or peak memory grows by more than
+# the threshold, or when it runs more queries. Latency changes below
+# MIN_LATENCY_DELTA_MS are treated as noise.
+DEFAULT_THRESHOLD = 0.2
+MIN_LATENCY_DELTA_MS = 1.0
+
+# Objects per page in the serialize cases.
+SERIALIZE_PAGE_SIZE = 1000
+
+# Playlists seeded per size; each holds a tenth of the catalogue, capped so the
+# nested /api/playlists/ page stays a realistic size.
+PLAYLISTS = 20
+MAX_PLAYLIST_SIZE = 1000
+
+
+class Rollback(Exception):
+    pass
+
+
+# Seeds a catalogue of each requested size (in tracks) inside a transaction that
+# is rolled back, then runs every API, template and serializer path against it.
+# Each case is timed `--repeat` times with a cold response cache and run once
+# more under tracemalloc for its peak memory. Results are written as JSON, which
+# --compare reads back to flag regressions between two runs:
+#
+#   manage.py benchmark --sizes 1000,10000 --output before.json
+#   manage.py benchmark --sizes 1000,10000 --output after.json
+#   manage.py benchmark --compare before.json after.json
+class Command(BaseCommand):
+    help = "Benchmark the API, template views and serializers at several sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="1000,10000",
+            help="Comma separated catalogue sizes, in tracks.",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument(
+            "--compare",
+            nargs=2,
+            metavar=("BASE", "NEW"),
+            help="Compare two result files instead of running the benchmarks.",
+        )
+        parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+
+    def handle(self, *args, **options):
+        if options["compare"]:
+            self.compare(*options["compare"], options["threshold"])
+            return
+
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError("--sizes must be comma separated integers.")
+        results = []
+        cache_settings = {
+            "CACHES": {
+                **settings.CACHES,
+                "benchmark": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "playlist-benchmark",
+                },
+            },
+            "PLAYLIST_CACHE_ALIAS": "benchmark",
+            "ALLOWED_HOSTS": [*settings.ALLOWED_HOSTS, "testserver"],
+        }
+        with override_settings(**cache_settings):
+            for size in sizes:
+                results += self.run_size(size, options["repeat"])
+
+        report = {
+            "created": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "repeat": options["repeat"],
+            "results": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as stream:
+                json.dump(report, stream, indent=2)
+            self.stdout.write(f"Wrote {len(results)} results to {options['output']}.")
+
+    def run_size(self, size, repeat):
+        results = []
+        try:
+            with transaction.atomic():
+                seed_catalogue(
+                    artists=max(1, size // 100),
+                    albums_per=10,
+                    tracks_per=10,
+                    playlists=PLAYLISTS,
+                    playlist_size=min(max(1, size // 10), MAX_PLAYLIST_SIZE),
+                )
+                for name, case in self.cases():
+                    result = self.measure(case, repeat)
+                    result.update(size=size, case=name)
+                    results.append(result)
+                    rate = result.get("objects_per_sec")
+                    self.stdout.write(
+                        f"{size:>8} {name:<28} {result['median_ms']:>9.1f} ms "
+                        f"{result['queries']:>6} queries {result['peak_kb']:>9.0f} KB"
+                        + (f" {rate:>9} objects/s" if rate else "")
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+        return results
+
+    def cases(self):
+        client = Client()
+        playlist = Playlist.objects.order_by("pk").first()
+        ids = {
+            "artist": Artist.objects.order_by("pk").values_list("pk", flat=True)[0],
+            "album": Album.objects.order_by("pk").values_list("pk", flat=True)[0],
+            "track": Track.objects.order_by("pk").values_list("pk", flat=True)[0],
+        }
+        tracks = [
+            {"track": row.track_id, "order": row.order}
+            for row in playlist.playlisttrack_set.all()
+        ]
+        # Drop the first track and append it again, the shape of a typical edit.
+        edited = tracks[1:] + [
+            {"track": tracks[0]["track"], "order": tracks[-1]["order"] + 1}
+        ]
+
+        def get(url):
+            return lambda: client.get(url)
+
+        for kind in ("artist", "album", "track"):
+            yield f"api {kind} list", get(reverse(f"{kind}-list"))
+            yield f"api {kind} detail", get(reverse(f"{kind}-detail", args=[ids[kind]]))
+        yield "api playlist list", get(reverse("playlist-list"))
+        yield "api playlist detail", get(reverse("playlist-detail", args=[playlist.pk]))
+        yield "api playlist expanded", get(
+            reverse("playlist-detail", args=[playlist.pk]) + "?expand=tracks"
+        )
+        yield "api playlist tracks", get(reverse("playlist-tracks", args=[playlist.pk]))
+        yield "api search", get(reverse("catalogue_search") + "?q=love")
+        yield "page playlist list", get(reverse("playlist_list"))
+        yield "page playlist detail", get(
+            reverse("playlist_detail", args=[playlist.pk])
+        )
+
+        def create():
+            serializer = PlaylistSerializer(data={"name": "Bench", "tracks": tracks})
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+        # Alternates between the two track lists so every run has work to do.
+        versions = [tracks, edited]
+
+        def update():
+            versions.reverse()
+            serializer = PlaylistSerializer(
+                playlist, data={"name": playlist.name, "tracks": versions[0]}
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+        yield "serializer create", create
+        yield "serializer update", update
+
+        # A page serialized by the ModelSerializer and by the RowSerializer read
+        # path of the list endpoints; objects_per_sec shows the difference.
+        for viewset in (TrackViewSet, AlbumViewSet, PlaylistViewSet):
+            queryset = viewset.queryset.order_by("pk")[:SERIALIZE_PAGE_SIZE]
+            model_name = viewset.queryset.model._meta.model_name
+            yield f"serialize {model_name}s: model", partial(
+                self.serialize_models, viewset.serializer_class, queryset
+            )
+            yield f"serialize {model_name}s: rows", partial(
+                self.serialize_rows, viewset.serializer_class, queryset
+            )
+
+    def serialize_models(self, serializer_class, queryset):
+        return len(serializer_class(queryset.all(), many=True).data)
+
+    def serialize_rows(self, serializer_class, queryset):
+        rows = row_serializer(serializer_class)
+        return len(rows.represent(list(rows.values(queryset))))
+
+    def measure(self, case, repeat):
+        timings = []
+        queries = 0
+        for _ in range(repeat):
+            get_cache().clear()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                objects = self.check_result(case())
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = len(captured)
+
+        get_cache().clear()
+        tracemalloc.start()
+        try:
+            case()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        median = statistics.median(timings)
+        result = {
+            "median_ms": round(median, 3),
+            "min_ms": round(min(timings), 3),
+            "queries": queries,
+            "peak_kb": round(peak / 1024, 1),
+        }
+        if objects is not None:
+            result["objects"] = objects
+            result["objects_per_sec"] = round(objects / (median / 1000))
+        return result
+
+    # Cases return a response, or the number of objects they serialized.
+    def check_result(self, result):
+        if isinstance(result, int):
+            return result
+        if result is not None and result.status_code != 200:
+            raise CommandError(f"Benchmark request failed: {result.status_code}")
+        return None
+
+    def compare(self, base_path, new_path, threshold):
+        base, new = self.load(base_path), self.load(new_path)
+        regressions = 0
+        for key, after in new.items():
+            before = base.get(key)
+            if before is None:
+                continue
+            problems = []
+            for field, label, floor in [
+                ("median_ms", "latency", MIN_LATENCY_DELTA_MS),
+                ("peak_kb", "memory", 0),
+            ]:
+                if (
+                    before[field]
+                    and after[field] > before[field] * (1 + threshold)
+                    and after[field] - before[field] > floor
+                ):
+                    problems.append(
+                        f"{label} {before[field]:.1f} -> {after[field]:.1f} "
+                        f"(+{after[field] / before[field] - 1:.0%})"
+                    )
+            if after["queries"] > before["queries"]:
+                problems.append(f"queries {before['queries']} -> {after['queries']}")
+            size, case = key
+            status = "REGRESSION " + ", ".join(problems) if problems else "ok"
+            self.stdout.write(f"{size:>8} {case:<28} {status}")
+            regressions += bool(problems)
+        if regressions:
+            raise CommandError(f"{regressions} benchmarks regressed.")
+
+    def load(self, path):
+        try:
+            with open(path) as stream:
+                results = json.load(stream)["results"]
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+        return {(result["size"], result["case"]): result for result in results}
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from playlist.changes import compact_changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete change log entries older than --days that a newer entry of the "
+        "same object supersedes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=7)
+
+    def handle(self, *args, days, **options):
+        deleted = compact_changes(timedelta(days=days))
+        self.stdout.write(f"Deleted {deleted} superseded change log entries.")
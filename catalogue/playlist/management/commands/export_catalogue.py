@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from playlist.export import EXPORT_CHUNK_SIZE, gzip_stream, iter_catalogue_ndjson
+
+
+class Command(BaseCommand):
+    help = "Stream the whole catalogue as NDJSON to stdout or a file."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", "-o", help="File to write to. Defaults to stdout."
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help="Gzip the output. Implied when --output ends with .gz.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunks = iter_catalogue_ndjson(options["chunk_size"])
+        output = options["output"]
+        if options["gzip"] or (output and output.endswith(".gz")):
+            chunks = gzip_stream(chunks)
+
+        if output:
+            with open(output, "wb") as stream:
+                stream.writelines(chunks)
+        else:
+            sys.stdout.buffer.writelines(chunks)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,90 @@
+import itertools
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from playlist.importer import (
+    IMPORT_BATCH_SIZE,
+    CatalogueImporter,
+    CatalogueImportError,
+    read_rows,
+)
+from playlist.jobs import enqueue
+from playlist.models import ImportCheckpoint
+
+
+# Each batch is committed in its own transaction together with the number of rows
+# committed so far, kept in an ImportCheckpoint row for the file, so a failed
+# import picks up after the last committed batch when run again on the same file.
+class Command(BaseCommand):
+    help = "Bulk import artists, albums and tracks from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or NDJSON file, optionally gzipped.")
+        parser.add_argument("--format", choices=["csv", "ndjson"])
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            "--restart", action="store_true", help="Ignore an existing checkpoint."
+        )
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="Use INSERT instead of PostgreSQL COPY for tracks.",
+        )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Queue the import as a job for run_workers, which must be able "
+            "to read the file, and return at once.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if options["background"]:
+            job = enqueue(
+                "import_catalogue",
+                path=os.path.abspath(path),
+                file_format=options["format"],
+                use_copy=False if options["no_copy"] else None,
+            )
+            self.stdout.write(f"Queued import job {job.pk}.")
+            return
+        source = os.path.abspath(path)
+        checkpoints = ImportCheckpoint.objects.filter(source=source)
+        if options["restart"]:
+            checkpoints.delete()
+        done = checkpoints.values_list("rows", flat=True).first() or 0
+        if done:
+            self.stdout.write(f"Resuming after row {done}.")
+
+        importer = CatalogueImporter(use_copy=False if options["no_copy"] else None)
+        rows = itertools.islice(read_rows(path, options["format"]), done, None)
+        imported = 0
+        start = time.perf_counter()
+        try:
+            while batch := list(itertools.islice(rows, options["batch_size"])):
+                with transaction.atomic():
+                    importer.write_batch(batch)
+                    ImportCheckpoint.objects.update_or_create(
+                        source=source, defaults={"rows": done + imported + len(batch)}
+                    )
+                imported += len(batch)
+                self.stdout.write(
+                    f"{done + imported} rows ({self.rate(imported, start):,.0f} rows/s)"
+                )
+        except CatalogueImportError as e:
+            raise CommandError(f"{e} {done + imported} rows committed.")
+
+        checkpoints.delete()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {imported} rows in {elapsed:.1f}s "
+                f"({self.rate(imported, start):,.0f} rows/s)."
+            )
+        )
+
+    def rate(self, rows, start):
+        return rows / max(time.perf_counter() - start, 1e-9)
@@ -0,0 +1,103 @@
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Fires concurrent GET requests at one or more running servers and reports the
+# throughput and latency percentiles of each, e.g. to compare the sync API under
+# WSGI with the async API under ASGI:
+#
+#   gunicorn catalogue.wsgi -w 4 -b :8000
+#   uvicorn catalogue.asgi:application --workers 4 --port 8001
+#   manage.py load_test wsgi=http://127.0.0.1:8000/api/playlists/ \
+#       asgi=http://127.0.0.1:8001/api/async/playlists/
+#
+# Every client keeps one connection open and sends its next request as soon as
+# the previous response has been read.
+class Command(BaseCommand):
+    help = "Load test running servers and compare requests/s and latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "targets", nargs="+", metavar="LABEL=URL", help="Server to load test."
+        )
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--timeout", type=float, default=30)
+
+    def handle(self, *args, targets, concurrency, requests, timeout, **options):
+        parsed = []
+        for target in targets:
+            label, sep, url = target.partition("=")
+            if not sep or urlsplit(url).scheme not in ("http", "https"):
+                raise CommandError(f"Expected LABEL=URL, got {target!r}.")
+            parsed.append((label, url))
+
+        self.stdout.write(
+            f"{'target':<12}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+            f"{'max ms':>10}{'errors':>8}"
+        )
+        for label, url in parsed:
+            elapsed, latencies, errors = self.run(url, concurrency, requests, timeout)
+            latencies.sort()
+            self.stdout.write(
+                f"{label:<12}{len(latencies) / elapsed:>10.1f}"
+                f"{percentile(latencies, 50):>10.1f}"
+                f"{percentile(latencies, 99):>10.1f}"
+                f"{percentile(latencies, 100):>10.1f}{errors:>8}"
+            )
+
+    def run(self, url, concurrency, requests, timeout):
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        connection_class = (
+            http.client.HTTPSConnection
+            if parts.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        remaining = iter(range(requests))
+        lock = threading.Lock()
+        latencies = []
+        errors = 0
+
+        def client():
+            nonlocal errors
+            connection = connection_class(parts.netloc, timeout=timeout)
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                start = time.perf_counter()
+                try:
+                    connection.request("GET", path)
+                    response = connection.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    ok = False
+                took = (time.perf_counter() - start) * 1000
+                with lock:
+                    if ok:
+                        latencies.append(took)
+                    else:
+                        errors += 1
+            connection.close()
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, latencies, errors
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from playlist.cache import invalidate_playlist
+from playlist.changes import UPDATE, record_changes
+from playlist.jobs import enqueue
+from playlist.models import Playlist
+from playlist.bulk import BULK_BATCH_SIZE
+from playlist.summary import rebuild_summaries, summary_mismatches
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the track and artist counts stored on playlists whose counts "
+        "are wrong, or with --verify, only report them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only compare the stored counts with PlaylistTrack; change nothing.",
+        )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Queue the rebuild as a job for run_workers and return at once.",
+        )
+
+    def handle(self, *args, verify=False, background=False, **options):
+        if background and not verify:
+            job = enqueue("rebuild_playlist_summaries")
+            self.stdout.write(f"Queued rebuild job {job.pk}.")
+            return
+        mismatched = []
+        for uuid, stored, actual in summary_mismatches():
+            mismatched.append(uuid)
+            self.stdout.write(
+                f"{uuid}: stored {stored[0]} tracks, {stored[1]} artists; "
+                f"actual {actual[0]} tracks, {actual[1]} artists"
+            )
+
+        if verify:
+            if mismatched:
+                raise CommandError(
+                    f"{len(mismatched)} playlist summaries are out of date."
+                )
+            self.stdout.write("All playlist summaries are up to date.")
+            return
+
+        for start in range(0, len(mismatched), BULK_BATCH_SIZE):
+            uuids = mismatched[start : start + BULK_BATCH_SIZE]
+            rebuild_summaries(Playlist.objects.filter(pk__in=uuids))
+            record_changes(Playlist, UPDATE, uuids)
+            for uuid in uuids:
+                invalidate_playlist(uuid)
+        self.stdout.write(f"Rebuilt the summaries of {len(mismatched)} playlists.")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from playlist.models import SearchTerm
+from playlist.search import SEARCH_FIELDS, index_objects, uses_term_index
+
+CHUNK_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search term index of artists, albums and tracks."
+
+    def handle(self, *args, **options):
+        if not uses_term_index():
+            self.stdout.write(
+                "PostgreSQL searches its full-text indexes; nothing to do."
+            )
+            return
+
+        for kind, (model, field) in SEARCH_FIELDS.items():
+            with transaction.atomic():
+                SearchTerm.objects.filter(kind=kind).delete()
+                chunk = []
+                for obj in model.objects.only("pk", field).iterator(CHUNK_SIZE):
+                    chunk.append(obj)
+                    if len(chunk) == CHUNK_SIZE:
+                        index_objects(kind, chunk, replace=False)
+                        chunk = []
+                index_objects(kind, chunk, replace=False)
+            self.stdout.write(f"Indexed {model.objects.count()} {kind}s.")
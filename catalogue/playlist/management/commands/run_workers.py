@@ -0,0 +1,71 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from playlist.jobs import JOB_POLL_SECONDS, run_pending, work
+
+
+def run_threads(threads, stop, burst, poll):
+    pool = [
+        threading.Thread(target=work, args=(stop, burst, poll), daemon=True)
+        for _ in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+
+# Runs queued jobs with `--threads` worker threads in each of `--processes`
+# processes, until interrupted. SIGINT and SIGTERM let every worker finish its
+# current step and put its job back in the queue. With --burst, the workers exit
+# once the queue is empty. SQLite lets one writer in at a time, so there a single
+# thread is the sensible setting.
+class Command(BaseCommand):
+    help = "Run background jobs from the job queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Worker processes, forked from this one; each runs --threads.",
+        )
+        parser.add_argument(
+            "--burst", action="store_true", help="Exit once the queue is empty."
+        )
+        parser.add_argument("--poll", type=float, default=JOB_POLL_SECONDS)
+
+    def handle(self, *args, threads, processes, burst, poll, **options):
+        if threads < 1 or processes < 1:
+            raise CommandError("--threads and --processes must be at least 1.")
+        if processes == 1 and threads == 1 and burst:
+            count = run_pending()
+            self.stdout.write(f"Ran {count} jobs.")
+            return
+
+        if processes > 1:
+            context = multiprocessing.get_context("fork")
+            stop = context.Event()
+        else:
+            stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+
+        if processes == 1:
+            run_threads(threads, stop, burst, poll)
+            return
+        # Forked children must not share the parent's database connections.
+        connections.close_all()
+        pool = [
+            context.Process(target=run_threads, args=(threads, stop, burst, poll))
+            for _ in range(processes)
+        ]
+        for process in pool:
+            process.start()
+        for process in pool:
+            process.join()
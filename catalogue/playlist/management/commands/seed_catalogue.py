@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from playlist.seed import seed_catalogue
+
+
+class Command(BaseCommand):
+    help = "Fill the database with a synthetic catalogue and playlists."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--artists", type=int, default=100)
+        parser.add_argument("--albums-per", type=int, default=5)
+        parser.add_argument("--tracks-per", type=int, default=10)
+        parser.add_argument("--playlists", type=int, default=20)
+        parser.add_argument("--playlist-size", type=int, default=50)
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Same seed, same catalogue."
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        counts = seed_catalogue(
+            options["artists"],
+            options["albums_per"],
+            options["tracks_per"],
+            options["playlists"],
+            options["playlist_size"],
+            options["seed"],
+        )
+        self.stdout.write(
+            f"Created {counts['artists']} artists, {counts['albums']} albums, "
+            f"{counts['tracks']} tracks and {counts['playlists']} playlists "
+            f"in {time.perf_counter() - start:.1f}s."
+        )
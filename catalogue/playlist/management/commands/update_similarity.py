@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from playlist.similarity import build_similarity, refresh_similarity, sparse
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the similar tracks and playlists affected by changes since the "
+        "last run, or with --rebuild, recompute all of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute every track and playlist from PlaylistTrack.",
+        )
+
+    def handle(self, *args, rebuild=False, **options):
+        if rebuild:
+            pairs = build_similarity()
+            method = "sparse matrices" if sparse is not None else "counters"
+            self.stdout.write(
+                f"Rebuilt similarity from {pairs} playlist tracks with {method}."
+            )
+            return
+        tracks, playlists = refresh_similarity()
+        self.stdout.write(f"Recounted {tracks} tracks and {playlists} playlists.")
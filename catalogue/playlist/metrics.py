@@ -0,0 +1,290 @@
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+# Per-request performance instrumentation. PerformanceMiddleware times a sampled
+# fraction of requests (settings.PLAYLIST_METRICS_SAMPLE_RATE) and records the
+# SQL they run through a database execute wrapper. Each sampled response gets a
+# Server-Timing header, and the numbers are aggregated per endpoint for the
+# Prometheus text exposition served at /metrics to the scraper's addresses.
+# Aggregates live in process memory, so every worker process reports its own.
+
+# Latency bucket upper bounds in seconds, 1ms to ~23s, each 1.25x the previous,
+# so an estimated percentile is within 25% of the true value.
+BUCKETS = tuple(round(0.001 * 1.25**i, 6) for i in range(46))
+
+# Recent percentiles cover the last WINDOWS windows of WINDOW_SECONDS each.
+WINDOW_SECONDS = 60
+WINDOWS = 5
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Other methods are reported as OTHER to bound the number of series.
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+_current = ContextVar("playlist_request_metrics", default=None)
+
+
+class RequestMetrics:
+    __slots__ = ("queries", "sql_time", "statements", "serializer_time", "serializing")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = Counter()
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    @property
+    def duplicate_queries(self):
+        return sum(count - 1 for count in self.statements.values())
+
+
+def current_metrics():
+    return _current.get()
+
+
+# Database execute wrapper. Statements are counted by their SQL with
+# placeholders, so the same query repeated with different parameters, the
+# signature of an N+1, counts as a duplicate.
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_time += time.perf_counter() - start
+        metrics.queries += 1
+        metrics.statements[sql] += 1
+
+
+# Wraps every connection, including those opened later by other threads, such
+# as the ones async views run their queries on.
+def install_execute_wrapper(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    # Estimated by linear interpolation inside the bucket holding the quantile.
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(BUCKETS):
+                    return BUCKETS[-1]
+                lower = BUCKETS[i - 1] if i else 0.0
+                return lower + (BUCKETS[i] - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.windows = deque(maxlen=WINDOWS)
+        self.queries = 0
+        self.duplicate_queries = 0
+        self.sql_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.response_bytes = 0
+
+    def observe(self, latency, metrics, size, now):
+        self.latency.observe(latency)
+        start = now - now % WINDOW_SECONDS
+        if not self.windows or self.windows[-1][0] != start:
+            self.windows.append((start, Histogram()))
+        self.windows[-1][1].observe(latency)
+        self.queries += metrics.queries
+        self.duplicate_queries += metrics.duplicate_queries
+        self.sql_seconds += metrics.sql_time
+        self.serializer_seconds += metrics.serializer_time
+        self.response_bytes += size or 0
+
+    def recent(self, now):
+        histogram = Histogram()
+        for start, window in self.windows:
+            if start > now - WINDOW_SECONDS * WINDOWS:
+                histogram.merge(window)
+        return histogram
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def observe(self, method, view, latency, metrics, size):
+        now = time.monotonic()
+        with self.lock:
+            stats = self.endpoints.get((method, view))
+            if stats is None:
+                stats = self.endpoints[(method, view)] = EndpointStats()
+            stats.observe(latency, metrics, size, now)
+
+    def clear(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def exposition(self):
+        now = time.monotonic()
+        lines = [
+            "# HELP playlist_metrics_sample_rate Fraction of requests measured.",
+            "# TYPE playlist_metrics_sample_rate gauge",
+            f"playlist_metrics_sample_rate {settings.PLAYLIST_METRICS_SAMPLE_RATE}",
+        ]
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            recent = [(key, stats.recent(now)) for key, stats in endpoints]
+
+        name = "playlist_request_duration_seconds"
+        lines += [
+            f"# HELP {name} Request latency.",
+            f"# TYPE {name} histogram",
+        ]
+        for (method, view), stats in endpoints:
+            labels = f'method="{method}",view="{view}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), stats.latency.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {stats.latency.sum}")
+            lines.append(f"{name}_count{{{labels}}} {stats.latency.count}")
+
+        name = "playlist_request_recent_duration_seconds"
+        lines += [
+            f"# HELP {name} Request latency percentiles over the last "
+            f"{WINDOW_SECONDS * WINDOWS} seconds.",
+            f"# TYPE {name} gauge",
+        ]
+        for (method, view), histogram in recent:
+            for q in QUANTILES:
+                lines.append(
+                    f'{name}{{method="{method}",view="{view}",quantile="{q}"}} '
+                    f"{histogram.quantile(q)}"
+                )
+
+        for attribute, help_text in [
+            ("queries", "SQL queries run."),
+            ("duplicate_queries", "SQL queries repeating an earlier statement."),
+            ("sql_seconds", "Time spent running SQL."),
+            ("serializer_seconds", "Time spent in serializers."),
+            ("response_bytes", "Response body bytes, streaming responses excluded."),
+        ]:
+            name = f"playlist_request_{attribute}_total"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (method, view), stats in endpoints:
+                lines.append(
+                    f'{name}{{method="{method}",view="{view}"}} '
+                    f"{getattr(stats, attribute)}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def server_timing(latency, metrics):
+    entries = [
+        f"total;dur={latency * 1000:.1f}",
+        f'sql;dur={metrics.sql_time * 1000:.1f};desc="{metrics.queries} queries, '
+        f'{metrics.duplicate_queries} duplicate"',
+    ]
+    if metrics.serializer_time:
+        entries.append(f"serialize;dur={metrics.serializer_time * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        connection_created.connect(
+            install_execute_wrapper, dispatch_uid="playlist_metrics"
+        )
+        for connection in connections.all(initialized_only=True):
+            install_execute_wrapper(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if random.random() >= settings.PLAYLIST_METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.PLAYLIST_METRICS_SAMPLE_RATE:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, start)
+
+    def finish(self, request, response, metrics, start):
+        latency = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unmatched"
+        size = None if response.streaming else len(response.content)
+        method = request.method if request.method in METHODS else "OTHER"
+        registry.observe(method, view, latency, metrics, size)
+        response["Server-Timing"] = server_timing(latency, metrics)
+        return response
+
+
+# Prometheus text exposition of the registry, for the addresses listed in
+# settings.PLAYLIST_METRICS_ALLOWED_IPS only.
+def metrics_view(request):
+    if request.META.get("REMOTE_ADDR") not in settings.PLAYLIST_METRICS_ALLOWED_IPS:
+        raise PermissionDenied
+    return HttpResponse(
+        registry.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
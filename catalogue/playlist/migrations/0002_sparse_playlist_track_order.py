@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import F, Max
+
+# Must match playlist.ordering.ORDER_GAP at the time of this migration.
+ORDER_GAP = 1024
+
+
+# Spaces the order keys of every existing playlist ORDER_GAP apart, keeping their
+# relative order, so tracks can be moved or inserted by writing a single row.
+def respace_orders(apps, schema_editor):
+    Playlist = apps.get_model("playlist", "Playlist")
+    PlaylistTrack = apps.get_model("playlist", "PlaylistTrack")
+
+    for playlist_id in Playlist.objects.values_list("pk", flat=True).iterator():
+        rows = PlaylistTrack.objects.filter(playlist_id=playlist_id)
+        pks = list(rows.order_by("order", "pk").values_list("pk", flat=True))
+        if not pks:
+            continue
+        # Shift every row above both the old and the new keys first, so no
+        # intermediate state violates the unique constraint.
+        offset = max(rows.aggregate(top=Max("order"))["top"], len(pks) * ORDER_GAP)
+        rows.update(order=F("order") + offset + 1)
+        PlaylistTrack.objects.bulk_update(
+            [
+                PlaylistTrack(pk=pk, order=position * ORDER_GAP)
+                for position, pk in enumerate(pks, 1)
+            ],
+            ["order"],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("playlist", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(respace_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("playlist", "0002_sparse_playlist_track_order"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="playlisttrack",
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name="album",
+            name="artist",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="albums",
+                to="playlist.artist",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="album",
+            name="title",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="artist",
+            name="name",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="playlist",
+            name="name",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="playlisttrack",
+            name="playlist",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="playlist.playlist",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="track",
+            name="title",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name="album",
+            index=models.Index(fields=["artist", "title"], name="album_artist_title"),
+        ),
+        migrations.AddConstraint(
+            model_name="playlisttrack",
+            constraint=models.UniqueConstraint(
+                fields=("playlist", "order"), name="playlisttrack_unique_order"
+            ),
+        ),
+    ]
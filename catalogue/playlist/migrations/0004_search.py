@@ -0,0 +1,77 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:47
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+# On PostgreSQL, search runs on GIN indexes over the full-text vector of each
+# searched field. The expression must match playlist.search.search_vector().
+SEARCH_INDEXES = [
+    ("artist", "name", "artist_name_search"),
+    ("album", "title", "album_title_search"),
+    ("track", "title", "track_title_search"),
+]
+
+
+def search_indexes(apps):
+    for model_name, field, name in SEARCH_INDEXES:
+        model = apps.get_model("playlist", model_name)
+        yield model, GinIndex(SearchVector(field, config="simple"), name=name)
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for model, index in search_indexes(apps):
+            schema_editor.add_index(model, index)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for model, index in search_indexes(apps):
+            schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("playlist", "0003_playlist_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("artist", "Artist"),
+                            ("album", "Album"),
+                            ("track", "Track"),
+                        ],
+                        max_length=6,
+                    ),
+                ),
+                ("term", models.CharField(max_length=64)),
+                ("object_id", models.BigIntegerField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["kind", "term"], name="searchterm_kind_term"),
+                    models.Index(
+                        fields=["kind", "object_id"], name="searchterm_kind_object"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.6 on 2026-10-18 08:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_summaries(apps, schema_editor):
+    Playlist = apps.get_model("playlist", "Playlist")
+    PlaylistTrack = apps.get_model("playlist", "PlaylistTrack")
+
+    def count(field, **extra):
+        rows = (
+            PlaylistTrack.objects.filter(playlist=OuterRef("pk"))
+            .order_by()
+            .values("playlist")
+            .annotate(count=Count(field, **extra))
+            .values("count")
+        )
+        return Coalesce(Subquery(rows), Value(0))
+
+    Playlist.objects.update(
+        track_count=count("pk"),
+        artist_count=count("track__album__artist", distinct=True),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("playlist", "0004_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="playlist",
+            name="artist_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="playlist",
+            name="last_modified",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="playlist",
+            name="track_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,111 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("playlist", "0006_change_log"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimilarityState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("cursor", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="StaleTrack",
+            fields=[
+                ("track_id", models.BigIntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SimilarPlaylist",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("count", models.PositiveIntegerField()),
+                (
+                    "playlist",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="playlist.playlist",
+                    ),
+                ),
+                (
+                    "similar",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="playlist.playlist",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SimilarTrack",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("count", models.PositiveIntegerField()),
+                (
+                    "similar",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="playlist.track",
+                    ),
+                ),
+                (
+                    "track",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="playlist.track",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="similarplaylist",
+            constraint=models.UniqueConstraint(
+                fields=("playlist", "similar"), name="similarplaylist_unique"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="similartrack",
+            constraint=models.UniqueConstraint(
+                fields=("track", "similar"), name="similartrack_unique"
+            ),
+        ),
+    ]
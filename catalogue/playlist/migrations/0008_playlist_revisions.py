@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("playlist", "0007_similarity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlaylistRevision",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("number", models.PositiveIntegerField()),
+                ("base", models.PositiveIntegerField()),
+                ("data", models.JSONField()),
+                ("track_count", models.PositiveIntegerField()),
+                ("created", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "playlist",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="revisions",
+                        to="playlist.playlist",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="playlistrevision",
+            constraint=models.UniqueConstraint(
+                fields=("playlist", "number"), name="playlistrevision_unique"
+            ),
+        ),
+    ]
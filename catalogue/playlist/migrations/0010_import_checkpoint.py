@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("playlist", "0009_job_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source", models.CharField(max_length=1024, unique=True)),
+                ("rows", models.PositiveBigIntegerField(default=0)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_playlist_artists(apps, schema_editor):
+    PlaylistArtist = apps.get_model("playlist", "PlaylistArtist")
+    PlaylistTrack = apps.get_model("playlist", "PlaylistTrack")
+    counts = (
+        PlaylistTrack.objects.order_by()
+        .values_list("playlist_id", "track__album__artist_id")
+        .annotate(tracks=Count("pk"))
+    )
+    batch = []
+    for playlist_id, artist_id, tracks in counts.iterator():
+        batch.append(
+            PlaylistArtist(playlist_id=playlist_id, artist_id=artist_id, tracks=tracks)
+        )
+        if len(batch) >= 1000:
+            PlaylistArtist.objects.bulk_create(batch)
+            batch = []
+    PlaylistArtist.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("playlist", "0010_import_checkpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlaylistArtist",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tracks", models.PositiveIntegerField()),
+                (
+                    "artist",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="playlist.artist",
+                    ),
+                ),
+                (
+                    "playlist",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="playlist.playlist",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="playlistartist",
+            constraint=models.UniqueConstraint(
+                fields=("playlist", "artist"), name="playlistartist_unique"
+            ),
+        ),
+        migrations.RunPython(fill_playlist_artists, migrations.RunPython.noop),
+    ]
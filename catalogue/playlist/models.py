@@ -1,10 +1,11 @@
 import uuid
 
 from django.db import models
+from django.utils import timezone
 
 
 class Artist(models.Model):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, db_index=True)
 
     def __str__(self):
         return self.name
@@ -12,15 +13,22 @@ class Artist(models.Model):
 
 # Use related_name to specify a clear reverse relation.
 class Album(models.Model):
-    title = models.CharField(max_length=255)
-    artist = models.ForeignKey(Artist, related_name="albums", on_delete=models.CASCADE)
+    title = models.CharField(max_length=255, db_index=True)
+    # Covered by the (artist, title) index below.
+    artist = models.ForeignKey(
+        Artist, related_name="albums", on_delete=models.CASCADE, db_index=False
+    )
+
+    class Meta:
+        # "albums by artist", optionally ordered or filtered by title.
+        indexes = [models.Index(fields=["artist", "title"], name="album_artist_title")]
 
     def __str__(self):
         return self.title
 
 
 class Track(models.Model):
-    title = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, db_index=True)
     album = models.ForeignKey(Album, related_name="tracks", on_delete=models.CASCADE)
 
     def __str__(self):
@@ -30,20 +38,225 @@ class Track(models.Model):
 # Intermediary model, allows you to add extra fields to the relationship
 class Playlist(models.Model):
     uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, db_index=True)
     tracks = models.ManyToManyField(Track, through="PlaylistTrack")
+    # Summary of the playlist's tracks, kept up to date by playlist/summary.py so
+    # that list views never have to aggregate PlaylistTrack.
+    track_count = models.PositiveIntegerField(default=0, editable=False)
+    artist_count = models.PositiveIntegerField(default=0, editable=False)
+    last_modified = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
 
 class PlaylistTrack(models.Model):
-    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE)
+    # Covered by the (playlist, order) unique constraint below.
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, db_index=False)
     track = models.ForeignKey(Track, on_delete=models.CASCADE)
     order = models.PositiveIntegerField()
 
     class Meta:
         # The query results for PlaylistTrack will be ordered by the order field in ascending order by default.
         ordering = ["order"]
-        # It ensures that there cannot be duplicate combinations of playlist, track, and order in the table.
-        unique_together = ["playlist", "track", "order"]
+        # Each position of a playlist holds one track. The constraint's index also
+        # serves "tracks of a playlist ordered by order" without a sort.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["playlist", "order"], name="playlisttrack_unique_order"
+            )
+        ]
+
+
+# Number of rows of a playlist whose track is by `artist`, one row per distinct
+# artist, so Playlist.artist_count is the number of these rows. Single-row edits
+# move the counts without aggregating the playlist; see playlist/summary.py.
+class PlaylistArtist(models.Model):
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, db_index=False)
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE)
+    tracks = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["playlist", "artist"], name="playlistartist_unique"
+            )
+        ]
+
+
+# Inverted index of the words in artist names and album and track titles, used for
+# search on databases without full-text search (see playlist/search.py). Kept up
+# to date by signals and the bulk import.
+class SearchTerm(models.Model):
+    KIND_CHOICES = [("artist", "Artist"), ("album", "Album"), ("track", "Track")]
+
+    kind = models.CharField(max_length=6, choices=KIND_CHOICES)
+    term = models.CharField(max_length=64)
+    object_id = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            # Prefix lookups are range scans on (kind, term).
+            models.Index(fields=["kind", "term"], name="searchterm_kind_term"),
+            models.Index(fields=["kind", "object_id"], name="searchterm_kind_object"),
+        ]
+
+    def __str__(self):
+        return self.term
+
+
+# Change feed read by /api/changes/: one row per create, update or delete of a
+# catalogue or playlist object, in write order. See playlist/changes.py.
+class Change(models.Model):
+    ACTION_CHOICES = [("create", "Create"), ("update", "Update"), ("delete", "Delete")]
+
+    # The model name of the changed object: artist, album, track, playlist or
+    # playlisttrack.
+    kind = models.CharField(max_length=13)
+    object_id = models.CharField(max_length=36)
+    action = models.CharField(max_length=6, choices=ACTION_CHOICES)
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Finds the entries an object's newest entry supersedes, for
+            # compaction.
+            models.Index(fields=["kind", "object_id", "id"], name="change_object"),
+            models.Index(fields=["created"], name="change_created"),
+        ]
+
+    def __str__(self):
+        return f"{self.action} {self.kind} {self.object_id}"
+
+
+# The tracks sharing the most playlists with each track, and the playlists
+# sharing the most tracks with each playlist, top SIMILAR_LIMIT of each. Built
+# and kept up to date by playlist/similarity.py.
+class SimilarTrack(models.Model):
+    # Covered by the (track, similar) unique constraint below.
+    track = models.ForeignKey(
+        Track, related_name="+", on_delete=models.CASCADE, db_index=False
+    )
+    similar = models.ForeignKey(Track, related_name="+", on_delete=models.CASCADE)
+    # Number of playlists holding both tracks.
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["track", "similar"], name="similartrack_unique"
+            )
+        ]
+
+
+class SimilarPlaylist(models.Model):
+    # Covered by the (playlist, similar) unique constraint below.
+    playlist = models.ForeignKey(
+        Playlist, related_name="+", on_delete=models.CASCADE, db_index=False
+    )
+    similar = models.ForeignKey(Playlist, related_name="+", on_delete=models.CASCADE)
+    # Number of distinct tracks both playlists hold.
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["playlist", "similar"], name="similarplaylist_unique"
+            )
+        ]
+
+
+# Tracks removed from a playlist since the last similarity refresh. The change
+# log names the playlists that changed, but not the tracks they lost. Not a
+# foreign key: the track may be being deleted.
+class StaleTrack(models.Model):
+    track_id = models.BigIntegerField(primary_key=True)
+
+
+# Position of the similarity refresh in the change log. A single row.
+class SimilarityState(models.Model):
+    cursor = models.BigIntegerField(default=0)
+
+
+# Track lists of past versions of a playlist, numbered from 1. Most revisions
+# store a delta against the previous one; every so often one stores the whole
+# list, so a version is rebuilt from its checkpoint and at most a bounded number
+# of deltas. See playlist/revisions.py.
+class PlaylistRevision(models.Model):
+    # Covered by the (playlist, number) unique constraint below.
+    playlist = models.ForeignKey(
+        Playlist, related_name="revisions", on_delete=models.CASCADE, db_index=False
+    )
+    number = models.PositiveIntegerField()
+    # Number of the checkpoint the revision is rebuilt from; its own number for a
+    # checkpoint.
+    base = models.PositiveIntegerField()
+    # The track ids of a checkpoint, or the operations of a delta.
+    data = models.JSONField()
+    track_count = models.PositiveIntegerField()
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["playlist", "number"], name="playlistrevision_unique"
+            )
+        ]
+
+    @property
+    def is_checkpoint(self):
+        return self.base == self.number
+
+    def __str__(self):
+        return f"{self.playlist_id} #{self.number}"
+
+
+# Rows of `source` committed by `manage.py import_catalogue`, saved in the
+# transaction of each batch so a failed import resumes exactly after it.
+class ImportCheckpoint(models.Model):
+    # Absolute path of the imported file.
+    source = models.CharField(max_length=1024, unique=True)
+    rows = models.PositiveBigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} ({self.rows} rows)"
+
+
+# Queue of background jobs run by `manage.py run_workers`. See playlist/jobs.py.
+class Job(models.Model):
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    # Name of the handler, and the keyword arguments it is called with.
+    kind = models.CharField(max_length=64)
+    arguments = models.JSONField(default=dict)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=QUEUED)
+    # Units of work committed so far, out of `total` when the handler knows it.
+    progress = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # A queued job is not started before this time, which delays retries.
+    run_after = models.DateTimeField(default=timezone.now)
+    # The worker running the job, and when its claim lapses unless renewed.
+    worker = models.CharField(max_length=128, blank=True)
+    lease_expires = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers pick the next queued job, and expired running ones.
+            models.Index(fields=["status", "run_after"], name="job_ready"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk}"
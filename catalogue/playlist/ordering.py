@@ -0,0 +1,143 @@
+from django.db import transaction
+from django.db.models import F, Max
+
+from .bulk import BULK_BATCH_SIZE
+from .cache import invalidate_playlist
+from .changes import CREATE, UPDATE, record_playlist_tracks
+from .models import Playlist, PlaylistTrack
+from .revisions import record_revision
+from .summary import count_artists, update_summary
+
+# PlaylistTrack.order is a sparse sort key: rows are spaced ORDER_GAP apart, and a
+# track moved or inserted between two rows takes the midpoint of their keys. A move
+# therefore writes a single row; the playlist is only renumbered once two
+# neighbouring keys are adjacent.
+ORDER_GAP = 1024
+
+# Passed as `after` to place a track at the end of the playlist.
+END = "end"
+
+
+class OrderError(Exception):
+    pass
+
+
+# Locks the playlist row so concurrent edits of the same playlist are serialized.
+def lock_playlist(uuid):
+    try:
+        return Playlist.objects.select_for_update().only("uuid").get(pk=uuid)
+    except Playlist.DoesNotExist:
+        raise OrderError("Playlist does not exist.")
+
+
+def get_row(playlist, order):
+    row = PlaylistTrack.objects.filter(playlist=playlist, order=order).first()
+    if row is None:
+        raise OrderError(f"No track at order {order}.")
+    return row
+
+
+# Returns a key that sorts directly after the row at `after` (first when `after`
+# is None, last when it is END), renumbering the playlist if there is no room.
+def order_after(playlist, after, exclude=None):
+    rows = PlaylistTrack.objects.filter(playlist=playlist)
+    if exclude is not None:
+        rows = rows.exclude(pk=exclude)
+    if after == END:
+        return (rows.aggregate(top=Max("order"))["top"] or 0) + ORDER_GAP
+
+    after_pk = None
+    if after is not None:
+        after_pk = rows.filter(order=after).values_list("pk", flat=True).first()
+        if after_pk is None:
+            raise OrderError(f"No track at order {after}.")
+
+    while True:
+        # -1 sorts before any key, including 0.
+        if after_pk is None:
+            low = -1
+        else:
+            low = rows.filter(pk=after_pk).values_list("order", flat=True).get()
+        high = (
+            rows.filter(order__gt=low)
+            .order_by("order")
+            .values_list("order", flat=True)
+            .first()
+        )
+        if high is None:
+            return max(low, 0) + ORDER_GAP
+        if high - low > 1:
+            return (low + high) // 2
+        # After renumbering every gap is ORDER_GAP wide, so this runs at most once.
+        renumber(playlist)
+
+
+# Rewrites the keys of a playlist to ORDER_GAP, 2 * ORDER_GAP, ... in their
+# current order. Every row is first shifted above both the old and the new keys so
+# no intermediate state violates the unique constraint.
+def renumber(playlist):
+    rows = PlaylistTrack.objects.filter(playlist=playlist)
+    pks = list(rows.order_by("order", "pk").values_list("pk", flat=True))
+    if not pks:
+        return
+    offset = max(rows.aggregate(top=Max("order"))["top"], len(pks) * ORDER_GAP)
+    rows.update(order=F("order") + offset + 1)
+    PlaylistTrack.objects.bulk_update(
+        [
+            PlaylistTrack(pk=pk, order=position * ORDER_GAP)
+            for position, pk in enumerate(pks, 1)
+        ],
+        ["order"],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    record_playlist_tracks(UPDATE, pks, [playlist.pk])
+    invalidate_playlist(playlist.pk)
+
+
+@transaction.atomic
+def insert_track(uuid, track_id, after=END):
+    playlist = lock_playlist(uuid)
+    order = order_after(playlist, after)
+    return PlaylistTrack.objects.create(
+        playlist=playlist, track_id=track_id, order=order
+    )
+
+
+@transaction.atomic
+def append_tracks(uuid, track_ids):
+    playlist = lock_playlist(uuid)
+    top = PlaylistTrack.objects.filter(playlist=playlist).aggregate(top=Max("order"))
+    start = top["top"] or 0
+    rows = PlaylistTrack.objects.bulk_create(
+        [
+            PlaylistTrack(
+                playlist=playlist, track_id=track_id, order=start + i * ORDER_GAP
+            )
+            for i, track_id in enumerate(track_ids, 1)
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    record_playlist_tracks(CREATE, [row.pk for row in rows], [playlist.pk])
+    if rows:
+        record_revision(playlist.pk, [("insert", rows[0].order, list(track_ids))])
+    count_artists(playlist.pk, added=list(track_ids))
+    update_summary([playlist.pk], track_delta=len(rows), artists=False)
+    invalidate_playlist(playlist.pk)
+    return rows
+
+
+@transaction.atomic
+def move_track(uuid, order, after=END):
+    playlist = lock_playlist(uuid)
+    row = get_row(playlist, order)
+    if after == order:
+        return row
+    row.order = order_after(playlist, after, exclude=row.pk)
+    row.save(update_fields=["order"])
+    return row
+
+
+@transaction.atomic
+def remove_track(uuid, order):
+    playlist = lock_playlist(uuid)
+    get_row(playlist, order).delete()
@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination
+
+
+# Keyset pagination: each page is fetched with WHERE pk > <cursor> ORDER BY pk,
+# so a deep page costs the same as the first one and no COUNT(*) is run.
+class PrimaryKeyCursorPagination(CursorPagination):
+    ordering = "pk"
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+# Tracks of a single playlist are paged by their position in the playlist, so
+# the cursor is keyed on (playlist, order).
+class PlaylistTrackCursorPagination(PrimaryKeyCursorPagination):
+    ordering = "order"
+
+
+# The same, starting from the newest rows.
+class NewestFirstCursorPagination(PrimaryKeyCursorPagination):
+    ordering = "-pk"
@@ -0,0 +1,64 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Converts the values orjson and msgpack do not encode natively the same way the
+# stdlib renderer does: datetimes, decimals, lazy strings and so on.
+_default = JSONEncoder().default
+
+
+# JSONRenderer that encodes with orjson when it is installed, falling back to
+# DRF's stdlib encoder otherwise, or when the client asks for indented output.
+# Both produce the same bytes for the payloads the API returns.
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        content = orjson.dumps(
+            data,
+            default=_default,
+            # Datetimes go through _default, which writes UTC as Z like DRF.
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        # Escaped by DRF as well: these are valid JSON but not valid JavaScript.
+        return content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+# MessagePack for internal consumers that send Accept: application/msgpack.
+# Only offered when the msgpack package is installed.
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+    available = msgpack is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+# Leaves out renderers whose optional dependency is missing, so asking for
+# their media type gets a 406 rather than an error.
+class PlaylistContentNegotiation(DefaultContentNegotiation):
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderers = [
+            renderer for renderer in renderers if getattr(renderer, "available", True)
+        ]
+        return super().select_renderer(request, renderers, format_suffix)
@@ -0,0 +1,382 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.db import transaction
+
+from .bulk import BULK_BATCH_SIZE
+from .models import Playlist, PlaylistRevision, PlaylistTrack
+
+# Every edit of a playlist's tracks records a revision holding the new track
+# list. A version is a list of track ids in order; order keys are not kept, a
+# restored version is renumbered.
+#
+# A delta rebuilds the new list from the previous one as a list of runs:
+# ["c", start, length] copies `length` tracks of the previous list from `start`,
+# ["i", track, ...] inserts tracks. Removed runs are the parts never copied and
+# moved runs are copies out of order, so an edit of a few runs stores a few runs
+# whatever the length of the playlist. Every REVISION_CHECKPOINT_INTERVAL
+# revisions, or when the delta would not be smaller, the full list is stored
+# instead, which bounds the deltas applied to rebuild a version.
+#
+# Single-row writes pass the edit they made, and their delta is built from it
+# against the latest revision's length, without reading the playlist's tracks.
+# Bulk writes let record_revision diff the whole list.
+
+REVISION_CHECKPOINT_INTERVAL = 50
+
+# Earlier positions of a track tried when looking for the longest run to copy.
+# Only matters for tracks listed many times.
+DELTA_CANDIDATES = 8
+
+REVISIONS_DEFAULT_LIMIT = 50
+REVISIONS_MAX_LIMIT = 1000
+
+
+class RevisionError(Exception):
+    pass
+
+
+def playlist_sequence(playlist_id):
+    return list(
+        PlaylistTrack.objects.filter(playlist_id=playlist_id)
+        .order_by("order")
+        .values_list("track_id", flat=True)
+    )
+
+
+def encode_delta(old, new):
+    positions = defaultdict(list)
+    for index, track in enumerate(old):
+        positions[track].append(index)
+    delta = []
+    index = 0
+    while index < len(new):
+        start, length = None, 0
+        for candidate in positions.get(new[index], ())[:DELTA_CANDIDATES]:
+            size = 1
+            while (
+                index + size < len(new)
+                and candidate + size < len(old)
+                and old[candidate + size] == new[index + size]
+            ):
+                size += 1
+            if size > length:
+                start, length = candidate, size
+        if length:
+            delta.append(["c", start, length])
+            index += length
+        else:
+            if not delta or delta[-1][0] != "i":
+                delta.append(["i"])
+            delta[-1].append(new[index])
+            index += 1
+    return delta
+
+
+def apply_delta(old, delta):
+    new = []
+    for run in delta:
+        if run[0] == "c":
+            new.extend(old[run[1] : run[1] + run[2]])
+        else:
+            new.extend(run[1:])
+    return new
+
+
+# Number of values stored, the measure used to choose between a delta and a
+# checkpoint.
+def delta_size(delta):
+    return sum(len(run) for run in delta)
+
+
+# Rebuilds the track list of `revision` from its checkpoint, in one query.
+def rebuild(revision):
+    if revision.is_checkpoint:
+        return list(revision.data)
+    runs = (
+        PlaylistRevision.objects.filter(
+            playlist_id=revision.playlist_id,
+            number__gte=revision.base,
+            number__lte=revision.number,
+        )
+        .order_by("number")
+        .values_list("data", flat=True)
+    )
+    tracks, *deltas = runs
+    for delta in deltas:
+        tracks = apply_delta(tracks, delta)
+    return tracks
+
+
+def revision_tracks(playlist_id, number):
+    revision = PlaylistRevision.objects.filter(
+        playlist_id=playlist_id, number=number
+    ).first()
+    if revision is None:
+        raise RevisionError(f"No revision {number}.")
+    return rebuild(revision)
+
+
+def run_length(run):
+    return run[2] if run[0] == "c" else len(run) - 1
+
+
+# Splits the runs of a delta into those before and after `position` of the list
+# they build.
+def cut_runs(runs, position):
+    for index, run in enumerate(runs):
+        size = run_length(run)
+        if position < size:
+            if position == 0:
+                return runs[:index], runs[index:]
+            if run[0] == "c":
+                head = ["c", run[1], position]
+                tail = ["c", run[1] + position, size - position]
+            else:
+                head = run[: position + 1]
+                tail = ["i", *run[position + 1 :]]
+            return runs[:index] + [head], [tail] + runs[index + 1 :]
+        position -= size
+    if position:
+        raise ValueError("Position past the end of the list.")
+    return runs, []
+
+
+def splice_runs(runs, position, count, inserted):
+    before, rest = cut_runs(runs, position)
+    removed, after = cut_runs(rest, count)
+    if sum(run_length(run) for run in removed) != count:
+        raise ValueError("Position past the end of the list.")
+    return before + inserted + after
+
+
+# Joins copies of adjacent runs and neighbouring inserts.
+def merge_runs(runs):
+    merged = []
+    for run in runs:
+        if not run_length(run):
+            continue
+        last = merged[-1] if merged else None
+        if last and last[0] == run[0] == "c" and last[1] + last[2] == run[1]:
+            last[2] += run[2]
+        elif last and last[0] == run[0] == "i":
+            last.extend(run[1:])
+        else:
+            merged.append(list(run))
+    return merged
+
+
+# The delta of `edits`, a list of ("insert", position, tracks),
+# ("remove", position), ("replace", position, track) and ("move", position, to)
+# applied in turn to a list of `length` tracks. Raises ValueError for a position
+# outside the list.
+def edit_delta(length, edits):
+    runs = [["c", 0, length]]
+    for kind, position, *value in edits:
+        if kind == "insert":
+            runs = splice_runs(runs, position, 0, [["i", *value[0]]])
+        elif kind == "remove":
+            runs = splice_runs(runs, position, 1, [])
+        elif kind == "replace":
+            runs = splice_runs(runs, position, 1, [["i", value[0]]])
+        else:
+            moved = cut_runs(cut_runs(runs, position)[1], 1)[0]
+            runs = splice_runs(runs, position, 1, [])
+            runs = splice_runs(runs, value[0], 0, moved)
+    return merge_runs(runs)
+
+
+# Turns row edits given by order key, as written to the database, into edits by
+# position in the track list, counting the rows before each key. `edits` holds
+# ("insert", order, tracks) for rows now at `order` and after it, ("remove",
+# orders) for rows deleted together, ("replace", order, track) and
+# ("move", old order, order) for a row moved from `old order`.
+def positional_edits(playlist_id, edits):
+    rows = PlaylistTrack.objects.filter(playlist_id=playlist_id)
+
+    def position(order):
+        return rows.filter(order__lt=order).count()
+
+    positions = []
+    for kind, *values in edits:
+        if kind == "insert":
+            positions.append(("insert", position(values[0]), values[1]))
+        elif kind == "remove":
+            # Every removed row is gone, so a key's position in the list that
+            # still has them counts the removed keys before it. They are removed
+            # from the last, which leaves the earlier positions valid. The rows
+            # left between the first and last key place every key with one
+            # query, instead of a count per key.
+            removed = sorted(values[0])
+            first = position(removed[0])
+            between = []
+            if len(removed) > 1:
+                between = list(
+                    rows.filter(order__gt=removed[0], order__lt=removed[-1])
+                    .order_by("order")
+                    .values_list("order", flat=True)
+                )
+            positions.extend(
+                ("remove", first + bisect_left(between, order) + index)
+                for index, order in reversed(list(enumerate(removed)))
+            )
+        elif kind == "replace":
+            positions.append(("replace", position(values[0]), values[1]))
+        else:
+            old, new = values
+            before = position(old) - (1 if new < old else 0)
+            positions.append(("move", before, position(new)))
+    return positions
+
+
+# Records the current track list of the playlist as a new revision, unless it
+# equals the latest one. Called by every write path in the transaction of the
+# edit; the playlist row is locked so concurrent edits number their revisions in
+# turn, and `edits` (see positional_edits) are read after the lock. Called in
+# autocommit mode, as the signals are by a plain save(), it runs in a
+# transaction of its own. Returns the revision, or None.
+@transaction.atomic
+def record_revision(playlist_id, edits=None):
+    if not Playlist.objects.select_for_update().filter(pk=playlist_id).exists():
+        return None
+    # The data of the latest revision is only loaded to diff the whole list.
+    latest = (
+        PlaylistRevision.objects.filter(playlist_id=playlist_id)
+        .defer("data")
+        .order_by("-number")
+        .first()
+    )
+    if latest is None:
+        tracks = playlist_sequence(playlist_id)
+        return PlaylistRevision.objects.create(
+            playlist_id=playlist_id,
+            number=1,
+            base=1,
+            data=tracks,
+            track_count=len(tracks),
+        )
+
+    number = latest.number + 1
+    checkpoint = number - latest.base >= REVISION_CHECKPOINT_INTERVAL
+    if edits is not None and not checkpoint:
+        try:
+            delta = edit_delta(latest.track_count, positional_edits(playlist_id, edits))
+        except ValueError:
+            # The rows do not match the latest revision; diff the whole list.
+            delta = None
+        if delta is not None:
+            length = sum(run_length(run) for run in delta)
+            if delta == merge_runs([["c", 0, latest.track_count]]):
+                return None
+            if delta_size(delta) < length:
+                return PlaylistRevision.objects.create(
+                    playlist_id=playlist_id,
+                    number=number,
+                    base=latest.base,
+                    data=delta,
+                    track_count=length,
+                )
+
+    tracks = playlist_sequence(playlist_id)
+    previous = rebuild(latest)
+    if previous == tracks:
+        return None
+    delta = encode_delta(previous, tracks)
+    if checkpoint or delta_size(delta) >= len(tracks):
+        base, data = number, tracks
+    else:
+        base, data = latest.base, delta
+    return PlaylistRevision.objects.create(
+        playlist_id=playlist_id,
+        number=number,
+        base=base,
+        data=data,
+        track_count=len(tracks),
+    )
+
+
+# Records the first revision of new playlists whose tracks the caller wrote, as
+# {uuid: track ids in order}.
+def record_initial_revisions(sequences):
+    PlaylistRevision.objects.bulk_create(
+        [
+            PlaylistRevision(
+                playlist_id=uuid,
+                number=1,
+                base=1,
+                data=list(tracks),
+                track_count=len(tracks),
+            )
+            for uuid, tracks in sequences.items()
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+
+# Runs turning the track list `old` into `new`, read from their delta: inserted
+# runs with their position in `new`, removed runs with their position in `old`,
+# and moved runs with both. Copies along the longest (in tracks) chain in `old`
+# order are kept in place; the other copies are moves.
+def diff_tracks(old, new):
+    runs = []
+    copies = []
+    position = 0
+    for run in encode_delta(old, new):
+        if run[0] == "c":
+            copies.append((run[1], run[2], position))
+            position += run[2]
+        else:
+            runs.append({"action": "insert", "to": position, "tracks": run[1:]})
+            position += len(run) - 1
+
+    kept = kept_copies(copies)
+    copied = [False] * len(old)
+    for index, (start, length, position) in enumerate(copies):
+        copied[start : start + length] = [True] * length
+        if index not in kept:
+            runs.append(
+                {
+                    "action": "move",
+                    "from": start,
+                    "to": position,
+                    "tracks": old[start : start + length],
+                }
+            )
+    start = None
+    for index, done in enumerate(copied + [True]):
+        if not done and start is None:
+            start = index
+        elif done and start is not None:
+            runs.append({"action": "remove", "from": start, "tracks": old[start:index]})
+            start = None
+    return sorted(runs, key=lambda run: run.get("to", run.get("from")))
+
+
+# Indexes of the copies forming the heaviest chain with increasing starts: a
+# weighted longest increasing subsequence, with a Fenwick tree of prefix maxima
+# over the starts.
+def kept_copies(copies):
+    starts = {
+        start: rank for rank, start in enumerate(sorted({c[0] for c in copies}), 1)
+    }
+    tree = [(0, -1)] * (len(starts) + 1)
+    best = []
+    previous = []
+    for index, (start, length, _) in enumerate(copies):
+        rank = starts[start] - 1
+        weight, before = 0, -1
+        while rank:
+            weight, before = max((weight, before), tree[rank])
+            rank -= rank & -rank
+        best.append(weight + length)
+        previous.append(before)
+        rank = starts[start]
+        while rank < len(tree):
+            tree[rank] = max(tree[rank], (best[index], index))
+            rank += rank & -rank
+    kept = set()
+    index = max(range(len(best)), key=best.__getitem__, default=-1)
+    while index != -1:
+        kept.add(index)
+        index = previous[index]
+    return kept
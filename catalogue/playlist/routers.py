@@ -0,0 +1,118 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Clients that wrote recently get this cookie, and read from the primary until
+# it expires, so they see their own writes even when the replicas lag behind.
+PRIMARY_COOKIE = "playlist_primary"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReadRouting:
+    def __init__(self, replicas):
+        self.replicas = replicas
+
+
+_routing = ContextVar("playlist_read_routing", default=None)
+
+
+def replica_aliases():
+    return list(settings.PLAYLIST_READ_REPLICAS)
+
+
+# Sends reads to a random alias of settings.PLAYLIST_READ_REPLICAS, but only
+# while ReplicaRoutingMiddleware handles a read-only request. Everything else,
+# management commands, tests and writes, uses the primary. The first write of a
+# request pins the rest of it to the primary, as do reads inside a transaction.
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or not routing.replicas:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return random.choice(routing.replicas)
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.replicas = []
+        return DEFAULT_DB_ALIAS
+
+    # The replicas hold the same rows as the primary.
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    # Replicas get their schema through replication.
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_aliases():
+            return False
+        return None
+
+
+# Sends the reads inside the block to the primary. Used to fill the response
+# cache: the version of a playlist is bumped by its writes, so rows read from a
+# lagging replica would be cached under the new version and served as current.
+@contextmanager
+def primary_reads():
+    token = _routing.set(None)
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+# Lets ReplicaRouter use the replicas for GET, HEAD and OPTIONS requests from
+# clients without the PRIMARY_COOKIE. Responses to other methods set the cookie
+# for settings.PLAYLIST_REPLICA_STICKY_SECONDS, a bound on replication lag.
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _routing.set(ReadRouting(self.replicas_for(request)))
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = _routing.set(ReadRouting(self.replicas_for(request)))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(request, response)
+
+    def replicas_for(self, request):
+        if request.method not in SAFE_METHODS or PRIMARY_COOKIE in request.COOKIES:
+            return []
+        return replica_aliases()
+
+    def finish(self, request, response):
+        if request.method not in SAFE_METHODS and replica_aliases():
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                "1",
+                max_age=settings.PLAYLIST_REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
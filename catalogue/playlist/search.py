@@ -0,0 +1,175 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+
+from .models import Artist, Album, Track, SearchTerm
+from .bulk import BULK_BATCH_SIZE
+
+# Searchable models and the text field each one is searched on.
+SEARCH_FIELDS = {
+    "artist": (Artist, "name"),
+    "album": (Album, "title"),
+    "track": (Track, "title"),
+}
+
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 100
+
+# Words of a query beyond this are ignored.
+MAX_QUERY_TERMS = 8
+
+# Sorts after every string, so [term, term + MAX_CHAR) is a prefix range.
+MAX_CHAR = chr(0x10FFFF)
+
+TERM_LENGTH = SearchTerm._meta.get_field("term").max_length
+
+
+def tokenize(text):
+    terms = []
+    for word in re.findall(r"\w+", text.lower()):
+        word = word[:TERM_LENGTH]
+        if word not in terms:
+            terms.append(word)
+    return terms
+
+
+# On PostgreSQL, search uses the GIN full-text indexes created in migration 0004.
+# Other databases use the SearchTerm table.
+def uses_term_index():
+    return connection.vendor != "postgresql"
+
+
+def search_vector(field):
+    # Must match the indexed expression exactly for the index to be used.
+    return SearchVector(field, config="simple")
+
+
+# Returns the matching objects of one kind, best match first. Every word of the
+# query must match the start of a word in the name or title.
+def search(kind, query, limit=SEARCH_DEFAULT_LIMIT, queryset=None):
+    model, field = SEARCH_FIELDS[kind]
+    if queryset is None:
+        queryset = model.objects.all()
+    terms = tokenize(query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+
+    if not uses_term_index():
+        tsquery = SearchQuery(
+            " & ".join(f"{term}:*" for term in terms),
+            search_type="raw",
+            config="simple",
+        )
+        return list(
+            queryset.annotate(search=search_vector(field))
+            .filter(search=tsquery)
+            .annotate(rank=SearchRank(search_vector(field), tsquery))
+            .order_by("-rank", "pk")[:limit]
+        )
+
+    ids = search_term_ids(kind, terms, limit)
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def search_term_ids(kind, terms, limit):
+    # A word that starts another query word adds nothing: whatever matches the
+    # longer word matches it too. Dropping those leaves each indexed term matching
+    # at most one query word, so counting the distinct words matched gives AND.
+    terms = [
+        term
+        for term in terms
+        if not any(other != term and other.startswith(term) for other in terms)
+    ]
+    prefixes = [Q(term__gte=term, term__lt=term + MAX_CHAR) for term in terms]
+    match = Q()
+    for prefix in prefixes:
+        match |= prefix
+
+    rows = (
+        SearchTerm.objects.filter(match, kind=kind)
+        .values("object_id")
+        .annotate(
+            matched=Count(
+                Case(
+                    *[When(prefix, then=Value(i)) for i, prefix in enumerate(prefixes)]
+                ),
+                distinct=True,
+            ),
+            # Whole-word matches rank above prefix matches.
+            score=Sum(Case(When(term__in=terms, then=Value(2)), default=Value(1))),
+        )
+        .filter(matched=len(terms))
+        .order_by("-score", "object_id")[:limit]
+    )
+    return [row["object_id"] for row in rows]
+
+
+# Adds the terms of the given objects to the SearchTerm table; `replace` first
+# removes their existing terms, which new objects do not have.
+def index_objects(kind, objects, replace=True):
+    if not uses_term_index():
+        return
+    _, field = SEARCH_FIELDS[kind]
+    objects = list(objects)
+    if replace:
+        unindex_objects(kind, [obj.pk for obj in objects])
+    SearchTerm.objects.bulk_create(
+        [
+            SearchTerm(kind=kind, term=term, object_id=obj.pk)
+            for obj in objects
+            for term in tokenize(getattr(obj, field))
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+
+def unindex_objects(kind, pks):
+    if not uses_term_index():
+        return
+    for start in range(0, len(pks), BULK_BATCH_SIZE):
+        SearchTerm.objects.filter(
+            kind=kind, object_id__in=pks[start : start + BULK_BATCH_SIZE]
+        ).delete()
+
+
+# Typeahead for the track picker: tracks whose title matches come first, then
+# tracks of matching albums and artists. Returns one page of plain dicts with
+# the album and artist names, read in a single joined query.
+def autocomplete_tracks(query, limit=SEARCH_DEFAULT_LIMIT, offset=0):
+    wanted = offset + limit
+    ids = [
+        track.pk for track in search("track", query, wanted, Track.objects.only("pk"))
+    ]
+    if len(ids) < wanted:
+        album_ids = [
+            album.pk
+            for album in search("album", query, wanted, Album.objects.only("pk"))
+        ]
+        artist_ids = [
+            artist.pk
+            for artist in search("artist", query, wanted, Artist.objects.only("pk"))
+        ]
+        album_ids += Album.objects.filter(artist_id__in=artist_ids).values_list(
+            "pk", flat=True
+        )[:wanted]
+        ids += (
+            Track.objects.filter(album_id__in=album_ids)
+            .exclude(pk__in=ids)
+            .order_by("album_id", "pk")
+            .values_list("pk", flat=True)[: wanted - len(ids)]
+        )
+
+    ids = ids[offset:wanted]
+    rows = {
+        row["id"]: row
+        for row in Track.objects.filter(pk__in=ids).values(
+            "id",
+            "title",
+            album_title=F("album__title"),
+            artist_name=F("album__artist__name"),
+        )
+    }
+    return [rows[pk] for pk in ids if pk in rows]
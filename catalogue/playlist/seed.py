@@ -0,0 +1,114 @@
+import random
+
+from django.db import transaction
+
+from .bulk import BULK_BATCH_SIZE
+from .cache import LIST_SCOPE, invalidate, invalidate_catalogue
+from .changes import CREATE, record_changes
+from .models import Artist, Album, Track, Playlist, PlaylistTrack
+from .ordering import ORDER_GAP
+from .revisions import record_initial_revisions
+from .search import index_objects
+from .summary import rebuild_summaries
+
+# Synthetic catalogue for benchmarks and local development. Names are drawn
+# from a small vocabulary so search has realistic shared prefixes.
+WORDS = (
+    "love night dream fire heart light blue rain road summer river shadow "
+    "golden silver wild young midnight electric broken city ocean storm "
+    "echo velvet neon paper crystal winter morning thunder stone glass "
+    "desert moon star sun wave black white red garden empire ghost"
+).split()
+
+# Artists written per transaction; their albums and tracks go with them.
+SEED_ARTIST_BATCH = 200
+
+
+def phrase(rng, words, number):
+    return " ".join(rng.choice(WORDS).title() for _ in range(words)) + f" {number}"
+
+
+def write_playlist_tracks(rows, sequences):
+    rows = PlaylistTrack.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+    record_changes(PlaylistTrack, CREATE, [row.pk for row in rows])
+    record_initial_revisions(sequences)
+
+
+# Creates artists * albums_per * tracks_per tracks, then `playlists` playlists of
+# `playlist_size` random tracks each, all with bulk inserts. The same seed gives
+# the same catalogue. Returns the number of rows created per model.
+def seed_catalogue(
+    artists, albums_per, tracks_per, playlists=0, playlist_size=0, seed=0
+):
+    rng = random.Random(seed)
+    track_ids = []
+    counts = {"artists": 0, "albums": 0, "tracks": 0, "playlists": 0}
+
+    for start in range(0, artists, SEED_ARTIST_BATCH):
+        with transaction.atomic():
+            batch = Artist.objects.bulk_create(
+                [
+                    Artist(name=phrase(rng, 2, number))
+                    for number in range(start, min(start + SEED_ARTIST_BATCH, artists))
+                ],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            index_objects("artist", batch, replace=False)
+            record_changes(Artist, CREATE, [artist.pk for artist in batch])
+            albums = Album.objects.bulk_create(
+                [
+                    Album(title=phrase(rng, 3, i), artist=artist)
+                    for artist in batch
+                    for i in range(albums_per)
+                ],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            index_objects("album", albums, replace=False)
+            record_changes(Album, CREATE, [album.pk for album in albums])
+            tracks = Track.objects.bulk_create(
+                [
+                    Track(title=phrase(rng, 3, i), album=album)
+                    for album in albums
+                    for i in range(tracks_per)
+                ],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            index_objects("track", tracks, replace=False)
+            record_changes(Track, CREATE, [track.pk for track in tracks])
+        track_ids += [track.pk for track in tracks]
+        counts["artists"] += len(batch)
+        counts["albums"] += len(albums)
+        counts["tracks"] += len(tracks)
+    invalidate_catalogue()
+
+    if playlists and track_ids:
+        with transaction.atomic():
+            created = Playlist.objects.bulk_create(
+                [Playlist(name=phrase(rng, 2, i)) for i in range(playlists)],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            rows, sequences = [], {}
+            for playlist in created:
+                picks = (
+                    rng.sample(track_ids, playlist_size)
+                    if playlist_size <= len(track_ids)
+                    else rng.choices(track_ids, k=playlist_size)
+                )
+                rows += [
+                    PlaylistTrack(
+                        playlist=playlist, track_id=track_id, order=i * ORDER_GAP
+                    )
+                    for i, track_id in enumerate(picks, 1)
+                ]
+                sequences[playlist.pk] = picks
+                if len(rows) >= BULK_BATCH_SIZE * 10:
+                    write_playlist_tracks(rows, sequences)
+                    rows, sequences = [], {}
+            write_playlist_tracks(rows, sequences)
+            record_changes(Playlist, CREATE, [playlist.pk for playlist in created])
+            for start in range(0, len(created), BULK_BATCH_SIZE):
+                uuids = [p.pk for p in created[start : start + BULK_BATCH_SIZE]]
+                rebuild_summaries(Playlist.objects.filter(pk__in=uuids))
+        invalidate(LIST_SCOPE)
+        counts["playlists"] = len(created)
+    return counts
@@ -1,57 +1,395 @@
+import time
+from functools import cache
+from operator import attrgetter
+
+from django.db import transaction
 from rest_framework import serializers
 
-from .models import Artist, Album, Track, Playlist, PlaylistTrack
+from .bulk import BULK_BATCH_SIZE, muted_signals
+from .cache import invalidate_playlist
+from .changes import CREATE, DELETE, UPDATE, record_changes
+from .metrics import current_metrics
+from .revisions import record_initial_revisions, record_revision
+from .similarity import queue_stale_tracks
+from .models import Artist, Album, Job, Track, Playlist, PlaylistArtist, PlaylistTrack
+from .summary import artist_rows, count_artists, update_summary
+
+# Most objects one batch lookup may ask for.
+BATCH_MAX_IDS = 5000
+
+
+# Returns the set of field names asked for with ?fields=, or None when the
+# parameter is absent.
+def requested_fields(request):
+    if request is None or "fields" not in request.query_params:
+        return None
+    return {
+        name.strip()
+        for name in request.query_params["fields"].split(",")
+        if name.strip()
+    }
+
+
+# Sparse fieldsets: ?fields=id,title only serializes the named fields. Unknown
+# names are ignored, and nested serializers are left untouched.
+class SparseFieldsetMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get("request"))
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
 
 
-class TrackSerializer(serializers.ModelSerializer):
+# Adds the time spent serializing to the request's metrics, see playlist/metrics.py.
+# Nested serializers are covered by the outermost one.
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        metrics = current_metrics()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+        metrics.serializing = True
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+            metrics.serializing = False
+
+
+class TrackSerializer(
+    TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Track
         fields = "__all__"
 
 
-class AlbumSerializer(serializers.ModelSerializer):
+class AlbumSerializer(
+    TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Album
         fields = "__all__"
 
 
-class ArtistSerializer(serializers.ModelSerializer):
+class ArtistSerializer(
+    TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Artist
         fields = "__all__"
 
 
-class PlaylistTrackSerializer(serializers.ModelSerializer):
-    track = serializers.PrimaryKeyRelatedField(queryset=Track.objects.all())
+# Accepts a track pk without looking it up; PlaylistTrackListSerializer checks
+# that all the pks of a playlist exist with a single query.
+class TrackPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
+class PlaylistTrackListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        attrs = super().to_internal_value(data)
+        track_ids = {item["track"] for item in attrs}
+        existing = set(
+            Track.objects.filter(pk__in=track_ids).values_list("pk", flat=True)
+        )
+        does_not_exist = TrackPrimaryKeyField.default_error_messages["does_not_exist"]
+
+        errors = []
+        seen = set()
+        for item in attrs:
+            if item["track"] not in existing:
+                errors.append(
+                    {"track": [does_not_exist.format(pk_value=item["track"])]}
+                )
+            elif item["order"] in seen:
+                errors.append({"order": ["Duplicate order in playlist."]})
+            else:
+                errors.append({})
+            seen.add(item["order"])
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
+# Accepts a JSON list or comma separated strings, e.g. ?ids=3,1,2 or ids=3&ids=1.
+class CommaSeparatedListField(serializers.ListField):
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [data]
+        if isinstance(data, list) and all(isinstance(item, str) for item in data):
+            data = [
+                part.strip()
+                for item in data
+                for part in item.split(",")
+                if part.strip()
+            ]
+        return super().to_internal_value(data)
+
+
+# Input of the batch lookup endpoints, see BatchMixin in views.py.
+class BatchSerializer(serializers.Serializer):
+    ids = CommaSeparatedListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_MAX_IDS,
+    )
+    expand = CommaSeparatedListField(child=serializers.CharField(), required=False)
+
+
+# Returns a subclass of serializer_class in which the foreign keys named in
+# `expand` are nested serializers instead of pks. `expandable` maps every
+# expandable path, such as "album" or "album.artist", to its serializer class;
+# the paths in `expand` must be among them, parents included.
+@cache
+def expanded_serializer(serializer_class, expand, expandable):
+    nested = {}
+    for name in (path for path in expand if "." not in path):
+        children = frozenset(
+            path.split(".", 1)[1] for path in expand if path.startswith(f"{name}.")
+        )
+        child_expandable = tuple(
+            (path.split(".", 1)[1], child)
+            for path, child in expandable
+            if path.startswith(f"{name}.")
+        )
+        child_class = expanded_serializer(
+            dict(expandable)[name], children, child_expandable
+        )
+        nested[name] = child_class(read_only=True)
+    return type(f"Expanded{serializer_class.__name__}", (serializer_class,), nested)
+
+
+class PlaylistTrackSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    track = TrackPrimaryKeyField(queryset=Track.objects.all())
 
     class Meta:
         model = PlaylistTrack
         fields = ["track", "order"]
+        list_serializer_class = PlaylistTrackListSerializer
+
+
+# Input of the playlist track insert/move/remove endpoints. Rows are addressed by
+# their order key, and `after` is the key of the row to place the track after:
+# null for the top of the playlist, omitted for the end.
+class PlaylistTrackInsertSerializer(serializers.Serializer):
+    track = serializers.PrimaryKeyRelatedField(queryset=Track.objects.only("id"))
+    after = serializers.IntegerField(min_value=0, required=False, allow_null=True)
 
 
-class PlaylistSerializer(serializers.ModelSerializer):
+class PlaylistTrackAppendSerializer(serializers.Serializer):
+    tracks = serializers.ListField(
+        child=TrackPrimaryKeyField(queryset=Track.objects.all()),
+        allow_empty=False,
+        max_length=BULK_BATCH_SIZE * 10,
+    )
+
+    # One query for all the track pks.
+    def validate_tracks(self, value):
+        existing = set(Track.objects.filter(pk__in=value).values_list("pk", flat=True))
+        missing = [pk for pk in value if pk not in existing]
+        if missing:
+            raise serializers.ValidationError(
+                TrackPrimaryKeyField.default_error_messages["does_not_exist"].format(
+                    pk_value=missing[0]
+                )
+            )
+        return value
+
+
+class PlaylistTrackMoveSerializer(serializers.Serializer):
+    order = serializers.IntegerField(min_value=0)
+    after = serializers.IntegerField(min_value=0, required=False, allow_null=True)
+
+
+class PlaylistTrackRemoveSerializer(serializers.Serializer):
+    order = serializers.IntegerField(min_value=0)
+
+
+# Input of the playlist clone and set operation endpoints. Without a name, the
+# new playlist is named after its sources.
+class PlaylistCloneSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255, required=False)
+
+
+class PlaylistCombineSerializer(PlaylistCloneSerializer):
+    playlists = serializers.ListField(
+        child=serializers.UUIDField(), allow_empty=False, max_length=100
+    )
+
+    # One query for all the playlist pks.
+    def validate_playlists(self, value):
+        existing = set(
+            Playlist.objects.filter(pk__in=value).values_list("pk", flat=True)
+        )
+        missing = [pk for pk in value if pk not in existing]
+        if missing:
+            raise serializers.ValidationError(
+                serializers.PrimaryKeyRelatedField.default_error_messages[
+                    "does_not_exist"
+                ].format(pk_value=missing[0])
+            )
+        return value
+
+
+# Input of the revision restore endpoint.
+class PlaylistRestoreSerializer(serializers.Serializer):
+    number = serializers.IntegerField(min_value=1)
+
+
+class PlaylistSerializer(
+    TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer
+):
     tracks = PlaylistTrackSerializer(source="playlisttrack_set", many=True)
 
     class Meta:
         model = Playlist
-        fields = ["uuid", "name", "tracks"]
+        fields = [
+            "uuid",
+            "name",
+            "track_count",
+            "artist_count",
+            "last_modified",
+            "tracks",
+        ]
+        read_only_fields = ["track_count", "artist_count", "last_modified"]
 
     # create method is called when a new instance of a model is being created.
+    @transaction.atomic
     def create(self, validated_data):
         tracks_data = validated_data.pop("playlisttrack_set")
-        playlist = Playlist.objects.create(**validated_data)
-        for track_data in tracks_data:
-            PlaylistTrack.objects.create(playlist=playlist, **track_data)
+        # A new playlist's summary is known up front, so it is stored with the
+        # INSERT rather than updated afterwards.
+        artists = artist_rows([item["track"] for item in tracks_data])
+        playlist = Playlist.objects.create(
+            track_count=len(tracks_data), artist_count=len(artists), **validated_data
+        )
+        PlaylistArtist.objects.bulk_create(
+            [
+                PlaylistArtist(playlist=playlist, artist_id=artist_id, tracks=tracks)
+                for artist_id, tracks in artists.items()
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        rows = PlaylistTrack.objects.bulk_create(
+            [
+                PlaylistTrack(
+                    playlist=playlist,
+                    track_id=track_data["track"],
+                    order=track_data["order"],
+                )
+                for track_data in tracks_data
+            ],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        record_changes(PlaylistTrack, CREATE, [row.pk for row in rows])
+        record_initial_revisions(
+            {
+                playlist.pk: [
+                    row.track_id for row in sorted(rows, key=attrgetter("order"))
+                ]
+            }
+        )
+        invalidate_playlist(playlist.pk)
         return playlist
 
     # update method is called when an existing instance of a model is being updated.
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tracks_data = validated_data.pop("playlisttrack_set")
+        tracks_data = validated_data.pop("playlisttrack_set", None)
         instance.name = validated_data.get("name", instance.name)
         instance.save()
 
-        PlaylistTrack.objects.filter(playlist=instance).delete()
-        for track_data in tracks_data:
-            PlaylistTrack.objects.create(playlist=instance, **track_data)
+        if tracks_data is not None and self._sync_tracks(instance, tracks_data):
+            instance.refresh_from_db(
+                fields=["track_count", "artist_count", "last_modified"]
+            )
 
+        invalidate_playlist(instance.pk)
         return instance
+
+    # Only writes the rows that differ. Rows are matched by order, which is unique
+    # per playlist: a row whose track is unchanged is left alone, a row whose track
+    # changed is updated in place, and the remainder is deleted or inserted. The
+    # unique constraint therefore holds after every statement. Returns whether
+    # anything was written, after updating the playlist summary once.
+    def _sync_tracks(self, playlist, tracks_data):
+        wanted = {item["order"]: item["track"] for item in tracks_data}
+
+        changed = []
+        deleted = []
+        # Tracks whose row is deleted or given another track.
+        removed = []
+        for pk, track_id, order in PlaylistTrack.objects.filter(
+            playlist=playlist
+        ).values_list("pk", "track_id", "order"):
+            new_track_id = wanted.pop(order, None)
+            if new_track_id is None:
+                deleted.append(pk)
+                removed.append(track_id)
+            elif new_track_id != track_id:
+                changed.append(PlaylistTrack(pk=pk, track_id=new_track_id))
+                removed.append(track_id)
+        created = [
+            PlaylistTrack(playlist=playlist, track_id=track_id, order=order)
+            for order, track_id in wanted.items()
+        ]
+
+        if not (deleted or changed or created):
+            return False
+
+        with muted_signals():
+            for start in range(0, len(deleted), BULK_BATCH_SIZE):
+                PlaylistTrack.objects.filter(
+                    pk__in=deleted[start : start + BULK_BATCH_SIZE]
+                ).delete()
+        if changed:
+            PlaylistTrack.objects.bulk_update(
+                changed, ["track"], batch_size=BULK_BATCH_SIZE
+            )
+        if created:
+            PlaylistTrack.objects.bulk_create(created, batch_size=BULK_BATCH_SIZE)
+        # The playlist's own update is recorded by update(), which saves it.
+        record_changes(PlaylistTrack, DELETE, deleted)
+        record_changes(PlaylistTrack, UPDATE, [row.pk for row in changed])
+        record_changes(PlaylistTrack, CREATE, [row.pk for row in created])
+        queue_stale_tracks(removed)
+        record_revision(playlist.pk)
+        count_artists(
+            playlist.pk,
+            added=[row.track_id for row in changed + created],
+            removed=removed,
+        )
+        update_summary(
+            [playlist.pk], track_delta=len(created) - len(deleted), artists=False
+        )
+        return True
+
+
+# Status and progress of a background job, see playlist/jobs.py.
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = [
+            "id",
+            "kind",
+            "arguments",
+            "status",
+            "progress",
+            "total",
+            "attempts",
+            "run_after",
+            "result",
+            "error",
+            "created",
+            "started",
+            "finished",
+        ]
@@ -0,0 +1,204 @@
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from .cache import invalidate_playlist
+from .bulk import BULK_BATCH_SIZE
+from .changes import CREATE, DELETE, UPDATE, record_changes, record_rows
+from .models import Playlist, PlaylistArtist, PlaylistTrack, Track
+from .ordering import ORDER_GAP, lock_playlist
+from .revisions import record_revision, revision_tracks
+from .similarity import queue_stale_tracks
+from .summary import update_summary
+
+# Copies and combinations of playlists. Each writes the resulting rows with one
+# INSERT ... SELECT over PlaylistTrack, so the cost does not depend on moving
+# tracks through Python. The ORM has no INSERT ... SELECT, hence the SQL.
+#
+# clone keeps the rows and order keys of the source, duplicates included. The
+# set operations keep each track once, at its first position: the tracks of the
+# first playlist in its order, followed for a union by the new tracks of each
+# other playlist in turn, renumbered ORDER_GAP apart.
+
+# Joins the source names into the default name of a combination.
+OPERATIONS = {"union": " + ", "intersection": " & ", "difference": " - "}
+
+# Tracks of the source playlists, tagged with the index of their playlist
+# ("source") and their order key ("position").
+SOURCES = {
+    "union": (
+        "SELECT {track}, {index} AS source, {order} AS position FROM {table} "
+        "WHERE {playlist} = %s"
+    ),
+    "intersection": (
+        "SELECT {track}, 0 AS source, {order} AS position FROM {table} "
+        "WHERE {playlist} = %s AND {track} IN ("
+        "SELECT {track} FROM {table} WHERE {playlist} IN ({others}) "
+        "GROUP BY {track} HAVING COUNT(DISTINCT {playlist}) = {count})"
+    ),
+    "difference": (
+        "SELECT {track}, 0 AS source, {order} AS position FROM {table} "
+        "WHERE {playlist} = %s AND {track} NOT IN ("
+        "SELECT {track} FROM {table} WHERE {playlist} IN ({others}))"
+    ),
+}
+
+
+def quoted_columns():
+    quote = connection.ops.quote_name
+    return {
+        "table": quote(PlaylistTrack._meta.db_table),
+        "id": quote(PlaylistTrack._meta.pk.column),
+        "playlist": quote(PlaylistTrack._meta.get_field("playlist").column),
+        "track": quote(PlaylistTrack._meta.get_field("track").column),
+        "order": quote(PlaylistTrack._meta.get_field("order").column),
+    }
+
+
+def prepare(uuid):
+    return Playlist._meta.pk.get_db_prep_value(uuid, connection)
+
+
+# Creates the playlist a copy or combination is written to. Its change log
+# entry is recorded by the signals, those of its rows by finish().
+def new_playlist(name, **summary):
+    field = Playlist._meta.get_field("name")
+    return Playlist.objects.create(name=name[: field.max_length], **summary)
+
+
+def finish(playlist, recount=True):
+    record_rows(PlaylistTrack.objects.filter(playlist=playlist), CREATE)
+    record_revision(playlist.pk)
+    if recount:
+        update_summary([playlist.pk], recount=True)
+    invalidate_playlist(playlist.pk)
+    playlist.refresh_from_db()
+    return playlist
+
+
+@transaction.atomic
+def clone_playlist(uuid, name=None):
+    source = Playlist.objects.only("name", "track_count", "artist_count").get(pk=uuid)
+    playlist = new_playlist(
+        name or f"{source.name} (copy)",
+        track_count=source.track_count,
+        artist_count=source.artist_count,
+    )
+    sql = (
+        "INSERT INTO {table} ({playlist}, {track}, {order}) "
+        "SELECT %s, {track}, {order} FROM {table} WHERE {playlist} = %s"
+    ).format(**quoted_columns())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [prepare(playlist.pk), prepare(source.pk)])
+    PlaylistArtist.objects.bulk_create(
+        [
+            PlaylistArtist(playlist=playlist, artist_id=artist_id, tracks=tracks)
+            for artist_id, tracks in PlaylistArtist.objects.filter(
+                playlist=source
+            ).values_list("artist_id", "tracks")
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    return finish(playlist, recount=False)
+
+
+# Writes `operation` ("union", "intersection" or "difference") of the playlist
+# `uuid` with the non-empty list of playlists `others` to a new playlist and
+# returns it.
+@transaction.atomic
+def combine_playlists(operation, uuid, others, name=None):
+    # Any spelling of a UUID (upper case, no hyphens) names the same playlist.
+    to_uuid = Playlist._meta.pk.to_python
+    uuid = to_uuid(uuid)
+    others = list(dict.fromkeys(to_uuid(pk) for pk in others))
+    if not name:
+        names = dict(
+            Playlist.objects.filter(pk__in=[uuid, *others]).values_list("pk", "name")
+        )
+        name = OPERATIONS[operation].join(names[pk] for pk in [uuid, *others])
+    playlist = new_playlist(name)
+    columns = quoted_columns()
+    if operation == "union":
+        sources = " UNION ALL ".join(
+            SOURCES["union"].format(index=index, **columns)
+            for index in range(len(others) + 1)
+        )
+    else:
+        sources = SOURCES[operation].format(
+            others=", ".join(["%s"] * len(others)),
+            count=len(others),
+            **columns,
+        )
+    params = [prepare(pk) for pk in [uuid, *others]]
+    sql = (
+        "INSERT INTO {table} ({playlist}, {track}, {order}) "
+        "SELECT %s, {track}, ROW_NUMBER() OVER (ORDER BY source, position) * %s "
+        "FROM (SELECT {track}, source, position, ROW_NUMBER() OVER ("
+        "PARTITION BY {track} ORDER BY source, position) AS occurrence "
+        "FROM ({sources}) AS picked) AS ranked "
+        "WHERE occurrence = 1"
+    ).format(sources=sources, **columns)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [prepare(playlist.pk), ORDER_GAP, *params])
+    return finish(playlist)
+
+
+# Deletes every row of the playlist whose track appears earlier in it. Returns
+# the number of rows deleted.
+@transaction.atomic
+def dedupe_playlist(uuid):
+    playlist = lock_playlist(uuid)
+    columns = quoted_columns()
+    duplicates = (
+        "SELECT {id} FROM (SELECT {id}, ROW_NUMBER() OVER ("
+        "PARTITION BY {track} ORDER BY {order}) AS occurrence "
+        "FROM {table} WHERE {playlist} = %s) AS ranked WHERE occurrence > 1"
+    ).format(**columns)
+    params = [prepare(playlist.pk)]
+    record_rows(PlaylistTrack.objects.filter(pk__in=RawSQL(duplicates, params)), DELETE)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {table} WHERE {id} IN ({duplicates})".format(
+                duplicates=duplicates, **columns
+            ),
+            params,
+        )
+        deleted = cursor.rowcount
+    if deleted:
+        record_changes(Playlist, UPDATE, [playlist.pk])
+        record_revision(playlist.pk)
+        update_summary([playlist.pk], track_delta=-deleted)
+        invalidate_playlist(playlist.pk)
+    return deleted
+
+
+# Rewrites the playlist's rows to the track list of revision `number`, keys
+# ORDER_GAP apart, with one DELETE and bulk INSERTs. Tracks deleted from the
+# catalogue since are left out. The restore is recorded as a new revision, so it
+# can be undone in turn.
+@transaction.atomic
+def restore_revision(uuid, number):
+    playlist = lock_playlist(uuid)
+    tracks = revision_tracks(playlist.pk, number)
+    existing = set(
+        Track.objects.filter(pk__in=set(tracks)).values_list("pk", flat=True)
+    )
+    tracks = [track_id for track_id in tracks if track_id in existing]
+    rows = PlaylistTrack.objects.filter(playlist=playlist)
+    removed = set(rows.values_list("track_id", flat=True)) - set(tracks)
+    record_rows(rows, DELETE)
+    columns = quoted_columns()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {table} WHERE {playlist} = %s".format(**columns),
+            [prepare(playlist.pk)],
+        )
+    PlaylistTrack.objects.bulk_create(
+        [
+            PlaylistTrack(playlist=playlist, track_id=track_id, order=i * ORDER_GAP)
+            for i, track_id in enumerate(tracks, 1)
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    record_changes(Playlist, UPDATE, [playlist.pk])
+    queue_stale_tracks(removed)
+    return finish(playlist)
@@ -0,0 +1,212 @@
+from django.db.models import QuerySet
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .bulk import BULK_BATCH_SIZE, signals_muted
+from .cache import invalidate_catalogue, invalidate_playlist
+from .changes import CREATE, DELETE, UPDATE, record_changes, record_playlist_tracks
+from .models import Artist, Album, Track, Playlist, PlaylistTrack
+from .revisions import record_revision
+from .search import SEARCH_FIELDS, index_objects, unindex_objects
+from .similarity import queue_stale_tracks
+from .summary import count_artists, update_summary
+
+SEARCH_KINDS = {model: kind for kind, (model, _) in SEARCH_FIELDS.items()}
+
+
+def change_action(signal, created):
+    if signal is post_delete:
+        return DELETE
+    return CREATE if created else UPDATE
+
+
+@receiver([post_save, post_delete], sender=Playlist)
+def playlist_changed(sender, instance, signal, created=False, **kwargs):
+    invalidate_playlist(instance.pk)
+    record_changes(Playlist, change_action(signal, created), [instance.pk])
+
+
+# Remembers the stored track and order of a row being updated, so post_save can
+# tell whether the playlist's artists may have changed and which edit to record
+# as a revision.
+@receiver(pre_save, sender=PlaylistTrack)
+def playlist_track_saving(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or signals_muted():
+        return
+    if update_fields is None or {"track", "order"} & set(update_fields):
+        stored = (
+            PlaylistTrack.objects.filter(pk=instance.pk)
+            .values_list("track_id", "order")
+            .first()
+        )
+        if stored is not None:
+            instance._stored_track_id, instance._stored_order = stored
+
+
+@receiver(post_save, sender=PlaylistTrack)
+def playlist_track_saved(sender, instance, created, **kwargs):
+    if signals_muted():
+        return
+    invalidate_playlist(instance.playlist_id)
+    record_playlist_tracks(
+        CREATE if created else UPDATE, [instance.pk], [instance.playlist_id]
+    )
+    stored_track_id = vars(instance).pop("_stored_track_id", instance.track_id)
+    stored_order = vars(instance).pop("_stored_order", instance.order)
+    if created:
+        edits = [("insert", instance.order, [instance.track_id])]
+    else:
+        edits = []
+        if stored_order != instance.order:
+            edits.append(("move", stored_order, instance.order))
+        if stored_track_id != instance.track_id:
+            edits.append(("replace", instance.order, instance.track_id))
+    if edits:
+        record_revision(instance.playlist_id, edits)
+    if created:
+        count_artists(instance.playlist_id, added=[instance.track_id])
+    elif stored_track_id != instance.track_id:
+        queue_stale_tracks([stored_track_id])
+        count_artists(
+            instance.playlist_id,
+            added=[instance.track_id],
+            removed=[stored_track_id],
+        )
+    update_summary(
+        [instance.playlist_id], track_delta=1 if created else 0, artists=False
+    )
+
+
+def deleted_with_playlist(origin):
+    return isinstance(origin, Playlist) or (
+        isinstance(origin, QuerySet) and origin.model is Playlist
+    )
+
+
+# Rows deleted by one delete() call are all gone before the first post_delete,
+# so their order keys are collected on the call's origin beforehand and recorded
+# as one revision per playlist.
+@receiver(pre_delete, sender=PlaylistTrack)
+def playlist_track_deleting(sender, instance, origin=None, **kwargs):
+    if signals_muted() or origin is None or deleted_with_playlist(origin):
+        return
+    removals = vars(origin).setdefault("_revision_removals", {})
+    removals.setdefault(instance.playlist_id, []).append(instance.order)
+
+
+@receiver(post_delete, sender=PlaylistTrack)
+def playlist_track_deleted(sender, instance, origin=None, **kwargs):
+    if signals_muted():
+        return
+    invalidate_playlist(instance.playlist_id)
+    queue_stale_tracks([instance.track_id])
+    # Rows deleted along with their playlist have no summary left to update.
+    if deleted_with_playlist(origin):
+        record_changes(PlaylistTrack, DELETE, [instance.pk])
+        return
+    record_playlist_tracks(DELETE, [instance.pk], [instance.playlist_id])
+    if origin is None:
+        record_revision(instance.playlist_id)
+    else:
+        removed = (
+            vars(origin).get("_revision_removals", {}).pop(instance.playlist_id, None)
+        )
+        if removed is not None:
+            record_revision(instance.playlist_id, [("remove", removed)])
+    count_artists(instance.playlist_id, removed=[instance.track_id])
+    update_summary([instance.playlist_id], track_delta=-1, artists=False)
+
+
+# playlist.tracks.add()/remove()/clear() write the through table in bulk and only
+# send m2m_changed. instance is a Playlist, or a Track when reverse is True. The
+# through rows are not known here, so the change log records the playlists.
+@receiver(m2m_changed, sender=PlaylistTrack)
+def playlist_tracks_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    uuids = []
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            uuids = [instance.pk]
+        if action == "post_remove":
+            queue_stale_tracks(pk_set)
+        elif action == "pre_clear":
+            queue_stale_tracks(instance.tracks.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove"):
+        uuids = list(pk_set)
+    elif action == "pre_clear":
+        # Cleared rows are gone by post_clear, so collect the playlists now and
+        # recount them once the rows are deleted.
+        instance._cleared_playlists = list(
+            instance.playlist_set.values_list("pk", flat=True)
+        )
+    elif action == "post_clear":
+        uuids = instance._cleared_playlists
+    if reverse and action in ("post_remove", "post_clear"):
+        queue_stale_tracks([instance.pk])
+
+    for uuid in uuids:
+        invalidate_playlist(uuid)
+        record_revision(uuid)
+    if uuids:
+        record_changes(Playlist, UPDATE, uuids)
+        update_summary(uuids, recount=True)
+
+
+# The field that ties an album or a track to its artist.
+PARENT_FIELDS = {Album: "artist_id", Track: "album_id"}
+
+
+# Remembers the stored parent of an album or track being updated, so post_save
+# can tell whether its tracks moved to another artist.
+@receiver(pre_save, sender=Album)
+@receiver(pre_save, sender=Track)
+def catalogue_saving(sender, instance, update_fields=None, **kwargs):
+    field = PARENT_FIELDS[sender]
+    if instance._state.adding:
+        return
+    if update_fields is None or field.removesuffix("_id") in update_fields:
+        instance._stored_parent_id = (
+            sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Track)
+def catalogue_saved(sender, instance, created, **kwargs):
+    index_objects(SEARCH_KINDS[sender], [instance], replace=not created)
+    record_changes(sender, CREATE if created else UPDATE, [instance.pk])
+    invalidate_catalogue()
+    if sender in PARENT_FIELDS:
+        parent_id = getattr(instance, PARENT_FIELDS[sender])
+        if vars(instance).pop("_stored_parent_id", parent_id) != parent_id:
+            recount_playlist_artists(sender, instance)
+
+
+# Recounts the artists of the playlists holding the tracks of an album or a
+# track that moved to another artist.
+def recount_playlist_artists(sender, instance):
+    rows = PlaylistTrack.objects.filter(
+        **{"track__album" if sender is Album else "track": instance}
+    )
+    uuids = list(rows.values_list("playlist_id", flat=True).distinct())
+    for start in range(0, len(uuids), BULK_BATCH_SIZE):
+        batch = uuids[start : start + BULK_BATCH_SIZE]
+        update_summary(batch, artists=True)
+        record_changes(Playlist, UPDATE, batch)
+        for uuid in batch:
+            invalidate_playlist(uuid)
+
+
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Track)
+def catalogue_deleted(sender, instance, **kwargs):
+    unindex_objects(SEARCH_KINDS[sender], [instance.pk])
+    record_changes(sender, DELETE, [instance.pk])
+    invalidate_catalogue()
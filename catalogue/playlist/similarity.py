@@ -0,0 +1,288 @@
+import heapq
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .bulk import BULK_BATCH_SIZE
+from .changes import CHANGES_MAX_LIMIT, read_changes, settled_changes
+from .models import (
+    Playlist,
+    PlaylistTrack,
+    SimilarPlaylist,
+    SimilarTrack,
+    SimilarityState,
+    StaleTrack,
+    Track,
+)
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = sparse = None
+
+# Neighbours kept per track and per playlist.
+SIMILAR_LIMIT = 50
+
+# Rows of the co-occurrence matrix computed at once by the sparse build; bounds
+# its memory to this many rows of neighbours.
+BUILD_BLOCK_ROWS = 4096
+
+# "Similar" means sharing playlists (for tracks) or tracks (for playlists). With
+# A the binary playlist x track matrix of PlaylistTrack, the co-occurrence counts
+# are the entries of A.T @ A and A @ A.T. Only the top SIMILAR_LIMIT neighbours of
+# each row are stored, ordered by count and then id, the order the per-object
+# SQL recount below also produces.
+#
+# build_similarity() computes every row from scratch, with SciPy sparse products
+# when SciPy is installed and with counters otherwise. refresh_similarity()
+# recounts only the rows a playlist change can affect: the tracks of playlists
+# in the change log since the last refresh, the tracks removed from them
+# (queued in StaleTrack by the write paths), those playlists, the playlists
+# listing them as similar and the playlists holding any of those tracks. Every
+# count involving a changed playlist is then recounted, so both track and
+# playlist rows are exact.
+
+
+def queue_stale_tracks(track_ids):
+    StaleTrack.objects.bulk_create(
+        [StaleTrack(track_id=track_id) for track_id in set(track_ids)],
+        batch_size=BULK_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+# Returns the stored neighbours of a track as rows of the track list endpoint,
+# with the number of shared playlists.
+def similar_tracks(track_id, limit=SIMILAR_LIMIT):
+    rows = (
+        SimilarTrack.objects.filter(track_id=track_id)
+        .order_by("-count", "similar_id")
+        .values_list("similar_id", "similar__title", "similar__album_id", "count")[
+            :limit
+        ]
+    )
+    return [
+        {"id": pk, "title": title, "album": album_id, "count": count}
+        for pk, title, album_id, count in rows
+    ]
+
+
+def similar_playlists(playlist_id, limit=SIMILAR_LIMIT):
+    rows = (
+        SimilarPlaylist.objects.filter(playlist_id=playlist_id)
+        .order_by("-count", "similar_id")
+        .values_list("similar_id", "similar__name", "similar__track_count", "count")[
+            :limit
+        ]
+    )
+    return [
+        {"uuid": uuid, "name": name, "track_count": track_count, "count": count}
+        for uuid, name, track_count, count in rows
+    ]
+
+
+@transaction.atomic
+def build_similarity():
+    # Changes up to here are part of the membership read below.
+    cursor = settled_changes().aggregate(top=Max("pk"))["top"] or 0
+    pairs = list(
+        PlaylistTrack.objects.order_by()
+        .values_list("playlist_id", "track_id")
+        .distinct()
+        .iterator(chunk_size=BULK_BATCH_SIZE * 10)
+    )
+    if sparse is not None:
+        tracks, playlists = sparse_neighbours(pairs)
+    else:
+        tracks, playlists = counted_neighbours(pairs)
+
+    SimilarTrack.objects.all().delete()
+    SimilarPlaylist.objects.all().delete()
+    StaleTrack.objects.all().delete()
+    write_neighbours(SimilarTrack, "track_id", tracks)
+    write_neighbours(SimilarPlaylist, "playlist_id", playlists)
+    SimilarityState.objects.update_or_create(pk=1, defaults={"cursor": cursor})
+    return len(pairs)
+
+
+# Both neighbour maps from the (playlist, track) pairs, as
+# {id: [(neighbour id, count), ...]}.
+def sparse_neighbours(pairs):
+    playlist_ids = sorted({playlist_id for playlist_id, _ in pairs})
+    track_ids = sorted({track_id for _, track_id in pairs})
+    playlist_index = {pk: i for i, pk in enumerate(playlist_ids)}
+    track_index = {pk: i for i, pk in enumerate(track_ids)}
+    matrix = sparse.csr_matrix(
+        (
+            numpy.ones(len(pairs), dtype=numpy.int32),
+            (
+                numpy.fromiter(
+                    (playlist_index[p] for p, _ in pairs), numpy.int64, len(pairs)
+                ),
+                numpy.fromiter(
+                    (track_index[t] for _, t in pairs), numpy.int64, len(pairs)
+                ),
+            ),
+        ),
+        shape=(len(playlist_ids), len(track_ids)),
+    )
+    return (
+        top_neighbours(matrix.T.tocsr(), track_ids),
+        top_neighbours(matrix, playlist_ids),
+    )
+
+
+# Top neighbours of every row of the binary items x features `matrix`. Indexes
+# follow the sorted ids, so sorting on the index breaks ties by id.
+def top_neighbours(matrix, ids):
+    transposed = matrix.T.tocsc()
+    neighbours = {}
+    for start in range(0, matrix.shape[0], BUILD_BLOCK_ROWS):
+        block = (matrix[start : start + BUILD_BLOCK_ROWS] @ transposed).tocsr()
+        for row in range(block.shape[0]):
+            begin, end = block.indptr[row], block.indptr[row + 1]
+            columns = block.indices[begin:end]
+            counts = block.data[begin:end]
+            keep = columns != start + row
+            columns, counts = columns[keep], counts[keep]
+            if not len(columns):
+                continue
+            order = numpy.lexsort((columns, -counts))[:SIMILAR_LIMIT]
+            neighbours[ids[start + row]] = [
+                (ids[column], int(count))
+                for column, count in zip(columns[order], counts[order])
+            ]
+    return neighbours
+
+
+# The same maps counted pair by pair, for installs without SciPy. Quadratic in
+# playlist length, but exact.
+def counted_neighbours(pairs):
+    playlists = defaultdict(list)
+    tracks = defaultdict(list)
+    for playlist_id, track_id in pairs:
+        playlists[playlist_id].append(track_id)
+        tracks[track_id].append(playlist_id)
+    return count_groups(playlists), count_groups(tracks)
+
+
+def count_groups(groups):
+    counts = defaultdict(Counter)
+    for members in groups.values():
+        for member in members:
+            counter = counts[member]
+            counter.update(members)
+            counter[member] -= 1
+    return {
+        member: heapq.nsmallest(
+            SIMILAR_LIMIT,
+            ((other, n) for other, n in counter.items() if n),
+            key=lambda item: (-item[1], item[0]),
+        )
+        for member, counter in counts.items()
+        if len(counter) > 1
+    }
+
+
+def write_neighbours(model, field, neighbours):
+    objects = (
+        model(**{field: pk}, similar_id=other, count=count)
+        for pk, rows in neighbours.items()
+        for other, count in rows
+    )
+    while batch := list(islice(objects, BULK_BATCH_SIZE)):
+        model.objects.bulk_create(batch)
+
+
+# Recounts the rows affected by the changes since the last refresh. Returns the
+# number of tracks and playlists recounted.
+@transaction.atomic
+def refresh_similarity():
+    state, _ = SimilarityState.objects.select_for_update().get_or_create(pk=1)
+    cursor, changed, more = state.cursor, set(), True
+    while more:
+        changes, cursor, more = read_changes(
+            cursor, CHANGES_MAX_LIMIT, kinds={"playlist"}
+        )
+        changed.update(change["id"] for change in changes)
+    changed = list(changed)
+
+    stale = list(StaleTrack.objects.values_list("track_id", flat=True))
+    StaleTrack.objects.filter(track_id__in=stale).delete()
+    track_ids = set(stale)
+    playlist_ids = set()
+    for batch in batches(changed):
+        track_ids.update(
+            PlaylistTrack.objects.filter(playlist_id__in=batch).values_list(
+                "track_id", flat=True
+            )
+        )
+        playlist_ids.update(
+            Playlist.objects.filter(pk__in=batch).values_list("pk", flat=True)
+        )
+        # Playlists listing a changed one hold its old count.
+        playlist_ids.update(
+            SimilarPlaylist.objects.filter(similar_id__in=batch).values_list(
+                "playlist_id", flat=True
+            )
+        )
+
+    for batch in batches(list(track_ids)):
+        # Playlists sharing a track with a changed one hold their count with it,
+        # whether or not they list it yet.
+        playlist_ids.update(
+            PlaylistTrack.objects.filter(track_id__in=batch)
+            .order_by()
+            .values_list("playlist_id", flat=True)
+            .distinct()
+        )
+        SimilarTrack.objects.filter(track_id__in=batch).delete()
+        existing = Track.objects.filter(pk__in=batch).values_list("pk", flat=True)
+        write_neighbours(
+            SimilarTrack,
+            "track_id",
+            {pk: recount_track(pk) for pk in existing},
+        )
+    for batch in batches(list(playlist_ids)):
+        SimilarPlaylist.objects.filter(playlist_id__in=batch).delete()
+        write_neighbours(
+            SimilarPlaylist,
+            "playlist_id",
+            {pk: recount_playlist(pk) for pk in batch},
+        )
+
+    state.cursor = cursor
+    state.save(update_fields=["cursor"])
+    return len(track_ids), len(playlist_ids)
+
+
+def batches(items):
+    for start in range(0, len(items), BULK_BATCH_SIZE):
+        yield items[start : start + BULK_BATCH_SIZE]
+
+
+def recount_track(track_id):
+    playlists = PlaylistTrack.objects.filter(track_id=track_id).values("playlist_id")
+    return list(
+        PlaylistTrack.objects.filter(playlist_id__in=playlists)
+        .exclude(track_id=track_id)
+        .values("track_id")
+        .annotate(count=Count("playlist_id", distinct=True))
+        .order_by("-count", "track_id")
+        .values_list("track_id", "count")[:SIMILAR_LIMIT]
+    )
+
+
+def recount_playlist(playlist_id):
+    tracks = PlaylistTrack.objects.filter(playlist_id=playlist_id).values("track_id")
+    return list(
+        PlaylistTrack.objects.filter(track_id__in=tracks)
+        .exclude(playlist_id=playlist_id)
+        .values("playlist_id")
+        .annotate(count=Count("track_id", distinct=True))
+        .order_by("-count", "playlist_id")
+        .values_list("playlist_id", "count")[:SIMILAR_LIMIT]
+    )
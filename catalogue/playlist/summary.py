@@ -0,0 +1,178 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .bulk import BULK_BATCH_SIZE
+from .models import Playlist, PlaylistArtist, PlaylistTrack, Track
+
+# Playlist.artist_count is the number of PlaylistArtist rows of the playlist,
+# which count the playlist's rows per artist. Single-row writes move those counts
+# with count_artists, which reads nothing but the written tracks and recounts
+# the PlaylistArtist rows (an index range of one row per artist) only when an
+# artist appears or disappears. Bulk writes rebuild them with recount_artists.
+
+
+def track_count_subquery():
+    return Coalesce(
+        Subquery(
+            PlaylistTrack.objects.filter(playlist=OuterRef("pk"))
+            .order_by()
+            .values("playlist")
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        Value(0),
+    )
+
+
+def artist_count_subquery():
+    return Coalesce(
+        Subquery(
+            PlaylistTrack.objects.filter(playlist=OuterRef("pk"))
+            .order_by()
+            .values("playlist")
+            .annotate(count=Count("track__album__artist", distinct=True))
+            .values("count")
+        ),
+        Value(0),
+    )
+
+
+def referenced_artists_subquery():
+    return Coalesce(
+        Subquery(
+            PlaylistArtist.objects.filter(playlist=OuterRef("pk"))
+            .order_by()
+            .values("playlist")
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        Value(0),
+    )
+
+
+# Rows per artist of a list of track ids, repeats included.
+def artist_rows(track_ids):
+    artists = dict(
+        Track.objects.filter(pk__in=set(track_ids)).values_list("pk", "album__artist")
+    )
+    return Counter(artists[track_id] for track_id in track_ids if track_id in artists)
+
+
+# Adds the rows of `added` and takes away those of `removed`, both lists of
+# track ids, from the playlist's per-artist counts. The playlist row is locked
+# so concurrent edits of the same playlist count in turn; called in autocommit
+# mode it runs in a transaction of its own.
+@transaction.atomic
+def count_artists(playlist_id, added=(), removed=()):
+    if not Playlist.objects.select_for_update().filter(pk=playlist_id).exists():
+        return
+    counts = artist_rows(added)
+    counts.subtract(artist_rows(removed))
+    if counts.total() != len(added) - len(removed):
+        # A track is gone from the catalogue; its artist is unknown.
+        recount_artists([playlist_id])
+        return
+    references = PlaylistArtist.objects.filter(playlist_id=playlist_id)
+    changed = False
+    for artist_id, delta in counts.items():
+        rows = references.filter(artist_id=artist_id)
+        if delta > 0 and not rows.update(tracks=F("tracks") + delta):
+            PlaylistArtist.objects.create(
+                playlist_id=playlist_id, artist_id=artist_id, tracks=delta
+            )
+            changed = True
+        elif delta < 0 and not rows.filter(tracks__gt=-delta).update(
+            tracks=F("tracks") + delta
+        ):
+            rows.delete()
+            changed = True
+    if changed:
+        Playlist.objects.filter(pk=playlist_id).update(
+            artist_count=referenced_artists_subquery()
+        )
+
+
+# Rebuilds the per-artist counts and artist_count of the playlists from their
+# rows.
+def recount_artists(playlist_ids):
+    playlist_ids = list(playlist_ids)
+    PlaylistArtist.objects.filter(playlist_id__in=playlist_ids).delete()
+    counts = (
+        PlaylistTrack.objects.filter(playlist_id__in=playlist_ids)
+        .order_by()
+        .values_list("playlist_id", "track__album__artist")
+        .annotate(tracks=Count("pk"))
+    )
+    PlaylistArtist.objects.bulk_create(
+        [
+            PlaylistArtist(playlist_id=playlist_id, artist_id=artist_id, tracks=tracks)
+            for playlist_id, artist_id, tracks in counts
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+    Playlist.objects.filter(pk__in=playlist_ids).update(
+        artist_count=referenced_artists_subquery()
+    )
+
+
+# Updates the summary columns of the given playlists. The track count moves by
+# `track_delta`, or is counted again when `recount` is set because the caller
+# does not know how many rows changed. The artist counts are rebuilt from the
+# playlist's rows when `artists` is set; single-row writes leave it unset and
+# call count_artists instead.
+def update_summary(playlist_ids, track_delta=0, recount=False, artists=True):
+    updates = {"last_modified": timezone.now()}
+    if recount:
+        updates["track_count"] = track_count_subquery()
+    elif track_delta:
+        updates["track_count"] = F("track_count") + track_delta
+    Playlist.objects.filter(pk__in=playlist_ids).update(**updates)
+    if artists:
+        recount_artists(playlist_ids)
+
+
+# Recomputes every summary column from PlaylistTrack, for the rebuild command.
+def rebuild_summaries(queryset=None):
+    if queryset is None:
+        queryset = Playlist.objects.all()
+    recount_artists(queryset.values_list("pk", flat=True))
+    return queryset.update(track_count=track_count_subquery())
+
+
+# Returns (uuid, stored, actual) for every playlist whose stored summary differs
+# from its rows, where stored and actual are (track_count, artist_count). So is a
+# playlist with a PlaylistArtist row too many or too few.
+def summary_mismatches(queryset=None):
+    if queryset is None:
+        queryset = Playlist.objects.all()
+    rows = (
+        queryset.annotate(
+            actual_tracks=track_count_subquery(),
+            actual_artists=artist_count_subquery(),
+            referenced=referenced_artists_subquery(),
+        )
+        .values_list(
+            "uuid",
+            "track_count",
+            "artist_count",
+            "actual_tracks",
+            "actual_artists",
+            "referenced",
+        )
+        .order_by()
+    )
+    for (
+        uuid,
+        tracks,
+        artists,
+        actual_tracks,
+        actual_artists,
+        referenced,
+    ) in rows.iterator():
+        stored = (tracks, artists, referenced)
+        if stored != (actual_tracks, actual_artists, actual_artists):
+            yield uuid, (tracks, artists), (actual_tracks, actual_artists)
@@ -1,14 +1,104 @@
-from django.test import TestCase
+import datetime
+import decimal
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+import uuid
+from unittest import mock, skipIf, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.contrib.postgres.search import SearchQuery
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from playlist.models import Artist, Album, Track, Playlist
+from django.utils import timezone
+from playlist.models import (
+    Artist,
+    Album,
+    Track,
+    Playlist,
+    PlaylistTrack,
+    PlaylistArtist,
+    PlaylistRevision,
+    Job,
+    ImportCheckpoint,
+    SearchTerm,
+    Change,
+    SimilarPlaylist,
+    SimilarTrack,
+    StaleTrack,
+)
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
 from rest_framework.test import APITestCase
+from .admin import EstimatedCountPaginator, PagedInlineFormSet
+from .cache import cached_response, get_cache
+from .changes import compact_changes
+from .compression import brotli
+from .export import playlist_records
+from .importer import guess_format
+from .jobs import JOB_MAX_ATTEMPTS, enqueue, run_pending
+from .metrics import Histogram, RequestMetrics, _current, registry
+from .ordering import (
+    ORDER_GAP,
+    append_tracks,
+    insert_track,
+    move_track,
+    remove_track,
+    renumber,
+)
+from .renderers import FastJSONRenderer, msgpack
+from .revisions import (
+    REVISION_CHECKPOINT_INTERVAL,
+    apply_delta,
+    diff_tracks,
+    encode_delta,
+    playlist_sequence,
+    revision_tracks,
+)
+from .routers import (
+    PRIMARY_COOKIE,
+    ReplicaRouter,
+    ReplicaRoutingMiddleware,
+    primary_reads,
+)
+from .rows import row_serializer
+from .search import search, search_vector
+from .seed import seed_catalogue
+from .similarity import (
+    SIMILAR_LIMIT,
+    build_similarity,
+    counted_neighbours,
+    recount_playlist,
+    recount_track,
+    refresh_similarity,
+    sparse,
+    sparse_neighbours,
+)
 from .serializers import (
+    BATCH_MAX_IDS,
     ArtistSerializer,
     AlbumSerializer,
     TrackSerializer,
     PlaylistSerializer,
 )
+from .summary import rebuild_summaries, summary_mismatches
 
 
 class ArtistViewSetTests(APITestCase):
@@ -19,12 +109,12 @@ class ArtistViewSetTests(APITestCase):
     # every method should start with test and contain any number of assertaion to check condition
     def test_get_all_artists(self):
         response = self.client.get(reverse("artist-list"))
-        artists = Artist.objects.all()
+        artists = Artist.objects.order_by("pk")
         serializer = ArtistSerializer(artists, many=True)
         # self.assertEqual method is used to compare two values and check if they are equal.
         # self.assertEqual(actual_value, expected_value, msg=None)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
 
     def test_get_single_artist(self):
         response = self.client.get(reverse("artist-detail", args=[self.artist.id]))
@@ -58,10 +148,10 @@ class AlbumViewSetTests(APITestCase):
 
     def test_get_all_albums(self):
         response = self.client.get(reverse("album-list"))
-        albums = Album.objects.all()
+        albums = Album.objects.order_by("pk")
         serializer = AlbumSerializer(albums, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
 
     def test_get_single_album(self):
         response = self.client.get(reverse("album-detail", args=[self.album.id]))
@@ -108,10 +198,10 @@ class TrackViewSetTests(APITestCase):
 
     def test_get_all_tracks(self):
         response = self.client.get(reverse("track-list"))
-        tracks = Track.objects.all()
+        tracks = Track.objects.order_by("pk")
         serializer = TrackSerializer(tracks, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
 
     def test_get_single_track(self):
         response = self.client.get(reverse("track-detail", args=[self.track.id]))
@@ -148,10 +238,10 @@ class PlaylistViewSetTests(APITestCase):
 
     def test_get_all_playlists(self):
         response = self.client.get(reverse("playlist-list"))
-        playlists = Playlist.objects.all()
+        playlists = Playlist.objects.order_by("pk")
         serializer = PlaylistSerializer(playlists, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.data["results"], serializer.data)
 
     def test_get_single_playlist(self):
         response = self.client.get(
@@ -224,6 +314,8 @@ class PlaylistWebTests(TestCase):
             reverse("playlist_detail", args=[self.playlist.uuid]), {"delete": "delete"}
         )
         self.assertEqual(response.status_code, 302)
+        self.assertEqual(Job.objects.get().kind, "delete_playlist")
+        run_pending()
         self.assertEqual(Playlist.objects.count(), 0)
 
     def test_add_track_to_playlist_view(self):
@@ -234,3 +326,1990 @@ class PlaylistWebTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(self.playlist.tracks.count(), 1)
         self.assertEqual(self.playlist.tracks.first().title, "Track 1")
+
+
+class PlaylistSerializerWriteTests(TestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Artist 1")
+        self.album = Album.objects.create(title="Album 1", artist=self.artist)
+        self.tracks = Track.objects.bulk_create(
+            [Track(title=f"Track {i}", album=self.album) for i in range(50)]
+        )
+
+    def payload(self, tracks):
+        return {
+            "name": "Bulk Playlist",
+            "tracks": [
+                {"track": track.id, "order": order}
+                for order, track in enumerate(tracks, 1)
+            ],
+        }
+
+    def stored(self, playlist):
+        return list(
+            PlaylistTrack.objects.filter(playlist=playlist)
+            .order_by("order")
+            .values_list("track_id", "order")
+        )
+
+    def test_create_validates_tracks_with_one_query(self):
+        serializer = PlaylistSerializer(data=self.payload(self.tracks))
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+
+    def test_create_bulk_inserts_tracks(self):
+        serializer = PlaylistSerializer(data=self.payload(self.tracks))
+        serializer.is_valid(raise_exception=True)
+        # SAVEPOINT, artist COUNT, playlist INSERT and its change log entry,
+        # track INSERT and theirs, artist reference INSERT, first revision
+        # INSERT, RELEASE SAVEPOINT
+        with self.assertNumQueries(9):
+            playlist = serializer.save()
+        self.assertEqual(
+            self.stored(playlist),
+            [(track.id, order) for order, track in enumerate(self.tracks, 1)],
+        )
+
+    def test_invalid_track_is_rejected(self):
+        data = self.payload(self.tracks[:2])
+        data["tracks"][1]["track"] = 0
+        serializer = PlaylistSerializer(data=data)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors["tracks"][0], {})
+        self.assertIn("track", serializer.errors["tracks"][1])
+
+    def test_duplicate_order_is_rejected(self):
+        data = self.payload(self.tracks[:1])
+        data["tracks"].append({"track": self.tracks[1].id, "order": 1})
+        serializer = PlaylistSerializer(data=data)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("order", serializer.errors["tracks"][1])
+
+    def test_update_only_writes_changed_rows(self):
+        serializer = PlaylistSerializer(data=self.payload(self.tracks[:10]))
+        serializer.is_valid(raise_exception=True)
+        playlist = serializer.save()
+        kept = set(
+            PlaylistTrack.objects.filter(playlist=playlist, order__lte=8).values_list(
+                "pk", flat=True
+            )
+        )
+
+        # Drop track 10, move track 9 to the end and append two new tracks.
+        new_tracks = self.tracks[:8] + self.tracks[10:12] + [self.tracks[8]]
+        serializer = PlaylistSerializer(playlist, data=self.payload(new_tracks))
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(
+            self.stored(playlist),
+            [(track.id, order) for order, track in enumerate(new_tracks, 1)],
+        )
+        self.assertTrue(
+            kept.issubset(
+                PlaylistTrack.objects.filter(playlist=playlist).values_list(
+                    "pk", flat=True
+                )
+            )
+        )
+
+    def test_update_without_tracks_keeps_rows(self):
+        serializer = PlaylistSerializer(data=self.payload(self.tracks[:3]))
+        serializer.is_valid(raise_exception=True)
+        playlist = serializer.save()
+        serializer = PlaylistSerializer(
+            playlist, data={"name": "Renamed"}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(len(self.stored(playlist)), 3)
+
+
+class ViewSetQueryCountTests(APITestCase):
+    # The list endpoints must run the same number of queries at every size.
+    sizes = [1, 100, 10000]
+
+    def grow(self, size):
+        count = Artist.objects.count()
+        if count >= size:
+            return
+        artists = Artist.objects.bulk_create(
+            [Artist(name=f"Artist {i}") for i in range(count, size)]
+        )
+        albums = Album.objects.bulk_create(
+            [Album(title=f"Album {a.name}", artist=a) for a in artists]
+        )
+        tracks = Track.objects.bulk_create(
+            [Track(title=f"Track {a.title}", album=a) for a in albums]
+        )
+        playlists = Playlist.objects.bulk_create(
+            [Playlist(name=f"Playlist {t.title}") for t in tracks]
+        )
+        PlaylistTrack.objects.bulk_create(
+            [
+                PlaylistTrack(playlist=p, track=t, order=order)
+                for p, t in zip(playlists, tracks)
+                for order in (1, 2)
+            ]
+        )
+
+    def assertListQueries(self, url_name, num):
+        for size in self.sizes:
+            self.grow(size)
+            # bulk_create sends no signals; measure the database, not the cache.
+            get_cache().clear()
+            with self.subTest(size=size), self.assertNumQueries(num):
+                response = self.client.get(reverse(url_name))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_artist_list_queries(self):
+        self.assertListQueries("artist-list", 1)
+
+    def test_album_list_queries(self):
+        self.assertListQueries("album-list", 1)
+
+    def test_track_list_queries(self):
+        self.assertListQueries("track-list", 1)
+
+    def test_playlist_list_queries(self):
+        # playlists, then their tracks
+        self.assertListQueries("playlist-list", 2)
+
+
+class PaginationAndFieldsetTests(APITestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Artist 1")
+        self.album = Album.objects.create(title="Album 1", artist=self.artist)
+        self.tracks = Track.objects.bulk_create(
+            [Track(title=f"Track {i}", album=self.album) for i in range(5)]
+        )
+        self.playlist = Playlist.objects.create(name="Test Playlist")
+        PlaylistTrack.objects.bulk_create(
+            [
+                PlaylistTrack(playlist=self.playlist, track=track, order=order)
+                for order, track in enumerate(reversed(self.tracks), 1)
+            ]
+        )
+
+    def collect(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data["results"])
+            url = response.data["next"]
+        return pages
+
+    def test_track_list_is_cursor_paginated(self):
+        pages = self.collect(reverse("track-list") + "?page_size=2")
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(
+            [row["id"] for page in pages for row in page],
+            sorted(track.id for track in self.tracks),
+        )
+
+    def test_playlist_tracks_are_paginated_by_order(self):
+        pages = self.collect(
+            reverse("playlist-tracks", args=[self.playlist.uuid]) + "?page_size=2"
+        )
+        self.assertEqual(
+            [row["order"] for page in pages for row in page], [1, 2, 3, 4, 5]
+        )
+        self.assertEqual(pages[0][0]["track"], self.tracks[-1].id)
+
+    def test_playlist_tracks_unknown_playlist(self):
+        response = self.client.get(reverse("playlist-tracks", args=["not-a-uuid"]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_sparse_fieldset(self):
+        response = self.client.get(reverse("track-list") + "?fields=id,title")
+        self.assertEqual(set(response.data["results"][0]), {"id", "title"})
+
+    def test_sparse_fieldset_skips_nested_tracks(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("playlist-list") + "?fields=uuid,name")
+        self.assertEqual(
+            response.data["results"],
+            [{"uuid": str(self.playlist.uuid), "name": self.playlist.name}],
+        )
+
+
+class CatalogueExportTests(TestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Artist 1")
+        self.album = Album.objects.create(title="Album 1", artist=self.artist)
+        self.track1 = Track.objects.create(title="Track 1", album=self.album)
+        self.track2 = Track.objects.create(title="Track 2", album=self.album)
+        Artist.objects.create(name="Artist 2")
+        self.playlist = Playlist.objects.create(name="Test Playlist")
+        self.playlist.tracks.add(self.track2, through_defaults={"order": 1})
+        self.playlist.tracks.add(self.track1, through_defaults={"order": 2})
+
+    def check_records(self, data):
+        records = [json.loads(line) for line in data.decode().splitlines()]
+        self.assertEqual([r["type"] for r in records], ["artist", "artist", "playlist"])
+        self.assertEqual(
+            records[0]["albums"],
+            [
+                {
+                    "id": self.album.id,
+                    "title": "Album 1",
+                    "tracks": [
+                        {"id": self.track1.id, "title": "Track 1"},
+                        {"id": self.track2.id, "title": "Track 2"},
+                    ],
+                }
+            ],
+        )
+        self.assertEqual(records[1]["albums"], [])
+        self.assertEqual(records[2]["uuid"], str(self.playlist.uuid))
+        self.assertEqual(
+            records[2]["tracks"],
+            [
+                {"track": self.track2.id, "order": 1},
+                {"track": self.track1.id, "order": 2},
+            ],
+        )
+
+    def test_export_endpoint_streams_ndjson(self):
+        response = self.client.get(reverse("catalogue_export"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.check_records(b"".join(response.streaming_content))
+
+    def test_export_endpoint_gzip(self):
+        response = self.client.get(
+            reverse("catalogue_export"), headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.check_records(gzip.decompress(b"".join(response.streaming_content)))
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "catalogue.ndjson.gz")
+            call_command("export_catalogue", output=path, chunk_size=1)
+            with gzip.open(path) as stream:
+                self.check_records(stream.read())
+
+    def test_playlist_records_group_streamed_rows(self):
+        empty = Playlist.objects.create(name="Empty")
+        other = Playlist.objects.create(name="Other")
+        other.tracks.add(self.track1, through_defaults={"order": 5})
+        records = {
+            record["uuid"]: record["tracks"]
+            for record in playlist_records(chunk_size=1)
+        }
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[empty.uuid], [])
+        self.assertEqual(records[other.uuid], [{"track": self.track1.id, "order": 5}])
+        self.assertEqual(
+            [row["track"] for row in records[self.playlist.uuid]],
+            [self.track2.id, self.track1.id],
+        )
+
+
+class ImportCatalogueTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.rows = [
+            {"artist": "Artist 1", "album": "Album 1", "track": "Track 1"},
+            {"artist": "Artist 1", "album": "Album 1", "track": "Track 2"},
+            {"artist": "Artist 1", "album": "Album 2", "track": "Track 3"},
+            {"artist": "Artist 2", "album": "Album 1", "track": "Track 4"},
+        ]
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as stream:
+            stream.write(content)
+        return path
+
+    def write_csv(self, rows):
+        lines = ["artist,album,track"]
+        lines += [f"{r['artist']},{r['album']},{r['track']}" for r in rows]
+        return self.write("catalogue.csv", "\n".join(lines) + "\n")
+
+    def import_file(self, path, **options):
+        call_command("import_catalogue", path, stdout=io.StringIO(), **options)
+
+    def assertCatalogue(self, rows):
+        self.assertEqual(
+            sorted(
+                Track.objects.values_list(
+                    "album__artist__name", "album__title", "title"
+                )
+            ),
+            sorted((r["artist"], r["album"], r["track"]) for r in rows),
+        )
+
+    def test_import_csv_dedupes_artists_and_albums(self):
+        Artist.objects.create(name="Artist 2")
+        self.import_file(self.write_csv(self.rows), batch_size=3)
+        self.assertCatalogue(self.rows)
+        self.assertEqual(Artist.objects.count(), 2)
+        self.assertEqual(Album.objects.count(), 3)
+        # On PostgreSQL the tracks are written with COPY.
+        self.assertEqual(
+            Change.objects.filter(kind="track", action="create").count(), 4
+        )
+
+    def test_import_ndjson(self):
+        path = self.write(
+            "catalogue.ndjson", "".join(json.dumps(r) + "\n" for r in self.rows)
+        )
+        self.import_file(path)
+        self.assertCatalogue(self.rows)
+
+    def test_format_from_file_suffix(self):
+        self.assertEqual(guess_format("/data/csvdump/tracks.ndjson"), "ndjson")
+        self.assertEqual(guess_format("/data/tracks.csv.gz"), "csv")
+        self.assertEqual(guess_format("/data/tracks.ndjson.gz"), "ndjson")
+        self.assertEqual(guess_format("tracks.csv"), "csv")
+
+    def test_import_resumes_from_checkpoint(self):
+        path = self.write_csv(
+            self.rows[:2] + [{"artist": "", "album": "", "track": ""}]
+        )
+        with self.assertRaises(CommandError):
+            self.import_file(path, batch_size=2)
+        self.assertCatalogue(self.rows[:2])
+        self.assertEqual(ImportCheckpoint.objects.get(source=path).rows, 2)
+
+        # Fix the broken row; the first batch must not be imported again.
+        path = self.write_csv(self.rows)
+        self.import_file(path, batch_size=2)
+        self.assertCatalogue(self.rows)
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_checkpoint_commits_with_the_batch(self):
+        path = self.write_csv(self.rows)
+        with mock.patch.object(
+            ImportCheckpoint.objects, "update_or_create", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.import_file(path, batch_size=2)
+        # The batch rolled back with its checkpoint, so nothing is imported twice.
+        self.assertFalse(Track.objects.exists())
+        self.import_file(path, batch_size=2)
+        self.assertCatalogue(self.rows)
+
+
+class PlaylistCacheTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.artist = Artist.objects.create(name="Artist 1")
+        self.album = Album.objects.create(title="Album 1", artist=self.artist)
+        self.track1 = Track.objects.create(title="Track 1", album=self.album)
+        self.track2 = Track.objects.create(title="Track 2", album=self.album)
+        self.playlist = Playlist.objects.create(name="Test Playlist")
+        self.playlist.tracks.add(self.track1, through_defaults={"order": 1})
+        self.url = reverse("playlist-detail", args=[self.playlist.uuid])
+
+    def test_detail_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertIn("Last-Modified", second)
+
+    def test_track_change_invalidates_detail_and_list(self):
+        self.client.get(self.url)
+        self.client.get(reverse("playlist-list"))
+        self.playlist.tracks.add(self.track2, through_defaults={"order": 2})
+
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data["tracks"]), 2)
+        response = self.client.get(reverse("playlist-list"))
+        self.assertEqual(len(response.data["results"][0]["tracks"]), 2)
+
+    def test_serializer_write_invalidates_detail(self):
+        etag = self.client.get(self.url)["ETag"]
+        serializer = PlaylistSerializer(
+            self.playlist,
+            data={"name": "Renamed", "tracks": [{"track": self.track2.id, "order": 1}]},
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        response = self.client.get(self.url)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["name"], "Renamed")
+        self.assertEqual(
+            response.data["tracks"], [{"track": self.track2.id, "order": 1}]
+        )
+
+    def test_conditional_request_returns_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_template_detail_is_cached_and_invalidated(self):
+        url = reverse("playlist_detail", args=[self.playlist.uuid])
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "Track 1")
+
+        self.playlist.tracks.add(self.track2, through_defaults={"order": 2})
+        self.assertContains(self.client.get(url), "Track 2")
+
+
+class PlaylistTrackOrderingTests(APITestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Artist 1")
+        self.album = Album.objects.create(title="Album 1", artist=self.artist)
+        self.tracks = Track.objects.bulk_create(
+            [Track(title=f"Track {i}", album=self.album) for i in range(5)]
+        )
+        self.playlist = Playlist.objects.create(name="Test Playlist")
+        PlaylistTrack.objects.bulk_create(
+            [
+                PlaylistTrack(
+                    playlist=self.playlist, track=track, order=order * ORDER_GAP
+                )
+                for order, track in enumerate(self.tracks[:3], 1)
+            ]
+        )
+        # bulk_create bypasses the summary columns.
+        rebuild_summaries()
+
+    def post(self, name, data):
+        url = reverse(f"playlist-{name}", args=[self.playlist.uuid])
+        return self.client.post(url, data, format="json")
+
+    def track_ids(self):
+        return list(
+            PlaylistTrack.objects.filter(playlist=self.playlist)
+            .order_by("order")
+            .values_list("track_id", flat=True)
+        )
+
+    def orders(self):
+        return dict(
+            PlaylistTrack.objects.filter(playlist=self.playlist).values_list(
+                "pk", "order"
+            )
+        )
+
+    def test_insert_at_top_middle_and_end(self):
+        t0, t1, t2, t3, t4 = [track.id for track in self.tracks]
+        response = self.post("insert-track", {"track": t3})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["order"], 4 * ORDER_GAP)
+        self.post("insert-track", {"track": t4, "after": None})
+        self.post("insert-track", {"track": t4, "after": ORDER_GAP})
+        self.assertEqual(self.track_ids(), [t4, t0, t4, t1, t2, t3])
+
+    def test_move_writes_one_row(self):
+        before = self.orders()
+        response = self.post("move-track", {"order": 3 * ORDER_GAP, "after": None})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        after = self.orders()
+        changed = [pk for pk in before if before[pk] != after[pk]]
+        self.assertEqual(len(changed), 1)
+        self.assertEqual(
+            self.track_ids(), [self.tracks[2].id, self.tracks[0].id, self.tracks[1].id]
+        )
+
+    def test_renumbers_when_gap_runs_out(self):
+        # Keep inserting right after the first track until the gap is used up.
+        for _ in range(12):
+            self.post("insert-track", {"track": self.tracks[4].id, "after": ORDER_GAP})
+        ids = self.track_ids()
+        self.assertEqual(len(ids), 15)
+        self.assertEqual(ids[0], self.tracks[0].id)
+        self.assertEqual(ids[-2:], [self.tracks[1].id, self.tracks[2].id])
+        self.assertEqual(len(set(self.orders().values())), 15)
+
+    def test_remove(self):
+        response = self.post("remove-track", {"order": 2 * ORDER_GAP})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.track_ids(), [self.tracks[0].id, self.tracks[2].id])
+
+    def test_unknown_order_is_rejected(self):
+        response = self.post("move-track", {"order": 7, "after": None})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.post("insert-track", {"track": self.tracks[3].id, "after": 7})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_playlist(self):
+        url = reverse("playlist-remove-track", args=[uuid.uuid4()])
+        response = self.client.post(url, {"order": ORDER_GAP}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_renumber_keeps_order(self):
+        PlaylistTrack.objects.filter(playlist=self.playlist).update(
+            order=F("order") / ORDER_GAP
+        )
+        renumber(self.playlist)
+        self.assertEqual(
+            sorted(self.orders().values()), [ORDER_GAP, 2 * ORDER_GAP, 3 * ORDER_GAP]
+        )
+        self.assertEqual(self.track_ids(), [track.id for track in self.tracks[:3]])
+
+
+class QueryPlanTests(TestCase):
+    # Every hot query must be answered from an index. The planner is given table
+    # statistics for a dataset large enough that a sequential scan would be slow.
+    @classmethod
+    def setUpTestData(cls):
+        artists = Artist.objects.bulk_create(
+            [Artist(name=f"Artist {i}") for i in range(2000)]
+        )
+        albums = Album.objects.bulk_create(
+            [
+                Album(title=f"Album {a.pk}-{i}", artist=a)
+                for a in artists
+                for i in range(3)
+            ]
+        )
+        tracks = Track.objects.bulk_create(
+            [
+                Track(title=f"Track {a.pk}-{i}", album=a)
+                for a in albums
+                for i in range(4)
+            ]
+        )
+        playlists = Playlist.objects.bulk_create(
+            [Playlist(name=f"Playlist {i}") for i in range(2000)]
+        )
+        PlaylistTrack.objects.bulk_create(
+            [
+                PlaylistTrack(playlist=p, track=t, order=order * ORDER_GAP)
+                for i, p in enumerate(playlists)
+                for order, t in enumerate(tracks[i * 10 : i * 10 + 10], 1)
+            ]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.artist, cls.album, cls.playlist = artists[7], albums[7], playlists[7]
+
+    def assertIndexScan(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == "postgresql":
+            self.assertNotIn("Seq Scan", plan)
+        else:
+            for line in plan.splitlines():
+                if "SCAN" in line:
+                    self.assertIn("INDEX", line, plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_playlist_tracks_by_order(self):
+        self.assertIndexScan(
+            PlaylistTrack.objects.filter(playlist=self.playlist).order_by("order")
+        )
+        self.assertIndexScan(
+            PlaylistTrack.objects.filter(
+                playlist=self.playlist, order__gt=10 * ORDER_GAP
+            ).order_by("order")[:100]
+        )
+
+    def test_albums_by_artist(self):
+        self.assertIndexScan(Album.objects.filter(artist=self.artist))
+        self.assertIndexScan(Album.objects.filter(artist=self.artist).order_by("title"))
+
+    def test_name_and_title_lookups(self):
+        self.assertIndexScan(Artist.objects.filter(name="Artist 7"))
+        self.assertIndexScan(Album.objects.filter(title=self.album.title))
+        self.assertIndexScan(Track.objects.filter(title=f"Track {self.album.pk}-3"))
+        self.assertIndexScan(Playlist.objects.filter(name="Playlist 7"))
+
+    def test_search(self):
+        if connection.vendor == "postgresql":
+            query = SearchQuery(
+                f"{self.album.pk}:*", search_type="raw", config="simple"
+            )
+            queryset = Track.objects.annotate(search=search_vector("title")).filter(
+                search=query
+            )
+        else:
+            term = str(self.album.pk)
+            queryset = SearchTerm.objects.filter(
+                kind="track", term__gte=term, term__lt=term + "\U0010ffff"
+            )
+        self.assertIndexScan(queryset)
+
+    def test_playlists_of_track(self):
+        track = self.playlist.tracks.first()
+        self.assertIndexScan(PlaylistTrack.objects.filter(track=track).order_by())
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="The Rolling Stones")
+        self.album = Album.objects.create(title="Let It Bleed", artist=self.artist)
+        self.rock = Track.objects.create(title="Rock and Roll", album=self.album)
+        self.rocket = Track.objects.create(title="Rocket Man", album=self.album)
+        self.other = Track.objects.create(title="Gimme Shelter", album=self.album)
+
+    def titles(self, kind, query):
+        return {str(obj) for obj in search(kind, query)}
+
+    def test_prefix_match(self):
+        self.assertEqual(self.titles("track", "roc"), {"Rock and Roll", "Rocket Man"})
+        self.assertEqual(self.titles("artist", "roll"), {"The Rolling Stones"})
+        self.assertEqual(self.titles("album", "BLEED"), {"Let It Bleed"})
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.titles("track", "rock man"), {"Rocket Man"})
+        self.assertEqual(
+            self.titles("track", "ro rock"), {"Rock and Roll", "Rocket Man"}
+        )
+        self.assertEqual(self.titles("track", "rock jazz"), set())
+        self.assertEqual(self.titles("track", "  "), set())
+
+    def test_index_follows_saves_and_deletes(self):
+        self.other.title = "Rockin' Shelter"
+        self.other.save()
+        self.rocket.delete()
+        self.assertEqual(
+            self.titles("track", "rock"), {"Rock and Roll", "Rockin' Shelter"}
+        )
+        self.assertEqual(self.titles("track", "gimme"), set())
+
+    def test_search_endpoint(self):
+        response = self.client.get(reverse("catalogue_search"), {"q": "rock"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["artists"], [])
+        self.assertEqual(
+            {track["id"] for track in response.data["tracks"]},
+            {self.rock.id, self.rocket.id},
+        )
+        response = self.client.get(
+            reverse("catalogue_search"), {"q": "rock", "limit": 1}
+        )
+        self.assertEqual(len(response.data["tracks"]), 1)
+
+    def test_viewset_search_parameter(self):
+        response = self.client.get(reverse("track-list"), {"q": "shelter"})
+        self.assertEqual(response.data["results"], [TrackSerializer(self.other).data])
+
+    def test_imported_rows_are_searchable(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "catalogue.ndjson")
+            with open(path, "w") as stream:
+                row = {"artist": "Queen", "album": "Jazz", "track": "Bicycle Race"}
+                stream.write(json.dumps(row) + "\n")
+            call_command("import_catalogue", path, stdout=io.StringIO())
+        self.assertEqual(self.titles("track", "bicycle"), {"Bicycle Race"})
+        self.assertEqual(self.titles("artist", "queen"), {"Queen"})
+
+    def test_rebuild_search_index(self):
+        SearchTerm.objects.all().delete()
+        call_command("rebuild_search_index", stdout=io.StringIO())
+        self.assertEqual(self.titles("track", "rocket"), {"Rocket Man"})
+
+
+class TrackPickerTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.queen = Artist.objects.create(name="Queen")
+        self.jazz = Album.objects.create(title="Jazz", artist=self.queen)
+        self.opera = Album.objects.create(
+            title="A Night at the Opera", artist=self.queen
+        )
+        self.race = Track.objects.create(title="Bicycle Race", album=self.jazz)
+        self.mustapha = Track.objects.create(title="Mustapha", album=self.jazz)
+        self.rhapsody = Track.objects.create(
+            title="Bohemian Rhapsody", album=self.opera
+        )
+        self.playlist = Playlist.objects.create(name="Test Playlist")
+
+    def autocomplete(self, **params):
+        return self.client.get(reverse("track-autocomplete"), params)
+
+    def test_title_matches_come_before_album_and_artist_matches(self):
+        response = self.autocomplete(q="b")
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]],
+            [self.race.id, self.rhapsody.id],
+        )
+        response = self.autocomplete(q="queen")
+        self.assertEqual(
+            {row["id"] for row in response.data["results"]},
+            {self.race.id, self.mustapha.id, self.rhapsody.id},
+        )
+        self.assertEqual(
+            response.data["results"][0],
+            {
+                "id": self.race.id,
+                "title": "Bicycle Race",
+                "album_title": "Jazz",
+                "artist_name": "Queen",
+            },
+        )
+
+    def test_autocomplete_is_paginated(self):
+        first = self.autocomplete(q="queen", limit=2)
+        self.assertEqual(len(first.data["results"]), 2)
+        self.assertEqual(first.data["next_offset"], 2)
+        second = self.autocomplete(q="queen", limit=2, offset=2)
+        self.assertEqual(len(second.data["results"]), 1)
+        self.assertIsNone(second.data["next_offset"])
+
+    def test_autocomplete_is_cached_until_catalogue_changes(self):
+        self.autocomplete(q="mus")
+        with self.assertNumQueries(0):
+            self.autocomplete(q="mus")
+        Track.objects.create(title="Music Is Life", album=self.jazz)
+        self.assertEqual(len(self.autocomplete(q="mus").data["results"]), 2)
+
+    def test_add_track_page_does_not_list_tracks(self):
+        response = self.client.get(
+            reverse("playlist_add_track", args=[self.playlist.uuid])
+        )
+        self.assertNotContains(response, "Bicycle Race")
+        self.assertContains(response, reverse("track-autocomplete"))
+
+    def test_add_many_tracks_from_page(self):
+        response = self.client.post(
+            reverse("playlist_add_track", args=[self.playlist.uuid]),
+            {"track": [self.rhapsody.id, self.race.id, self.rhapsody.id]},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            list(
+                PlaylistTrack.objects.filter(playlist=self.playlist).values_list(
+                    "track_id", "order"
+                )
+            ),
+            [
+                (self.rhapsody.id, ORDER_GAP),
+                (self.race.id, 2 * ORDER_GAP),
+                (self.rhapsody.id, 3 * ORDER_GAP),
+            ],
+        )
+
+    def test_add_unknown_track_from_page(self):
+        response = self.client.post(
+            reverse("playlist_add_track", args=[self.playlist.uuid]),
+            {"track": [self.race.id, 0]},
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.playlist.tracks.count(), 0)
+
+    def test_append_tracks_endpoint(self):
+        url = reverse("playlist-append-tracks", args=[self.playlist.uuid])
+        response = self.client.post(
+            url, {"tracks": [self.race.id, self.mustapha.id]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            response.data,
+            [
+                {"track": self.race.id, "order": ORDER_GAP},
+                {"track": self.mustapha.id, "order": 2 * ORDER_GAP},
+            ],
+        )
+        response = self.client.post(url, {"tracks": [0]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PlaylistSummaryTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.artists = Artist.objects.bulk_create(
+            [Artist(name=f"Artist {i}") for i in range(2)]
+        )
+        albums = Album.objects.bulk_create(
+            [
+                Album(title=f"Album {i}", artist=artist)
+                for i, artist in enumerate(self.artists)
+            ]
+        )
+        self.tracks = Track.objects.bulk_create(
+            [Track(title=f"Track {i}", album=albums[i % 2]) for i in range(4)]
+        )
+        serializer = PlaylistSerializer(
+            data={
+                "name": "Test Playlist",
+                "tracks": [{"track": self.tracks[0].id, "order": ORDER_GAP}],
+            }
+        )
+        serializer.is_valid(raise_exception=True)
+        self.playlist = serializer.save()
+
+    def summary(self):
+        self.playlist.refresh_from_db()
+        return self.playlist.track_count, self.playlist.artist_count
+
+    def test_create(self):
+        self.assertEqual(self.summary(), (1, 1))
+
+    def test_endpoints_keep_summary(self):
+        url = reverse("playlist-append-tracks", args=[self.playlist.uuid])
+        self.client.post(
+            url, {"tracks": [self.tracks[1].id, self.tracks[2].id]}, format="json"
+        )
+        self.assertEqual(self.summary(), (3, 2))
+
+        before = self.playlist.last_modified
+        url = reverse("playlist-move-track", args=[self.playlist.uuid])
+        self.client.post(url, {"order": ORDER_GAP}, format="json")
+        self.assertEqual(self.summary(), (3, 2))
+        self.assertGreater(self.playlist.last_modified, before)
+
+        url = reverse("playlist-remove-track", args=[self.playlist.uuid])
+        self.client.post(url, {"order": 2 * ORDER_GAP}, format="json")
+        self.assertEqual(self.summary(), (2, 1))
+
+    def test_serializer_update_and_m2m(self):
+        serializer = PlaylistSerializer(
+            self.playlist,
+            data={
+                "name": "Test Playlist",
+                "tracks": [
+                    {"track": self.tracks[1].id, "order": 1},
+                    {"track": self.tracks[3].id, "order": 2},
+                ],
+            },
+        )
+        serializer.is_valid(raise_exception=True)
+        self.assertEqual(serializer.save().artist_count, 1)
+        self.assertEqual(self.summary(), (2, 1))
+
+        self.playlist.tracks.add(self.tracks[0], through_defaults={"order": 3})
+        self.assertEqual(self.summary(), (3, 2))
+        self.tracks[0].playlist_set.clear()
+        self.assertEqual(self.summary(), (2, 1))
+
+    def test_single_row_edits_do_not_recount_playlist(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.playlist.tracks.add(self.tracks[2], through_defaults={"order": 2})
+            self.playlist.tracks.add(self.tracks[1], through_defaults={"order": 3})
+            self.tracks[2].playlist_set.clear()
+        self.assertFalse(
+            any("COUNT(DISTINCT" in query["sql"].upper() for query in queries)
+        )
+        self.assertEqual(self.summary(), (2, 2))
+        self.assertEqual(
+            dict(
+                PlaylistArtist.objects.filter(playlist=self.playlist).values_list(
+                    "artist", "tracks"
+                )
+            ),
+            {self.artists[0].pk: 1, self.artists[1].pk: 1},
+        )
+        self.assertEqual(list(summary_mismatches()), [])
+
+    def test_moving_albums_and_tracks_recounts_artists(self):
+        self.playlist.tracks.add(self.tracks[1], through_defaults={"order": 2})
+        self.assertEqual(self.summary(), (2, 2))
+        album = self.tracks[1].album
+        album.artist = self.artists[0]
+        album.save()
+        self.assertEqual(self.summary(), (2, 1))
+        track = Track.objects.get(pk=self.tracks[0].pk)
+        track.album = Album.objects.create(title="Other", artist=self.artists[1])
+        track.save()
+        self.assertEqual(self.summary(), (2, 2))
+        self.assertEqual(list(summary_mismatches()), [])
+
+    def test_deleting_playlist(self):
+        self.playlist.delete()
+        self.assertFalse(Playlist.objects.exists())
+
+    def test_list_does_not_read_tracks(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("playlist-list"), {"fields": "uuid,track_count"}
+            )
+            self.client.get(reverse("playlist_list"))
+        self.assertEqual(response.data["results"][0]["track_count"], 1)
+        self.assertFalse(
+            any("playlist_playlisttrack" in query["sql"] for query in queries)
+        )
+
+    def test_rebuild_command(self):
+        Playlist.objects.update(track_count=0, artist_count=0)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_playlist_summaries", "--verify", stdout=io.StringIO())
+        call_command("rebuild_playlist_summaries", stdout=io.StringIO())
+        call_command("rebuild_playlist_summaries", "--verify", stdout=io.StringIO())
+        self.assertEqual(self.summary(), (1, 1))
+
+
+class AsyncReadApiTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.artist = Artist.objects.create(name="Artist 1")
+        self.album = Album.objects.create(title="Album 1", artist=self.artist)
+        self.track = Track.objects.create(title="Track 1", album=self.album)
+        for i in range(3):
+            playlist = Playlist.objects.create(name=f"Playlist {i}")
+            playlist.tracks.add(self.track, through_defaults={"order": 1})
+
+    async def test_retrieve_matches_sync_api(self):
+        for name, pk in [
+            ("artist", self.artist.pk),
+            ("album", self.album.pk),
+            ("track", self.track.pk),
+        ]:
+            response = await self.async_client.get(
+                reverse(f"async-{name}-detail", args=[pk])
+            )
+            sync = await self.async_client.get(reverse(f"{name}-detail", args=[pk]))
+            self.assertEqual(response.json(), sync.json())
+
+        response = await self.async_client.get(reverse("async-artist-detail", args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_playlist_detail(self):
+        playlist = await Playlist.objects.afirst()
+        url = reverse("async-playlist-detail", args=[playlist.pk])
+        response = await self.async_client.get(url, {"fields": "name,tracks"})
+        self.assertEqual(
+            response.json(),
+            {"name": playlist.name, "tracks": [{"track": self.track.pk, "order": 1}]},
+        )
+        response = await self.async_client.get(
+            url, headers={"if-none-match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_playlist_list_pages_like_sync_api(self):
+        url = reverse("async-playlist-list")
+        response = await self.async_client.get(url, {"page_size": 2})
+        sync = await self.async_client.get(reverse("playlist-list"), {"page_size": 2})
+        self.assertEqual(response.json()["results"], sync.json()["results"])
+
+        response = await self.async_client.get(response.json()["next"])
+        last_page = response.json()
+        self.assertEqual(len(last_page["results"]), 1)
+        self.assertIsNone(last_page["next"])
+
+        response = await self.async_client.get(last_page["previous"])
+        self.assertEqual(response.json()["results"], sync.json()["results"])
+        self.assertIsNone(response.json()["previous"])
+
+
+@override_settings(PLAYLIST_METRICS_SAMPLE_RATE=1.0)
+class PerformanceMetricsTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        registry.clear()
+        artist = Artist.objects.create(name="Artist 1")
+        Album.objects.bulk_create(
+            [Album(title=f"Album {i}", artist=artist) for i in range(3)]
+        )
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("album-list"))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'^total;dur=[\d.]+, sql;dur=[\d.]+;desc="1 queries')
+        self.assertIn("serialize;dur=", timing)
+
+    def test_duplicate_queries_are_counted(self):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            for album in Album.objects.all():
+                album.artist.name
+        finally:
+            _current.reset(token)
+        self.assertEqual(metrics.queries, 4)
+        self.assertEqual(metrics.duplicate_queries, 2)
+
+    def test_metrics_endpoint(self):
+        for _ in range(3):
+            self.client.get(reverse("album-list"))
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn(
+            'playlist_request_duration_seconds_count{method="GET",view="album-list"} 3',
+            text,
+        )
+        self.assertIn(
+            'playlist_request_queries_total{method="GET",view="album-list"} 3', text
+        )
+        self.assertIn(
+            'playlist_request_recent_duration_seconds{method="GET",view="album-list",'
+            'quantile="0.99"}',
+            text,
+        )
+
+    def test_metrics_endpoint_allowed_ips(self):
+        with self.settings(PLAYLIST_METRICS_ALLOWED_IPS=["10.0.0.5"]):
+            response = self.client.get(reverse("metrics"))
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.5")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_sampling(self):
+        with self.settings(PLAYLIST_METRICS_SAMPLE_RATE=0):
+            response = self.client.get(reverse("album-list"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(registry.endpoints, {})
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram()
+        for ms in range(1, 101):
+            histogram.observe(ms / 1000)
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.05, delta=0.05 * 0.25)
+        self.assertAlmostEqual(histogram.quantile(0.99), 0.099, delta=0.099 * 0.25)
+
+
+class BenchmarkTests(TestCase):
+    def test_seed_catalogue(self):
+        counts = seed_catalogue(3, 2, 4, playlists=2, playlist_size=5, seed=1)
+        self.assertEqual(
+            counts, {"artists": 3, "albums": 6, "tracks": 24, "playlists": 2}
+        )
+        self.assertEqual(Track.objects.count(), 24)
+        self.assertEqual(
+            list(Playlist.objects.values_list("track_count", flat=True)), [5, 5]
+        )
+        self.assertEqual(list(summary_mismatches()), [])
+
+    def test_benchmark_writes_results_and_rolls_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark", sizes="100", repeat=1, output=path, stdout=io.StringIO()
+            )
+            with open(path) as stream:
+                results = json.load(stream)["results"]
+        cases = {result["case"] for result in results}
+        self.assertIn("api playlist list", cases)
+        self.assertIn("serializer update", cases)
+        self.assertTrue(all(result["queries"] > 0 for result in results))
+        self.assertFalse(Track.objects.exists())
+
+    def test_compare_flags_regressions(self):
+        def write(directory, name, median_ms, queries):
+            path = os.path.join(directory, name)
+            result = {"size": 100, "case": "api playlist list"}
+            result.update(median_ms=median_ms, queries=queries, peak_kb=10)
+            with open(path, "w") as stream:
+                json.dump({"results": [result]}, stream)
+            return path
+
+        with tempfile.TemporaryDirectory() as directory:
+            base = write(directory, "base.json", 10, 2)
+            same = write(directory, "same.json", 10.5, 2)
+            slower = write(directory, "slower.json", 20, 2)
+            chattier = write(directory, "chattier.json", 10, 3)
+            call_command("benchmark", compare=[base, same], stdout=io.StringIO())
+            for path in (slower, chattier):
+                with self.assertRaises(CommandError):
+                    call_command(
+                        "benchmark", compare=[base, path], stdout=io.StringIO()
+                    )
+
+
+class RowSerializerTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        seed_catalogue(3, 2, 3, playlists=3, playlist_size=4)
+        Playlist.objects.create(name="Empty")
+
+    def assertSameJson(self, url, serializer_class, queryset, **params):
+        response = self.client.get(url, params)
+        request = response.wsgi_request
+        context = {"request": Request(request)}
+        expected = serializer_class(queryset.order_by("pk"), many=True, context=context)
+        renderer = JSONRenderer()
+        self.assertEqual(
+            renderer.render(response.data["results"]), renderer.render(expected.data)
+        )
+
+    def test_list_endpoints_match_model_serializers(self):
+        for name, serializer_class, model in [
+            ("artist", ArtistSerializer, Artist),
+            ("album", AlbumSerializer, Album),
+            ("track", TrackSerializer, Track),
+            ("playlist", PlaylistSerializer, Playlist),
+        ]:
+            with self.subTest(name):
+                url = reverse(f"{name}-list")
+                self.assertSameJson(url, serializer_class, model.objects.all())
+                self.assertSameJson(
+                    url,
+                    serializer_class,
+                    model.objects.all(),
+                    fields="tracks,title,name,unknown",
+                )
+
+    def test_plans_are_cached(self):
+        rows = row_serializer(TrackSerializer)
+        self.assertIs(rows.plan({"title", "bogus"}), rows.plan({"title"}))
+
+
+class RendererAndCompressionTests(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        seed_catalogue(5, 2, 20, playlists=2, playlist_size=50)
+
+    def test_fast_renderer_matches_stdlib(self):
+        data = {
+            "uuid": uuid.uuid4(),
+            "name": "Café\u2028line\u2029",
+            "when": datetime.datetime(2024, 1, 2, 3, 4, 5, 6, tzinfo=datetime.UTC),
+            "price": decimal.Decimal("1.50"),
+            "items": [1, None, True, {"nested": "x"}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, "application/json; indent=2"),
+            JSONRenderer().render(data, "application/json; indent=2"),
+        )
+
+    def test_large_responses_are_gzipped(self):
+        url = reverse("track-list")
+        response = self.client.get(url, headers={"accept-encoding": "gzip"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+        response = self.client.get(
+            url, {"page_size": 1}, headers={"accept-encoding": "gzip"}
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+        response = self.client.get(url, headers={"accept-encoding": "gzip;q=0"})
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_html_is_not_compressed(self):
+        playlist = Playlist.objects.first()
+        response = self.client.get(
+            reverse("playlist_detail", args=[playlist.uuid]),
+            headers={"accept-encoding": "gzip, br"},
+        )
+        self.assertGreater(len(response.content), settings.PLAYLIST_COMPRESS_MIN_SIZE)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    @skipUnless(brotli, "brotli is not installed")
+    def test_brotli_is_preferred(self):
+        response = self.client.get(
+            reverse("track-list"), headers={"accept-encoding": "gzip, br"}
+        )
+        self.assertEqual(response["Content-Encoding"], "br")
+
+    @skipUnless(msgpack, "msgpack is not installed")
+    def test_msgpack(self):
+        url = reverse("track-list")
+        response = self.client.get(url, headers={"accept": "application/msgpack"})
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content), self.client.get(url).json())
+
+    @skipIf(msgpack, "msgpack is installed")
+    def test_msgpack_is_not_offered_without_the_package(self):
+        response = self.client.get(
+            reverse("track-list"), headers={"accept": "application/msgpack"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+
+
+class BatchLookupTests(APITestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Artist 1")
+        self.album = Album.objects.create(title="Album 1", artist=self.artist)
+        self.tracks = Track.objects.bulk_create(
+            [Track(title=f"Track {i}", album=self.album) for i in range(3)]
+        )
+
+    def test_ids_in_request_order_with_one_query(self):
+        t0, t1, t2 = self.tracks
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("track-list"), {"ids": f"{t2.id},{t0.id},999999,{t2.id}"}
+            )
+        self.assertEqual(
+            response.data["results"],
+            TrackSerializer([t2, t0], many=True).data,
+        )
+        self.assertEqual(response.data["missing"], [999999])
+
+    def test_post_variant(self):
+        ids = [track.id for track in reversed(self.tracks)]
+        response = self.client.post(reverse("track-batch"), {"ids": ids}, format="json")
+        self.assertEqual([row["id"] for row in response.data["results"]], ids)
+
+    def test_expand_joins_related_objects(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("track-list"),
+                {"ids": self.tracks[0].id, "expand": "album.artist"},
+            )
+        self.assertEqual(
+            response.data["results"][0],
+            {
+                "id": self.tracks[0].id,
+                "title": "Track 0",
+                "album": {
+                    "id": self.album.id,
+                    "title": "Album 1",
+                    "artist": {"id": self.artist.id, "name": "Artist 1"},
+                },
+            },
+        )
+        response = self.client.post(
+            reverse("album-batch"),
+            {"ids": [self.album.id], "expand": ["artist"]},
+            format="json",
+        )
+        self.assertEqual(response.data["results"][0]["artist"]["name"], "Artist 1")
+
+    def test_invalid_input(self):
+        url = reverse("track-list")
+        for params in [
+            {"ids": "1,x"},
+            {"ids": ""},
+            {"ids": "1", "expand": "playlist"},
+            {"ids": ",".join(["1"] * (BATCH_MAX_IDS + 1))},
+        ]:
+            with self.subTest(params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExpandedPlaylistTests(APITestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Artist 1")
+        self.album = Album.objects.create(title="Album 1", artist=self.artist)
+        self.tracks = Track.objects.bulk_create(
+            [Track(title=f"Track {i}", album=self.album) for i in range(3)]
+        )
+        serializer = PlaylistSerializer(
+            data={
+                "name": "Mix",
+                "tracks": [
+                    {"track": self.tracks[2].id, "order": 1},
+                    {"track": self.tracks[0].id, "order": 2},
+                ],
+            }
+        )
+        serializer.is_valid(raise_exception=True)
+        self.playlist = serializer.save()
+        self.url = reverse("playlist-detail", args=[self.playlist.uuid])
+
+    def test_tracks_nested_in_order_with_one_joined_query(self):
+        # The playlist row, then every track with its album and artist.
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {"expand": "tracks"})
+        self.assertEqual(response.data["track_count"], 2)
+        self.assertEqual(
+            response.data["tracks"],
+            [
+                {
+                    "track": {
+                        "id": track.id,
+                        "title": track.title,
+                        "album": {
+                            "id": self.album.id,
+                            "title": "Album 1",
+                            "artist": {"id": self.artist.id, "name": "Artist 1"},
+                        },
+                    },
+                    "order": order,
+                }
+                for track, order in [(self.tracks[2], 1), (self.tracks[0], 2)]
+            ],
+        )
+
+    def test_catalogue_changes_invalidate_expanded_response(self):
+        self.client.get(self.url, {"expand": "tracks"})
+        self.artist.name = "Renamed"
+        self.artist.save()
+        response = self.client.get(self.url, {"expand": "tracks"})
+        self.assertEqual(
+            response.data["tracks"][0]["track"]["album"]["artist"]["name"], "Renamed"
+        )
+        response = self.client.get(
+            reverse("playlist_detail", args=[self.playlist.uuid])
+        )
+        self.assertContains(response, "Renamed")
+        self.assertContains(response, "Album 1")
+
+    def test_unknown_expansion(self):
+        response = self.client.get(self.url, {"expand": "album"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(PLAYLIST_READ_REPLICAS=["replica1", "replica2"])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    # Runs a request through the middleware and returns the read alias chosen
+    # before and after a write, and the response.
+    def route(self, request):
+        chosen = []
+
+        def view(request):
+            chosen.append(self.router.db_for_read(Track))
+            self.router.db_for_write(Track)
+            chosen.append(self.router.db_for_read(Track))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return chosen, response
+
+    def test_safe_requests_read_from_replicas_until_they_write(self):
+        chosen, response = self.route(self.factory.get("/api/tracks/"))
+        self.assertIn(chosen[0], ["replica1", "replica2"])
+        self.assertIsNone(chosen[1])
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_reads_after_a_write_stick_to_the_primary(self):
+        chosen, response = self.route(self.factory.post("/api/playlists/"))
+        self.assertEqual(chosen, [None, None])
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]["max-age"], 10)
+
+        request = self.factory.get("/api/playlists/")
+        request.COOKIES[PRIMARY_COOKIE] = "1"
+        chosen, _ = self.route(request)
+        self.assertEqual(chosen, [None, None])
+
+    def test_cache_is_filled_from_the_primary(self):
+        get_cache().clear()
+        chosen = []
+
+        def render():
+            chosen.append(self.router.db_for_read(Track))
+            return Response({})
+
+        def view(request):
+            chosen.append(self.router.db_for_read(Track))
+            cached_response(request, "routing-test", render)
+            with primary_reads():
+                chosen.append(self.router.db_for_read(Track))
+            chosen.append(self.router.db_for_read(Track))
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(self.factory.get("/api/playlists/"))
+        self.assertIn(chosen[0], ["replica1", "replica2"])
+        self.assertEqual(chosen[1:3], [None, None])
+        self.assertIn(chosen[3], ["replica1", "replica2"])
+
+    def test_primary_outside_requests(self):
+        self.assertIsNone(self.router.db_for_read(Track))
+        self.assertEqual(self.router.db_for_write(Track), "default")
+        self.assertFalse(self.router.allow_migrate("replica1", "playlist"))
+        self.assertIsNone(self.router.allow_migrate("default", "playlist"))
+
+
+class ScalableAdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "secret")
+        )
+        seed_catalogue(artists=3, albums_per=4, tracks_per=5)
+        self.playlist = Playlist.objects.create(name="Long")
+        append_tracks(self.playlist.uuid, Track.objects.values_list("pk", flat=True))
+
+    def test_changelists_do_not_grow_with_the_page(self):
+        for name in ["track", "album", "playlisttrack"]:
+            url = reverse(f"admin:playlist_{name}_changelist")
+            with CaptureQueriesContext(connection) as small:
+                self.client.get(url)
+            seed_catalogue(artists=1, albums_per=4, tracks_per=10, seed=1)
+            with self.subTest(name), CaptureQueriesContext(connection) as large:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(large), len(small))
+
+    def test_search_and_autocomplete_use_the_search_index(self):
+        track = Track.objects.order_by("pk").first()
+        response = self.client.get(
+            reverse("admin:playlist_track_changelist"), {"q": track.title}
+        )
+        self.assertContains(response, track.title)
+        response = self.client.get(
+            reverse("admin:autocomplete"),
+            {
+                "term": track.title,
+                "app_label": "playlist",
+                "model_name": "playlisttrack",
+                "field_name": "track",
+            },
+        )
+        self.assertEqual(response.json()["results"][0]["id"], str(track.pk))
+
+    def test_inline_is_paged(self):
+        url = reverse("admin:playlist_playlist_change", args=[self.playlist.uuid])
+        for page, size in [(1, PagedInlineFormSet.per_page), (2, 10)]:
+            response = self.client.get(url, {PagedInlineFormSet.page_param: page})
+            formset = response.context["inline_admin_formsets"][0].formset
+            self.assertEqual(len(formset.get_queryset()), size)
+            self.assertContains(response, f"Page {page} of 2")
+
+    def test_filtered_and_small_tables_are_counted_exactly(self):
+        for queryset in [Track.objects.all(), Track.objects.filter(pk__gt=0)]:
+            paginator = EstimatedCountPaginator(queryset.order_by("pk"), 10)
+            self.assertEqual(paginator.count, Track.objects.count())
+
+
+@override_settings(PLAYLIST_CHANGES_SETTLE_SECONDS=0)
+class ChangeFeedTests(APITestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="Artist 1")
+        self.album = Album.objects.create(title="Album 1", artist=self.artist)
+        self.tracks = [
+            Track.objects.create(title=f"Track {i}", album=self.album) for i in range(3)
+        ]
+
+    def feed(self, since=0, **params):
+        response = self.client.get(reverse("change_feed"), {"since": since, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def entries(self, data):
+        return [(c["kind"], c["id"], c["action"]) for c in data["changes"]]
+
+    def test_records_signal_and_bulk_writes(self):
+        start = self.feed()["next"]
+        serializer = PlaylistSerializer(
+            data={"name": "Mix", "tracks": [{"track": self.tracks[0].id, "order": 1}]}
+        )
+        serializer.is_valid(raise_exception=True)
+        playlist = serializer.save()
+        uuid = str(playlist.uuid)
+        row = playlist.playlisttrack_set.get()
+        append_tracks(uuid, [self.tracks[1].id])
+        deleted = self.tracks[2].pk
+        self.tracks[2].delete()
+
+        data = self.feed(start)
+        appended = playlist.playlisttrack_set.get(track=self.tracks[1]).pk
+        self.assertEqual(
+            self.entries(data),
+            [
+                ("playlisttrack", row.pk, "create"),
+                ("playlisttrack", appended, "create"),
+                # Created, then updated by the append; listed once.
+                ("playlist", uuid, "update"),
+                ("track", deleted, "delete"),
+            ],
+        )
+        self.assertFalse(data["more"])
+        self.assertEqual(self.feed(data["next"])["changes"], [])
+
+    def test_batches_and_kinds(self):
+        data = self.feed(limit=2)
+        self.assertEqual(
+            self.entries(data),
+            [("artist", self.artist.pk, "create"), ("album", self.album.pk, "create")],
+        )
+        self.assertTrue(data["more"])
+        data = self.feed(data["next"], limit=2, kinds="artist,album")
+        self.assertEqual(data["changes"], [])
+        self.assertFalse(data["more"])
+        # The tracks were skipped, not left for later.
+        self.assertEqual(data["next"], Change.objects.latest("pk").pk)
+
+        response = self.client.get(reverse("change_feed"), {"kinds": "user"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(PLAYLIST_CHANGES_SETTLE_SECONDS=60)
+    def test_recent_entries_wait_to_settle(self):
+        data = self.feed()
+        self.assertEqual(data["changes"], [])
+        self.assertEqual(data["next"], 0)
+
+    def test_compaction_keeps_latest_entry_per_object(self):
+        self.tracks[0].title = "Renamed"
+        self.tracks[0].save()
+        deleted = compact_changes(datetime.timedelta(0))
+        self.assertEqual(deleted, 1)
+        self.assertEqual(
+            self.entries(self.feed()),
+            [
+                ("artist", self.artist.pk, "create"),
+                ("album", self.album.pk, "create"),
+                ("track", self.tracks[1].pk, "create"),
+                ("track", self.tracks[2].pk, "create"),
+                ("track", self.tracks[0].pk, "update"),
+            ],
+        )
+
+
+@override_settings(PLAYLIST_CHANGES_SETTLE_SECONDS=0)
+class SimilarityTests(APITestCase):
+    def setUp(self):
+        seed_catalogue(
+            artists=2, albums_per=2, tracks_per=5, playlists=8, playlist_size=6, seed=3
+        )
+        build_similarity()
+
+    def stored(self, model, field, pk):
+        return list(
+            model.objects.filter(**{field: pk})
+            .order_by("-count", "similar_id")
+            .values_list("similar_id", "count")
+        )
+
+    def assertExact(self, tracks=None, playlists=None):
+        for pk in tracks or Track.objects.values_list("pk", flat=True):
+            self.assertEqual(
+                self.stored(SimilarTrack, "track_id", pk), recount_track(pk)
+            )
+        for pk in playlists or Playlist.objects.values_list("pk", flat=True):
+            self.assertEqual(
+                self.stored(SimilarPlaylist, "playlist_id", pk), recount_playlist(pk)
+            )
+
+    def test_build_matches_recount(self):
+        self.assertTrue(SimilarTrack.objects.exists())
+        self.assertExact()
+
+    def test_refresh_follows_playlist_edits(self):
+        first, second = Playlist.objects.order_by("pk")[:2]
+        tracks = list(Track.objects.order_by("pk").values_list("pk", flat=True))
+        serializer = PlaylistSerializer(
+            first,
+            data={
+                "name": first.name,
+                "tracks": [
+                    {"track": tracks[0], "order": 1},
+                    {"track": tracks[1], "order": 2},
+                ],
+            },
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        append_tracks(second.uuid, tracks[:3])
+        remove_track(second.uuid, second.playlisttrack_set.first().order)
+
+        refresh_similarity()
+        self.assertExact(playlists=[first.pk, second.pk])
+        self.assertFalse(StaleTrack.objects.exists())
+        self.assertEqual(refresh_similarity(), (0, 0))
+
+    def test_refresh_reaches_playlists_sharing_tracks(self):
+        Playlist.objects.all().delete()
+        t0, t1 = Track.objects.order_by("pk").values_list("pk", flat=True)[:2]
+        first = Playlist.objects.create(name="First")
+        append_tracks(first.uuid, [t0])
+        second = Playlist.objects.create(name="Second")
+        append_tracks(second.uuid, [t1])
+        build_similarity()
+
+        append_tracks(first.uuid, [t1])
+        refresh_similarity()
+        self.assertEqual(recount_playlist(second.pk), [(first.pk, 1)])
+        self.assertExact(playlists=[first.pk, second.pk])
+
+    @skipUnless(sparse, "scipy is not installed")
+    def test_sparse_build_matches_counters(self):
+        pairs = list(
+            PlaylistTrack.objects.order_by()
+            .values_list("playlist_id", "track_id")
+            .distinct()
+        )
+        self.assertEqual(sparse_neighbours(pairs), counted_neighbours(pairs))
+
+    def test_endpoints(self):
+        track = SimilarTrack.objects.order_by("pk").first().track_id
+        response = self.client.get(reverse("track-similar", args=[track]))
+        self.assertEqual(
+            [(row["id"], row["count"]) for row in response.data["results"]],
+            self.stored(SimilarTrack, "track_id", track)[:SIMILAR_LIMIT],
+        )
+        playlist = SimilarPlaylist.objects.order_by("pk").first().playlist_id
+        response = self.client.get(
+            reverse("playlist-similar", args=[playlist]), {"limit": 2}
+        )
+        self.assertEqual(
+            [(row["uuid"], row["count"]) for row in response.data["results"]],
+            self.stored(SimilarPlaylist, "playlist_id", playlist)[:2],
+        )
+        response = self.client.get(reverse("track-similar", args=[999999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SetOperationTests(APITestCase):
+    def setUp(self):
+        seed_catalogue(artists=1, albums_per=1, tracks_per=4)
+        self.tracks = list(Track.objects.order_by("pk").values_list("pk", flat=True))
+        t0, t1, t2, t3 = self.tracks
+        self.first = Playlist.objects.create(name="First")
+        append_tracks(self.first.uuid, [t0, t1, t2, t1])
+        self.second = Playlist.objects.create(name="Second")
+        append_tracks(self.second.uuid, [t2, t3, t0])
+
+    def rows(self, uuid):
+        return list(
+            PlaylistTrack.objects.filter(playlist_id=uuid).values_list(
+                "track_id", "order"
+            )
+        )
+
+    def test_clone_copies_rows_and_summary(self):
+        response = self.client.post(reverse("playlist-clone", args=[self.first.uuid]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["name"], "First (copy)")
+        self.assertEqual(response.data["track_count"], 4)
+        self.assertNotIn("tracks", response.data)
+        self.assertEqual(self.rows(response.data["uuid"]), self.rows(self.first.uuid))
+        created = PlaylistTrack.objects.filter(playlist_id=response.data["uuid"])
+        recorded = Change.objects.filter(kind="playlisttrack", action="create")
+        self.assertLessEqual(
+            {str(pk) for pk in created.values_list("pk", flat=True)},
+            set(recorded.values_list("object_id", flat=True)),
+        )
+
+    def test_set_operations(self):
+        t0, t1, t2, t3 = self.tracks
+        expected = {
+            "union": [t0, t1, t2, t3],
+            "intersection": [t0, t2],
+            "difference": [t1],
+        }
+        for operation, tracks in expected.items():
+            with self.subTest(operation):
+                response = self.client.post(
+                    reverse(f"playlist-{operation}", args=[self.first.uuid]),
+                    {"playlists": [str(self.second.uuid)]},
+                    format="json",
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                self.assertEqual(response.data["track_count"], len(tracks))
+                self.assertEqual(
+                    self.rows(response.data["uuid"]),
+                    [(pk, (i + 1) * ORDER_GAP) for i, pk in enumerate(tracks)],
+                )
+        self.assertTrue(Playlist.objects.filter(name="First + Second").exists())
+
+    def test_non_canonical_uuids(self):
+        for pk in (str(self.first.uuid).upper(), self.first.uuid.hex):
+            with self.subTest(pk):
+                response = self.client.post(
+                    reverse("playlist-union", args=[pk]),
+                    {"playlists": [self.second.uuid.hex.upper()]},
+                    format="json",
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                self.assertEqual(response.data["name"], "First + Second")
+
+    def test_invalid_input(self):
+        url = reverse("playlist-union", args=[self.first.uuid])
+        response = self.client.post(
+            url, {"playlists": [str(uuid.uuid4())]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {"playlists": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse("playlist-clone", args=[uuid.uuid4()]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_dedupe_keeps_first_occurrence(self):
+        t0, t1, t2, _ = self.tracks
+        response = self.client.post(reverse("playlist-dedupe", args=[self.first.uuid]))
+        self.assertEqual(response.data, {"deleted": 1})
+        self.assertEqual(
+            [track for track, _ in self.rows(self.first.uuid)], [t0, t1, t2]
+        )
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.track_count, 3)
+        response = self.client.post(reverse("playlist-dedupe", args=[self.first.uuid]))
+        self.assertEqual(response.data, {"deleted": 0})
+
+    def test_admin_merge(self):
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "secret")
+        )
+        self.client.post(
+            reverse("admin:playlist_playlist_changelist"),
+            {
+                "action": "merge_playlists",
+                "_selected_action": [self.second.uuid, self.first.uuid],
+            },
+        )
+        run_pending()
+        merged = Playlist.objects.get(name="First + Second")
+        self.assertEqual(merged.track_count, 4)
+
+
+class PlaylistRevisionTests(APITestCase):
+    def setUp(self):
+        seed_catalogue(artists=1, albums_per=2, tracks_per=10)
+        self.tracks = list(Track.objects.order_by("pk").values_list("pk", flat=True))
+        self.playlist = Playlist.objects.create(name="History")
+        append_tracks(self.playlist.uuid, self.tracks[:10])
+
+    def test_delta_stores_changed_runs(self):
+        old = list(range(1000))
+        new = old[:100] + [5000, 5001] + old[300:400] + old[100:300] + old[500:]
+        delta = encode_delta(old, new)
+        self.assertEqual(apply_delta(old, delta), new)
+        self.assertEqual(
+            delta,
+            [
+                ["c", 0, 100],
+                ["i", 5000, 5001],
+                ["c", 300, 100],
+                ["c", 100, 200],
+                ["c", 500, 500],
+            ],
+        )
+        runs = diff_tracks(old, new)
+        self.assertEqual(
+            [(run["action"], run.get("from"), run.get("to")) for run in runs],
+            [("insert", None, 100), ("move", 300, 102), ("remove", 400, None)],
+        )
+
+    def test_edits_record_rebuildable_revisions(self):
+        uuid = self.playlist.uuid
+        versions = [playlist_sequence(uuid)]
+        insert_track(uuid, self.tracks[12], ORDER_GAP)
+        versions.append(playlist_sequence(uuid))
+        moved = move_track(uuid, ORDER_GAP)
+        versions.append(playlist_sequence(uuid))
+        remove_track(uuid, moved.order)
+        versions.append(playlist_sequence(uuid))
+        append_tracks(uuid, self.tracks[15:])
+        versions.append(playlist_sequence(uuid))
+        for _ in range(REVISION_CHECKPOINT_INTERVAL):
+            append_tracks(uuid, self.tracks[:1])
+        versions.append(playlist_sequence(uuid))
+
+        revisions = PlaylistRevision.objects.filter(playlist=self.playlist)
+        self.assertEqual(revisions.count(), 5 + REVISION_CHECKPOINT_INTERVAL)
+        self.assertEqual(revisions.filter(base=F("number")).count(), 2)
+        for number, tracks in zip([1, 2, 3, 4, 5], versions):
+            self.assertEqual(revision_tracks(uuid, number), tracks)
+        self.assertEqual(revision_tracks(uuid, revisions.count()), versions[-1])
+
+    def test_row_edits_record_deltas_without_reading_the_playlist(self):
+        uuid = self.playlist.uuid
+        append_tracks(uuid, self.tracks * 5)
+        rng = random.Random(3)
+        versions = {}
+
+        def check(edit):
+            with mock.patch(
+                "playlist.revisions.playlist_sequence", wraps=playlist_sequence
+            ) as sequence:
+                edit()
+            self.assertFalse(sequence.called)
+            latest = self.playlist.revisions.order_by("-number").first()
+            versions[latest.number] = playlist_sequence(uuid)
+
+        for _ in range(40):
+            orders = list(
+                PlaylistTrack.objects.filter(playlist=self.playlist)
+                .order_by("order")
+                .values_list("order", flat=True)
+            )
+            kind = rng.choice(["insert", "move", "remove", "replace"])
+            if kind == "insert":
+                check(lambda: insert_track(uuid, rng.choice(self.tracks), orders[3]))
+            elif kind == "move":
+                a, b = rng.sample(orders, 2)
+                check(lambda: move_track(uuid, a, b))
+            elif kind == "remove":
+                check(lambda: remove_track(uuid, rng.choice(orders)))
+            else:
+                row = PlaylistTrack.objects.get(playlist=self.playlist, order=orders[5])
+                row.track_id = (
+                    self.tracks[19]
+                    if row.track_id != self.tracks[19]
+                    else self.tracks[18]
+                )
+                check(row.save)
+
+        # Deleting a track deletes its rows of the playlist in one query.
+        track = Track.objects.get(pk=self.tracks[0])
+        append_tracks(uuid, [track.pk, self.tracks[1], track.pk])
+        check(track.delete)
+        rows = PlaylistTrack.objects.filter(playlist=self.playlist).order_by("order")
+        deleted = list(rows.values_list("pk", flat=True))[2:40:15]
+        check(lambda: rows.filter(pk__in=deleted).delete())
+        for number, tracks in versions.items():
+            self.assertEqual(revision_tracks(uuid, number), tracks)
+
+    def test_endpoints(self):
+        uuid = self.playlist.uuid
+        remove_track(uuid, ORDER_GAP)
+        append_tracks(uuid, self.tracks[:1])
+
+        response = self.client.get(
+            reverse("playlist-revisions", args=[uuid]), {"limit": 2}
+        )
+        self.assertEqual([row["number"] for row in response.data["results"]], [3, 2])
+        self.assertEqual(response.data["next"], 2)
+        response = self.client.get(
+            reverse("playlist-revision-diff", args=[uuid]), {"from": 1}
+        )
+        self.assertEqual(
+            response.data["runs"],
+            [{"action": "move", "from": 0, "to": 9, "tracks": self.tracks[:1]}],
+        )
+        response = self.client.get(reverse("playlist-revision", args=[uuid, 2]))
+        self.assertEqual(response.data["tracks"], self.tracks[1:10])
+
+        response = self.client.post(
+            reverse("playlist-restore-revision", args=[uuid]),
+            {"number": 1},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["track_count"], 10)
+        self.assertEqual(playlist_sequence(uuid), self.tracks[:10])
+        self.assertEqual(revision_tracks(uuid, 4), self.tracks[:10])
+
+        response = self.client.post(
+            reverse("playlist-restore-revision", args=[uuid]),
+            {"number": 99},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("playlist-revision", args=[uuid, 99]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_admin_lists_and_restores(self):
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "secret")
+        )
+        remove_track(self.playlist.uuid, ORDER_GAP)
+        url = reverse("admin:playlist_playlistrevision_changelist")
+        self.assertEqual(self.client.get(url).status_code, 200)
+        first = PlaylistRevision.objects.get(playlist=self.playlist, number=1)
+        self.client.post(
+            url, {"action": "restore_revisions", "_selected_action": [first.pk]}
+        )
+        run_pending()
+        self.assertEqual(playlist_sequence(self.playlist.uuid), self.tracks[:10])
+
+
+# Plain saves outside a transaction, as in a shell or a script.
+class PlaylistRevisionAutocommitTests(TransactionTestCase):
+    def test_row_writes_in_autocommit_record_revisions(self):
+        seed_catalogue(artists=1, albums_per=1, tracks_per=3)
+        track1, track2, track3 = Track.objects.order_by("pk")
+        playlist = Playlist.objects.create(name="Autocommit")
+        row = PlaylistTrack.objects.create(playlist=playlist, track=track1, order=1)
+        PlaylistTrack.objects.create(playlist=playlist, track=track2, order=2)
+        row.track = track3
+        row.save()
+        row.delete()
+        self.assertEqual(
+            [
+                revision_tracks(playlist.pk, number)
+                for number in range(1, playlist.revisions.count() + 1)
+            ],
+            [
+                [track1.pk],
+                [track1.pk, track2.pk],
+                [track3.pk, track2.pk],
+                [track2.pk],
+            ],
+        )
+        playlist.refresh_from_db()
+        self.assertEqual(playlist.track_count, 1)
+
+
+class JobTests(APITestCase):
+    def setUp(self):
+        seed_catalogue(
+            artists=2, albums_per=2, tracks_per=5, playlists=4, playlist_size=8
+        )
+        self.artist = Artist.objects.order_by("pk").first()
+
+    def test_delete_artist_in_chunks(self):
+        track_ids = list(
+            Track.objects.filter(album__artist=self.artist).values_list("pk", flat=True)
+        )
+        rows = PlaylistTrack.objects.filter(track__in=track_ids).count()
+        job = enqueue("delete_catalogue_object", model="artist", pk=self.artist.pk)
+        call_command("run_workers", burst=True, threads=1, stdout=io.StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.progress, job.total)
+        self.assertEqual(job.total, rows + len(track_ids) + 2 + 1)
+        self.assertFalse(Artist.objects.filter(pk=self.artist.pk).exists())
+        self.assertFalse(PlaylistTrack.objects.filter(track__in=track_ids).exists())
+        self.assertEqual(list(summary_mismatches()), [])
+        self.assertTrue(
+            Change.objects.filter(
+                kind="artist", object_id=str(self.artist.pk), action="delete"
+            ).exists()
+        )
+
+    def test_delete_playlist_failing_half_way(self):
+        playlist = Playlist.objects.order_by("pk").first()
+
+        def latest_revision():
+            revision = PlaylistRevision.objects.filter(playlist=playlist).latest(
+                "number"
+            )
+            return revision_tracks(playlist.pk, revision.number), revision.track_count
+
+        job = enqueue("delete_playlist", uuid=str(playlist.pk))
+        with mock.patch("playlist.jobs.JOB_CHUNK_SIZE", 3), mock.patch(
+            "playlist.jobs.queue_stale_tracks",
+            side_effect=[None, RuntimeError("worker stopped")],
+        ):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), (Job.QUEUED, 3))
+        self.assertEqual(playlist.playlisttrack_set.count(), 5)
+        self.assertEqual(list(summary_mismatches()), [])
+        tracks = playlist_sequence(playlist.pk)
+        self.assertEqual(latest_revision(), (tracks, 5))
+
+        track = Track.objects.order_by("pk").first()
+        append_tracks(playlist.uuid, [track.pk])
+        self.assertEqual(latest_revision(), (tracks + [track.pk], 6))
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result, {"deleted": 3 + 6 + 1})
+        self.assertFalse(Playlist.objects.filter(pk=playlist.pk).exists())
+
+    def test_failed_jobs_are_retried_then_fail(self):
+        job = enqueue("import_catalogue", path="/nonexistent/catalogue.csv")
+        for attempt in range(1, JOB_MAX_ATTEMPTS + 1):
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.assertEqual(run_pending(), 1)
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("FileNotFoundError", job.error)
+        self.assertEqual(run_pending(), 0)
+
+    def test_status_endpoint(self):
+        job = enqueue("rebuild_playlist_summaries")
+        response = self.client.get(reverse("job-detail", args=[job.pk]))
+        self.assertEqual(response.data["status"], Job.QUEUED)
+        run_pending()
+        response = self.client.get(reverse("job-detail", args=[job.pk]))
+        self.assertEqual(response.data["status"], Job.DONE)
+        self.assertEqual(response.data["progress"], Playlist.objects.count())
+        response = self.client.get(reverse("job-list"), {"status": "done"})
+        self.assertEqual([row["id"] for row in response.data["results"]], [job.pk])
+        response = self.client.get(reverse("job-list"), {"status": "lost"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_admin_actions_queue_jobs(self):
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "secret")
+        )
+        playlist = Playlist.objects.order_by("pk").first()
+        for url, action, pk in [
+            (
+                "admin:playlist_artist_changelist",
+                "delete_in_background",
+                self.artist.pk,
+            ),
+            ("admin:playlist_playlist_changelist", "clone_playlists", playlist.pk),
+        ]:
+            self.client.post(reverse(url), {"action": action, "_selected_action": [pk]})
+        self.assertEqual(
+            list(Job.objects.order_by("pk").values_list("kind", flat=True)),
+            ["delete_catalogue_object", "clone_playlist"],
+        )
+        run_pending()
+        self.assertFalse(Artist.objects.filter(pk=self.artist.pk).exists())
+        self.assertTrue(
+            Playlist.objects.filter(name=f"{playlist.name} (copy)").exists()
+        )
@@ -1,11 +1,17 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
+from . import async_views
+from .metrics import metrics_view
 from .views import (
     AlbumViewSet,
     ArtistViewSet,
     TrackViewSet,
     PlaylistViewSet,
+    JobViewSet,
+    catalogue_export,
+    change_feed,
+    search_catalogue,
     playlist_list,
     playlist_create,
     playlist_detail,
@@ -18,10 +24,41 @@ router.register(r"artists", ArtistViewSet)
 router.register(r"albums", AlbumViewSet)
 router.register(r"tracks", TrackViewSet)
 router.register(r"playlists", PlaylistViewSet)
+router.register(r"jobs", JobViewSet)
 
 urlpatterns = [
+    path("metrics", metrics_view, name="metrics"),
+    path("api/export/", catalogue_export, name="catalogue_export"),
+    path("api/search/", search_catalogue, name="catalogue_search"),
+    path("api/changes/", change_feed, name="change_feed"),
     path("api/", include(router.urls)),
     path("api/", include(router.urls)),
+    # Async read endpoints, see playlist/async_views.py.
+    path(
+        "api/async/artists/<int:pk>/",
+        async_views.artist_detail,
+        name="async-artist-detail",
+    ),
+    path(
+        "api/async/albums/<int:pk>/",
+        async_views.album_detail,
+        name="async-album-detail",
+    ),
+    path(
+        "api/async/tracks/<int:pk>/",
+        async_views.track_detail,
+        name="async-track-detail",
+    ),
+    path(
+        "api/async/playlists/",
+        async_views.playlist_list,
+        name="async-playlist-list",
+    ),
+    path(
+        "api/async/playlists/<uuid:pk>/",
+        async_views.playlist_detail,
+        name="async-playlist-detail",
+    ),
     path("playlists/", playlist_list, name="playlist_list"),
     path("playlists/create/", playlist_create, name="playlist_create"),
     path("playlists/<uuid:uuid>/", playlist_detail, name="playlist_detail"),
@@ -1,39 +1,563 @@
+from functools import partial
+from uuid import UUID
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404 as get_object_or_404_api
+from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
-from .models import Artist, Album, Track, Playlist, PlaylistTrack
+from .cache import (
+    CATALOGUE_SCOPE,
+    LIST_SCOPE,
+    cached_response,
+    get_cache,
+    get_version,
+)
+from .changes import CHANGES_DEFAULT_LIMIT, CHANGES_MAX_LIMIT, KINDS, read_changes
+from .export import gzip_stream, iter_catalogue_ndjson
+from .jobs import enqueue
+from .models import (
+    Artist,
+    Album,
+    Job,
+    Track,
+    Playlist,
+    PlaylistRevision,
+    PlaylistTrack,
+)
+from .ordering import (
+    END,
+    OrderError,
+    append_tracks,
+    insert_track,
+    move_track,
+    remove_track,
+)
+from .pagination import NewestFirstCursorPagination, PlaylistTrackCursorPagination
+from .revisions import (
+    REVISIONS_DEFAULT_LIMIT,
+    REVISIONS_MAX_LIMIT,
+    RevisionError,
+    diff_tracks,
+    revision_tracks,
+)
+from .rows import expanded_playlist_tracks, row_serializer
+from .routers import primary_reads
+from .search import (
+    SEARCH_DEFAULT_LIMIT,
+    SEARCH_MAX_LIMIT,
+    autocomplete_tracks,
+    search,
+)
 from .serializers import (
     ArtistSerializer,
     AlbumSerializer,
+    BatchSerializer,
     TrackSerializer,
     PlaylistSerializer,
+    PlaylistTrackSerializer,
+    PlaylistTrackAppendSerializer,
+    PlaylistTrackInsertSerializer,
+    PlaylistTrackMoveSerializer,
+    PlaylistTrackRemoveSerializer,
+    PlaylistCloneSerializer,
+    PlaylistCombineSerializer,
+    PlaylistRestoreSerializer,
+    JobSerializer,
+    expanded_serializer,
+    requested_fields,
+)
+from .setops import (
+    clone_playlist,
+    combine_playlists,
+    dedupe_playlist,
+    restore_revision,
 )
+from .similarity import SIMILAR_LIMIT, similar_playlists, similar_tracks
 
 # ReadOnlyModelViewset allows users to retrieve (list and detail) data but does not allow
 # creating, updating, or deleting data through the API.
 
 
+# Each queryset declares the query plan its serializer needs, so the list endpoints
+# run a fixed number of queries however many rows they return. Foreign keys are
+# serialized as primary keys and read from the local *_id column, without a join.
+
+
+def integer_param(request, name, default):
+    try:
+        return int(request.query_params.get(name, default))
+    except ValueError:
+        raise ValidationError({name: ["A valid integer is required."]})
+
+
+def search_limit(request):
+    return max(
+        1, min(integer_param(request, "limit", SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT)
+    )
+
+
+def similar_limit(request):
+    return max(1, min(integer_param(request, "limit", SIMILAR_LIMIT), SIMILAR_LIMIT))
+
+
+# List pages are built from .values() rows instead of model instances, see
+# playlist/rows.py.
+class RowListMixin:
+    def list(self, request, *args, **kwargs):
+        rows = row_serializer(self.serializer_class)
+        fields = requested_fields(request)
+        queryset = rows.values(self.filter_queryset(self.get_queryset()), fields)
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(rows.represent(list(queryset), fields))
+        return self.get_paginated_response(rows.represent(page, fields))
+
+
+# ?ids=3,1,2 on a list endpoint, or POST {"ids": [3, 1, 2]} to its batch/ action
+# for long lists, returns those objects in the order asked for with one query,
+# and the ids that do not exist under "missing". ?expand=album,album.artist (or
+# "expand" in the POST body) nests the related objects instead of their ids,
+# joined into the same query.
+class BatchMixin:
+    # Expandable foreign key paths and the serializer of each.
+    expandable = {}
+
+    def list(self, request, *args, **kwargs):
+        if "ids" not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return self.batch_response(request.query_params)
+
+    @action(detail=False, methods=["get", "post"])
+    def batch(self, request):
+        data = request.data if request.method == "POST" else request.query_params
+        return self.batch_response(data)
+
+    def batch_response(self, data):
+        serializer = BatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data["ids"]))
+        expand = set(serializer.validated_data.get("expand", []))
+        unknown = sorted(expand - self.expandable.keys())
+        if unknown:
+            raise ValidationError({"expand": [f"Cannot expand {unknown[0]!r}."]})
+        for path in list(expand):
+            while "." in path:
+                path = path.rsplit(".", 1)[0]
+                expand.add(path)
+
+        queryset = self.get_queryset().filter(pk__in=ids)
+        serializer_class = self.serializer_class
+        if expand:
+            queryset = queryset.defer(None).select_related(
+                *(path.replace(".", "__") for path in expand)
+            )
+            serializer_class = expanded_serializer(
+                serializer_class,
+                frozenset(expand),
+                tuple(sorted(self.expandable.items())),
+            )
+        objects = {obj.pk: obj for obj in queryset}
+        found = [objects[pk] for pk in ids if pk in objects]
+        context = self.get_serializer_context()
+        return Response(
+            {
+                "results": serializer_class(found, many=True, context=context).data,
+                "missing": [pk for pk in ids if pk not in objects],
+            }
+        )
+
+
+# ?q= on a list endpoint returns the best matches, best first, instead of a page.
+class SearchMixin:
+    search_kind = None
+
+    def list(self, request, *args, **kwargs):
+        if "q" not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        objects = search(
+            self.search_kind,
+            request.query_params["q"],
+            search_limit(request),
+            self.get_queryset(),
+        )
+        return Response({"results": self.get_serializer(objects, many=True).data})
+
+
 # Readonly APIs
 # Manage create, update, and delete through django-admin
-class ArtistViewSet(ReadOnlyModelViewSet):
-    queryset = Artist.objects.all()
+class ArtistViewSet(SearchMixin, BatchMixin, RowListMixin, ReadOnlyModelViewSet):
+    queryset = Artist.objects.only("id", "name")
     serializer_class = ArtistSerializer
+    search_kind = "artist"
 
 
-class AlbumViewSet(ReadOnlyModelViewSet):
-    queryset = Album.objects.all()
+class AlbumViewSet(SearchMixin, BatchMixin, RowListMixin, ReadOnlyModelViewSet):
+    queryset = Album.objects.only("id", "title", "artist_id")
     serializer_class = AlbumSerializer
+    search_kind = "album"
+    expandable = {"artist": ArtistSerializer}
 
 
-class TrackViewSet(ReadOnlyModelViewSet):
-    queryset = Track.objects.all()
+class TrackViewSet(SearchMixin, BatchMixin, RowListMixin, ReadOnlyModelViewSet):
+    queryset = Track.objects.only("id", "title", "album_id")
     serializer_class = TrackSerializer
+    search_kind = "track"
+    expandable = {"album": AlbumSerializer, "album.artist": ArtistSerializer}
 
+    # /api/tracks/autocomplete/?q=&limit=&offset= backs the track picker of the
+    # add track page. Results are cached until the catalogue changes.
+    @action(detail=False)
+    def autocomplete(self, request):
+        return cached_response(request, CATALOGUE_SCOPE, self.autocomplete_page)
 
-class PlaylistViewSet(ReadOnlyModelViewSet):
-    queryset = Playlist.objects.all()
+    def autocomplete_page(self):
+        limit = search_limit(self.request)
+        offset = max(0, integer_param(self.request, "offset", 0))
+        results = autocomplete_tracks(
+            self.request.query_params.get("q", ""), limit, offset
+        )
+        next_offset = offset + limit if len(results) == limit else None
+        return Response({"results": results, "next_offset": next_offset})
+
+    # Tracks often playlisted with this one: /api/tracks/<id>/similar/?limit=
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        track = get_object_or_404_api(Track.objects.only("pk"), pk=pk)
+        return Response({"results": similar_tracks(track.pk, similar_limit(request))})
+
+
+# Playlist summary fields for list pages, stored on the playlist itself.
+PLAYLIST_SUMMARY_FIELDS = ("track_count", "artist_count", "last_modified")
+
+
+# The nested tracks of every playlist on a page are loaded with one extra query.
+class PlaylistViewSet(RowListMixin, ReadOnlyModelViewSet):
+    queryset = Playlist.objects.only(
+        "uuid", "name", *PLAYLIST_SUMMARY_FIELDS
+    ).prefetch_related(
+        Prefetch(
+            "playlisttrack_set",
+            queryset=PlaylistTrack.objects.only("playlist_id", "track_id", "order"),
+        )
+    )
     serializer_class = PlaylistSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = requested_fields(self.request)
+        if fields is not None and "tracks" not in fields:
+            queryset = queryset.prefetch_related(None)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        view = partial(super().list, request, *args, **kwargs)
+        return cached_response(request, LIST_SCOPE, view)
+
+    # ?expand=tracks nests each track with its album and artist, read with one
+    # joined query.
+    def retrieve(self, request, *args, **kwargs):
+        expand = {
+            name.strip()
+            for name in request.query_params.get("expand", "").split(",")
+            if name.strip()
+        }
+        unknown = sorted(expand - {"tracks"})
+        if unknown:
+            raise ValidationError({"expand": [f"Cannot expand {unknown[0]!r}."]})
+        if expand:
+            view = partial(self.retrieve_expanded, request, *args, **kwargs)
+            # Album and artist names come from the catalogue.
+            depends = (CATALOGUE_SCOPE,)
+        else:
+            view = partial(super().retrieve, request, *args, **kwargs)
+            depends = ()
+        try:
+            scope = str(UUID(kwargs["pk"]))
+        except ValueError:
+            return view()
+        return cached_response(request, scope, view, depends)
+
+    def retrieve_expanded(self, request, *args, **kwargs):
+        playlist = get_object_or_404_api(
+            Playlist.objects.only("uuid", "name", *PLAYLIST_SUMMARY_FIELDS),
+            pk=kwargs["pk"],
+        )
+        serializer = self.get_serializer(playlist)
+        expand = serializer.fields.pop("tracks", None) is not None
+        data = serializer.data
+        if expand:
+            data["tracks"] = expanded_playlist_tracks(playlist.pk)
+        return Response(data)
+
+    # Large playlists can page through their tracks instead of loading the whole
+    # nested list: /api/playlists/<uuid>/tracks/
+    @action(detail=True)
+    def tracks(self, request, pk=None):
+        playlist = get_object_or_404_api(Playlist.objects.only("uuid"), pk=pk)
+        queryset = PlaylistTrack.objects.filter(playlist=playlist).only(
+            "id", "track_id", "order"
+        )
+        paginator = PlaylistTrackCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = PlaylistTrackSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    # Playlists sharing the most tracks with this one:
+    # /api/playlists/<uuid>/similar/?limit=
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        playlist = get_object_or_404_api(Playlist.objects.only("uuid"), pk=pk)
+        return Response(
+            {"results": similar_playlists(playlist.pk, similar_limit(request))}
+        )
+
+    # Appends many tracks in one statement: {"tracks": [<track id>, ...]}
+    @action(detail=True, methods=["post"], url_path="tracks/append")
+    def append_tracks(self, request, pk=None):
+        data = self.validated_input(PlaylistTrackAppendSerializer, pk)
+        rows = self.edit(append_tracks, pk, data["tracks"])
+        return Response(
+            PlaylistTrackSerializer(rows, many=True).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    # Track edits write a single PlaylistTrack row, see playlist/ordering.py.
+    @action(detail=True, methods=["post"], url_path="tracks/insert")
+    def insert_track(self, request, pk=None):
+        data = self.validated_input(PlaylistTrackInsertSerializer, pk)
+        row = self.edit(insert_track, pk, data["track"].pk, data.get("after", END))
+        return Response(
+            PlaylistTrackSerializer(row).data, status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=True, methods=["post"], url_path="tracks/move")
+    def move_track(self, request, pk=None):
+        data = self.validated_input(PlaylistTrackMoveSerializer, pk)
+        row = self.edit(move_track, pk, data["order"], data.get("after", END))
+        return Response(PlaylistTrackSerializer(row).data)
+
+    @action(detail=True, methods=["post"], url_path="tracks/remove")
+    def remove_track(self, request, pk=None):
+        data = self.validated_input(PlaylistTrackRemoveSerializer, pk)
+        self.edit(remove_track, pk, data["order"])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    # Copies and combinations are written by the database, see playlist/setops.py.
+    # They answer with the new playlist, without its tracks.
+    @action(detail=True, methods=["post"])
+    def clone(self, request, pk=None):
+        data = self.validated_input(PlaylistCloneSerializer, pk)
+        return self.summary(clone_playlist(pk, data.get("name")))
+
+    # {"playlists": [<uuid>, ...], "name": ...} with this playlist first.
+    @action(detail=True, methods=["post"])
+    def union(self, request, pk=None):
+        return self.combine("union", pk)
+
+    @action(detail=True, methods=["post"])
+    def intersection(self, request, pk=None):
+        return self.combine("intersection", pk)
+
+    @action(detail=True, methods=["post"])
+    def difference(self, request, pk=None):
+        return self.combine("difference", pk)
+
+    # Removes the repeats of tracks listed more than once, keeping the first.
+    @action(detail=True, methods=["post"])
+    def dedupe(self, request, pk=None):
+        get_object_or_404_api(Playlist.objects.only("uuid"), pk=pk)
+        deleted = self.edit(dedupe_playlist, pk)
+        return Response({"deleted": deleted})
+
+    def combine(self, operation, pk):
+        data = self.validated_input(PlaylistCombineSerializer, pk)
+        playlist = combine_playlists(operation, pk, data["playlists"], data.get("name"))
+        return self.summary(playlist)
+
+    def summary(self, playlist, code=status.HTTP_201_CREATED):
+        serializer = self.get_serializer(playlist)
+        serializer.fields.pop("tracks", None)
+        return Response(serializer.data, status=code)
+
+    # Past versions of the playlist, newest first, see playlist/revisions.py:
+    # /api/playlists/<uuid>/revisions/?before=<number>&limit=
+    @action(detail=True)
+    def revisions(self, request, pk=None):
+        playlist = get_object_or_404_api(Playlist.objects.only("uuid"), pk=pk)
+        limit = max(
+            1,
+            min(
+                integer_param(request, "limit", REVISIONS_DEFAULT_LIMIT),
+                REVISIONS_MAX_LIMIT,
+            ),
+        )
+        revisions = PlaylistRevision.objects.filter(playlist=playlist)
+        if "before" in request.query_params:
+            revisions = revisions.filter(number__lt=integer_param(request, "before", 0))
+        rows = list(
+            revisions.order_by("-number").values_list(
+                "number", "base", "track_count", "created"
+            )[: limit + 1]
+        )
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return Response(
+            {
+                "results": [
+                    {
+                        "number": number,
+                        "checkpoint": base == number,
+                        "track_count": track_count,
+                        "created": created,
+                    }
+                    for number, base, track_count, created in rows
+                ],
+                "next": rows[-1][0] if more else None,
+            }
+        )
+
+    @action(detail=True, url_path=r"revisions/(?P<number>[0-9]+)")
+    def revision(self, request, pk=None, number=None):
+        playlist = get_object_or_404_api(Playlist.objects.only("uuid"), pk=pk)
+        revision = get_object_or_404_api(
+            PlaylistRevision.objects.defer("data"), playlist=playlist, number=number
+        )
+        return Response(
+            {
+                "number": revision.number,
+                "created": revision.created,
+                "tracks": revision_tracks(playlist.pk, revision.number),
+            }
+        )
+
+    # Runs removed, inserted and moved between two revisions, by default the
+    # given one and the latest: /api/playlists/<uuid>/revisions/diff/?from=&to=
+    @action(detail=True, url_path="revisions/diff")
+    def revision_diff(self, request, pk=None):
+        playlist = get_object_or_404_api(Playlist.objects.only("uuid"), pk=pk)
+        latest = (
+            PlaylistRevision.objects.filter(playlist=playlist)
+            .order_by("-number")
+            .values_list("number", flat=True)
+            .first()
+        )
+        if "from" not in request.query_params:
+            raise ValidationError({"from": ["This field is required."]})
+        old = integer_param(request, "from", 0)
+        new = integer_param(request, "to", latest or 0)
+        try:
+            runs = diff_tracks(
+                revision_tracks(playlist.pk, old), revision_tracks(playlist.pk, new)
+            )
+        except RevisionError as e:
+            raise ValidationError(str(e))
+        return Response({"from": old, "to": new, "runs": runs})
+
+    # {"number": <revision>} writes that version back as a new revision.
+    @action(detail=True, methods=["post"], url_path="revisions/restore")
+    def restore_revision(self, request, pk=None):
+        data = self.validated_input(PlaylistRestoreSerializer, pk)
+        playlist = self.edit(restore_revision, pk, data["number"])
+        return self.summary(playlist, status.HTTP_200_OK)
+
+    def validated_input(self, serializer_class, pk):
+        get_object_or_404_api(Playlist.objects.only("uuid"), pk=pk)
+        serializer = serializer_class(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def edit(self, operation, *args):
+        try:
+            return operation(*args)
+        except (OrderError, RevisionError) as e:
+            raise ValidationError(str(e))
+
+
+# Background jobs, newest first: /api/jobs/?status=queued|running|done|failed
+# and /api/jobs/<id>/ for the status and progress of one.
+class JobViewSet(ReadOnlyModelViewSet):
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    pagination_class = NewestFirstCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        job_status = self.request.query_params.get("status")
+        if job_status is not None:
+            if job_status not in dict(Job.STATUS_CHOICES):
+                raise ValidationError({"status": [f"Unknown status {job_status!r}."]})
+            queryset = queryset.filter(status=job_status)
+        return queryset
+
+
+# /api/search/?q= returns the best matching artists, albums and tracks.
+@api_view(["GET"])
+def search_catalogue(request):
+    query = request.query_params.get("q", "")
+    limit = search_limit(request)
+    context = {"request": request}
+    return Response(
+        {
+            "artists": ArtistSerializer(
+                search("artist", query, limit), many=True, context=context
+            ).data,
+            "albums": AlbumSerializer(
+                search("album", query, limit), many=True, context=context
+            ).data,
+            "tracks": TrackSerializer(
+                search("track", query, limit), many=True, context=context
+            ).data,
+        }
+    )
+
+
+# /api/changes/?since=<cursor> returns what changed after the cursor, oldest
+# first. Consumers store "next" and send it back as since; "more" means another
+# batch is ready. ?kinds=track,album limits the feed to some models. Creates and
+# updates both mean "fetch the current version"; deletes carry only the id.
+@api_view(["GET"])
+def change_feed(request):
+    since = max(0, integer_param(request, "since", 0))
+    limit = max(
+        1,
+        min(integer_param(request, "limit", CHANGES_DEFAULT_LIMIT), CHANGES_MAX_LIMIT),
+    )
+    kinds = None
+    if "kinds" in request.query_params:
+        kinds = {
+            kind.strip()
+            for kind in request.query_params["kinds"].split(",")
+            if kind.strip()
+        }
+        unknown = sorted(kinds - set(KINDS))
+        if unknown:
+            raise ValidationError({"kinds": [f"Unknown kind {unknown[0]!r}."]})
+    changes, next_cursor, more = read_changes(since, limit, kinds)
+    return Response({"changes": changes, "next": next_cursor, "more": more})
+
+
+# Streams the whole catalogue as NDJSON, gzipped when the client accepts it.
+@require_GET
+def catalogue_export(request):
+    chunks = iter_catalogue_ndjson()
+    compress = "gzip" in request.headers.get("Accept-Encoding", "")
+    if compress:
+        chunks = gzip_stream(chunks)
+    response = StreamingHttpResponse(chunks, content_type="application/x-ndjson")
+    response["Content-Disposition"] = 'attachment; filename="catalogue.ndjson"'
+    response["Vary"] = "Accept-Encoding"
+    if compress:
+        response["Content-Encoding"] = "gzip"
+    return response
+
 
 # Views for REST API
 # class ArtistViewSet(viewsets.ModelViewSet):
@@ -58,17 +582,39 @@ class PlaylistViewSet(ReadOnlyModelViewSet):
 
 # Template Views
 def playlist_list(request):
-    playlists = Playlist.objects.all()
+    playlists = Playlist.objects.only("uuid", "name", *PLAYLIST_SUMMARY_FIELDS)
     return render(request, "playlist_list.html", {"playlists": playlists})
 
 
 def playlist_detail(request, uuid):
-    playlist = get_object_or_404(Playlist, uuid=uuid)
     if request.method == "POST":
+        playlist = get_object_or_404(Playlist.objects.only("uuid"), uuid=uuid)
         if "delete" in request.POST:
-            playlist.delete()
+            # Large playlists are deleted in chunks by a background job.
+            enqueue("delete_playlist", uuid=str(playlist.uuid))
             return redirect("playlist_list")
-    return render(request, "playlist_detail.html", {"playlist": playlist})
+    return render(request, "playlist_detail.html", playlist_detail_context(uuid))
+
+
+# The template only needs plain values, which are cached under the playlist's
+# version like the API payloads, and the catalogue's for the album and artist
+# names. Like them, they are read from the primary.
+def playlist_detail_context(uuid):
+    cache = get_cache()
+    version = max(get_version(uuid), get_version(CATALOGUE_SCOPE))
+    key = f"playlist:{uuid}:{version}:detail"
+    context = cache.get(key)
+    if context is None:
+        with primary_reads():
+            playlist = get_object_or_404(
+                Playlist.objects.only("uuid", "name"), uuid=uuid
+            )
+            context = {
+                "playlist": {"uuid": playlist.uuid, "name": playlist.name},
+                "tracks": expanded_playlist_tracks(playlist.pk),
+            }
+        cache.set(key, context, settings.PLAYLIST_CACHE_TIMEOUT)
+    return context
 
 
 def playlist_create(request):
@@ -88,15 +634,19 @@ def playlist_update(request, uuid):
     return render(request, "playlist_form.html", {"playlist": playlist})
 
 
+# Tracks are picked with the autocomplete endpoint; every picked track is
+# appended to the playlist in one statement.
 def playlist_add_track(request, uuid):
-    playlist = get_object_or_404(Playlist, uuid=uuid)
+    playlist = get_object_or_404(Playlist.objects.only("uuid", "name"), uuid=uuid)
     if request.method == "POST":
-        track_id = request.POST["track"]
-        order = request.POST["order"]
-        track = get_object_or_404(Track, id=track_id)
-        PlaylistTrack.objects.create(playlist=playlist, track=track, order=order)
+        try:
+            track_ids = [int(pk) for pk in request.POST.getlist("track")]
+        except ValueError:
+            raise Http404("No Track matches the given query.")
+        if not track_ids or Track.objects.filter(pk__in=track_ids).count() != len(
+            set(track_ids)
+        ):
+            raise Http404("No Track matches the given query.")
+        append_tracks(playlist.uuid, track_ids)
         return redirect("playlist_detail", uuid=playlist.uuid)
-    tracks = Track.objects.all()
-    return render(
-        request, "playlist_add_track.html", {"playlist": playlist, "tracks": tracks}
-    )
+    return render(request, "playlist_add_track.html", {"playlist": playlist})